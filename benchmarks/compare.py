@@ -0,0 +1,63 @@
+"""
+Compares the throughput of two result files of the same benchmark, e.g. of two versions.
+
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import json
+import argparse
+
+# Fields which are measurements, all the other fields of a result identify the benchmark case
+MEASUREMENTS = {
+    "bytes", "min_seconds", "median_seconds", "seconds", "rows_per_second", "bytes_per_second", "bottleneck",
+    "copy_time_p50", "pool_wait_time_p50", "skipped"
+}
+
+
+def get_case(result: dict):
+    return tuple(sorted((key, value) for key, value in result.items() if key not in MEASUREMENTS))
+
+
+def compare(baseline: dict, candidate: dict):
+    """
+    :return: One entry per benchmark case measured in both files, with the relative throughput of the candidate
+    """
+    if baseline["benchmark"] != candidate["benchmark"]:
+        raise Exception("Results of different benchmarks can't be compared!")
+
+    baseline_results = {get_case(result): result for result in baseline["results"] if "rows_per_second" in result}
+    comparison = []
+    for result in candidate["results"]:
+        case = get_case(result)
+        if "rows_per_second" not in result or case not in baseline_results:
+            continue
+        baseline_throughput = baseline_results[case]["rows_per_second"]
+        comparison.append({
+            "case": dict(case),
+            "baseline_rows_per_second": baseline_throughput,
+            "candidate_rows_per_second": result["rows_per_second"],
+            "ratio": result["rows_per_second"] / baseline_throughput,
+        })
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparison of two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.9, help="Ratio below which a case is a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as baseline_file, open(args.candidate) as candidate_file:
+        comparison = compare(json.load(baseline_file), json.load(candidate_file))
+
+    regressions = 0
+    for entry in comparison:
+        regression = entry["ratio"] < args.threshold
+        regressions += regression
+        case = " ".join(f"{key}={value}" for key, value in entry["case"].items())
+        print(f"{'REGRESSION' if regression else 'ok':>10} {entry['ratio']:>6.2f}x {case}")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Times the encoding of DataFrames into COPY payloads, without any database.
+
+    python -m benchmarks.encode_benchmark --rows 100000 --repeat 5 --output encode.json
+"""
+import sys
+import time
+import argparse
+import statistics
+from src.pg_bulk_loader.batch.copy_encoder import CsvCopyEncoder, BinaryCopyEncoder
+from src.pg_bulk_loader.utils.constants import DEFAULT_COPY_CHUNK_SIZE, COPY_FORMAT_CSV, COPY_FORMAT_BINARY
+from .frames import FRAME_TYPES, create_frame, get_binary_frame
+from .results import write_results
+
+
+def get_encoder(copy_format: str, pg_types: list):
+    if copy_format == COPY_FORMAT_CSV:
+        return CsvCopyEncoder()
+    return BinaryCopyEncoder(pg_types)
+
+
+def time_encoding(encoder, data_df, chunk_size: int):
+    start_time = time.perf_counter()
+    size_in_bytes = sum(len(chunk) for chunk in encoder.iter_chunks(data_df, chunk_size))
+    return time.perf_counter() - start_time, size_in_bytes
+
+
+def run_benchmark(frames: list, rows: int, repeat: int, chunk_size: int):
+    results = []
+    for frame in frames:
+        frame_df = create_frame(frame, rows)
+        for copy_format in (COPY_FORMAT_CSV, COPY_FORMAT_BINARY):
+            data_df = frame_df
+            pg_types = [FRAME_TYPES[frame][col_name] for col_name in data_df.columns]
+            if copy_format == COPY_FORMAT_BINARY:
+                # Without the columns the binary format can't encode, the columns field tells the variant apart
+                data_df, pg_types = get_binary_frame(frame, frame_df)
+            result = {"frame": frame, "copy_format": copy_format, "rows": rows, "columns": data_df.shape[1]}
+            if data_df.shape[1] == 0:
+                results.append({**result, "skipped": "columns can't be encoded in binary"})
+                continue
+            encoder = get_encoder(copy_format, pg_types)
+
+            # The first run warms up the caches and is not measured
+            time_encoding(encoder, data_df, chunk_size)
+            timings = []
+            for _ in range(repeat):
+                seconds, size_in_bytes = time_encoding(encoder, data_df, chunk_size)
+                timings.append(seconds)
+            median = statistics.median(timings)
+            results.append({
+                **result,
+                "bytes": size_in_bytes,
+                "min_seconds": min(timings),
+                "median_seconds": median,
+                "rows_per_second": rows / median,
+                "bytes_per_second": size_in_bytes / median,
+            })
+            # Progress on stderr, so that stdout only carries the JSON results
+            print(
+                f"{frame:>15} {copy_format:>6} {data_df.shape[1]:>3} columns: {rows / median:>12,.0f} rows/s "
+                f"{size_in_bytes / median / 2 ** 20:>8.1f} MiB/s", file=sys.stderr
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the COPY encoders")
+    parser.add_argument("--frames", nargs="+", default=list(FRAME_TYPES), choices=list(FRAME_TYPES))
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_COPY_CHUNK_SIZE)
+    parser.add_argument("--output", help="JSON file of the results, printed to stdout by default")
+    parser.add_argument("--label", help="Label of the run, e.g. the version under test")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.frames, args.rows, args.repeat, args.chunk_size)
+    write_results("encode", results, args.output, args.label)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from src.pg_bulk_loader.batch.copy_encoder import BinaryCopyEncoder
+
+# Column name -> postgres type of the table the frames are loaded into by the load benchmark
+FRAME_TYPES = {
+    "narrow": {"id": "int8", "value": "float8"},
+    "wide": {
+        **{f"int_{i}": "int8" for i in range(10)},
+        **{f"float_{i}": "float8" for i in range(20)},
+        **{f"flag_{i}": "bool" for i in range(5)},
+        **{f"text_{i}": "varchar" for i in range(5)},
+    },
+    "text_heavy": {"id": "int8", **{f"text_{i}": "varchar" for i in range(6)}},
+    "nullable": {"id": "int8", "count": "int8", "amount": "float8", "label": "varchar", "flag": "bool"},
+    "datetime_heavy": {
+        "id": "int8",
+        **{f"day_{i}": "date" for i in range(2)},
+        **{f"ts_{i}": "timestamp" for i in range(4)},
+        **{f"tstz_{i}": "timestamptz" for i in range(2)},
+    },
+}
+
+
+def _text(rng: np.random.Generator, rows: int, min_length: int, max_length: int):
+    alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz ,\"0123456789"))
+    lengths = rng.integers(min_length, max_length + 1, rows)
+    characters = alphabet[rng.integers(0, len(alphabet), lengths.sum())]
+    return ["".join(value) for value in np.split(characters, np.cumsum(lengths)[:-1])]
+
+
+def _timestamps(rng: np.random.Generator, rows: int):
+    seconds = rng.integers(946684800, 1893456000, rows)
+    return pd.to_datetime(seconds, unit="s")
+
+
+def create_frame(name: str, rows: int, seed: int = 42):
+    """
+    Creates one of the benchmark frames (see FRAME_TYPES) with random but reproducible content.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(rows, dtype=np.int64)
+    if name == "narrow":
+        return pd.DataFrame({"id": ids, "value": rng.random(rows)})
+
+    if name == "wide":
+        data = {f"int_{i}": rng.integers(-10 ** 9, 10 ** 9, rows) for i in range(10)}
+        data.update({f"float_{i}": rng.normal(size=rows) for i in range(20)})
+        data.update({f"flag_{i}": rng.random(rows) > 0.5 for i in range(5)})
+        data.update({f"text_{i}": _text(rng, rows, 5, 15) for i in range(5)})
+        return pd.DataFrame(data)
+
+    if name == "text_heavy":
+        data = {"id": ids}
+        data.update({f"text_{i}": _text(rng, rows, 20, 200) for i in range(6)})
+        return pd.DataFrame(data)
+
+    if name == "nullable":
+        nulls = rng.random((4, rows)) < 0.3
+        return pd.DataFrame({
+            "id": ids,
+            "count": pd.array(np.where(nulls[0], None, rng.integers(0, 1000, rows)), dtype="Int64"),
+            "amount": np.where(nulls[1], np.nan, rng.random(rows) * 1000),
+            "label": pd.Series(_text(rng, rows, 5, 30)).mask(nulls[2]),
+            "flag": pd.array(np.where(nulls[3], None, rng.random(rows) > 0.5), dtype="boolean"),
+        })
+
+    if name == "datetime_heavy":
+        data = {"id": ids}
+        data.update({f"day_{i}": _timestamps(rng, rows).normalize() for i in range(2)})
+        data.update({f"ts_{i}": _timestamps(rng, rows) for i in range(4)})
+        data.update({f"tstz_{i}": _timestamps(rng, rows).tz_localize("UTC") for i in range(2)})
+        return pd.DataFrame(data)
+
+    raise Exception(f"Invalid frame! Supported frames are {tuple(FRAME_TYPES)}")
+
+
+def get_binary_frame(name: str, data_df: pd.DataFrame):
+    """
+    :return: The frame without the columns the binary encoder can't encode (e.g. the text ones), and the postgres
+    types of the remaining columns. The binary runs use it, so that they measure the binary encoding of the other
+    columns instead of being skipped or falling back to csv.
+    """
+    pg_types = [FRAME_TYPES[name][col_name] for col_name in data_df.columns]
+    unsupported_columns = set(BinaryCopyEncoder.unsupported_columns(data_df, pg_types))
+    columns = [col_name for col_name in data_df.columns if col_name not in unsupported_columns]
+    return data_df[columns], [FRAME_TYPES[name][col_name] for col_name in columns]
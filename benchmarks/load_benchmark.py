@@ -0,0 +1,148 @@
+"""
+Measures the end-to-end COPY throughput against a throwaway local PostgreSQL server (started with
+testing.postgresql, so initdb and postgres have to be on the PATH) across batch sizes, pool sizes and process counts.
+
+    python -m benchmarks.load_benchmark --rows 200000 --batch-sizes 10000 50000 --pool-sizes 2 5 --processes 1 2
+"""
+import sys
+import time
+import asyncio
+import argparse
+import itertools
+import testing.postgresql
+from src.pg_bulk_loader.batch.batch_insert_wrapper import (
+    batch_insert_to_postgres, batch_insert_to_postgres_with_multi_process
+)
+from src.pg_bulk_loader.batch.pg_connection_detail import PgConnectionDetail
+from src.pg_bulk_loader.utils.constants import COPY_FORMATS, COPY_FORMAT_CSV, COPY_FORMAT_BINARY
+from .frames import FRAME_TYPES, create_frame, get_binary_frame
+from .results import write_results
+
+
+def create_table(pg_conn_details: PgConnectionDetail, table_name: str, column_types: dict):
+    columns = ", ".join(f"{col_name} {pg_type}" for col_name, pg_type in column_types.items())
+    run_query(pg_conn_details, f"DROP TABLE IF EXISTS {table_name}; CREATE TABLE {table_name} ({columns})")
+
+
+def run_query(pg_conn_details: PgConnectionDetail, query: str):
+    pg_session = pg_conn_details.get_psycopg_connection()
+    try:
+        with pg_session.cursor() as cursor:
+            cursor.execute(query)
+            result = cursor.fetchall() if cursor.description else None
+        pg_session.commit()
+        return result
+    finally:
+        pg_session.close()
+
+
+def iter_frames(data_df, no_of_frames: int):
+    frame_size = -(-data_df.shape[0] // no_of_frames)
+    for start in range(0, data_df.shape[0], frame_size):
+        yield data_df[start: start + frame_size]
+
+
+async def load(pg_conn_details, table_name, data_df, batch_size, pool_size, processes, copy_format):
+    if processes == 1:
+        return await batch_insert_to_postgres(
+            pg_conn_details=pg_conn_details,
+            input_data=data_df,
+            table_name=table_name,
+            batch_size=batch_size,
+            min_conn_pool_size=pool_size,
+            max_conn_pool_size=pool_size,
+            drop_and_create_index=False,
+            copy_format=copy_format
+        )
+    # Two DataFrames per process, to measure the hand-off to the processes as well
+    return await batch_insert_to_postgres_with_multi_process(
+        pg_conn_details=pg_conn_details,
+        table_name=table_name,
+        data_generator=iter_frames(data_df, processes * 2),
+        batch_size=batch_size,
+        min_conn_pool_size=pool_size,
+        max_conn_pool_size=pool_size,
+        no_of_processes=processes,
+        drop_and_create_index=False,
+        copy_format=copy_format
+    )
+
+
+def run_benchmark(pg_conn_details, frames, rows, batch_sizes, pool_sizes, processes, copy_format, repeat):
+    results = []
+    for frame in frames:
+        data_df = create_frame(frame, rows)
+        if copy_format == COPY_FORMAT_BINARY:
+            # The columns the binary format can't encode would make the whole load fall back to csv, they are left
+            # NULL in the table
+            data_df, _ = get_binary_frame(frame, data_df)
+        table_name = f"benchmark_{frame}"
+        create_table(pg_conn_details, f"{pg_conn_details.schema}.{table_name}", FRAME_TYPES[frame])
+        for batch_size, pool_size, no_of_processes in itertools.product(batch_sizes, pool_sizes, processes):
+            timings = []
+            summary = None
+            for _ in range(repeat):
+                run_query(pg_conn_details, f"TRUNCATE {pg_conn_details.schema}.{table_name}")
+                start_time = time.perf_counter()
+                metrics = asyncio.run(load(
+                    pg_conn_details, table_name, data_df, batch_size, pool_size, no_of_processes, copy_format
+                ))
+                timings.append(time.perf_counter() - start_time)
+                summary = metrics.summary()
+
+            loaded_rows = run_query(pg_conn_details, f"SELECT count(*) FROM {pg_conn_details.schema}.{table_name}")
+            if loaded_rows[0][0] != rows:
+                raise Exception(f"Expected {rows} rows in {table_name}, found {loaded_rows[0][0]}!")
+
+            best = min(timings)
+            results.append({
+                "frame": frame,
+                "copy_format": copy_format,
+                "rows": rows,
+                "batch_size": batch_size,
+                "pool_size": pool_size,
+                "processes": no_of_processes,
+                "min_seconds": best,
+                "seconds": timings,
+                "rows_per_second": rows / best,
+                "bytes": summary["bytes"],
+                "bottleneck": summary.get("bottleneck"),
+                "copy_time_p50": summary["copy_time"]["p50"] if "copy_time" in summary else None,
+                "pool_wait_time_p50": summary["pool_wait_time"]["p50"] if "pool_wait_time" in summary else None,
+            })
+            # Progress on stderr, so that stdout only carries the JSON results
+            print(
+                f"{frame:>15} batch_size={batch_size:<8} pool_size={pool_size:<3} processes={no_of_processes:<3}"
+                f"{rows / best:>12,.0f} rows/s", file=sys.stderr
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the loads")
+    parser.add_argument("--frames", nargs="+", default=["narrow", "wide"], choices=list(FRAME_TYPES))
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[10000, 50000])
+    parser.add_argument("--pool-sizes", nargs="+", type=int, default=[2, 5])
+    parser.add_argument("--processes", nargs="+", type=int, default=[1, 2])
+    parser.add_argument("--copy-format", default=COPY_FORMAT_CSV, choices=COPY_FORMATS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file of the results, printed to stdout by default")
+    parser.add_argument("--label", help="Label of the run, e.g. the version under test")
+    args = parser.parse_args()
+
+    with testing.postgresql.Postgresql() as postgresql:
+        params = postgresql.dsn()
+        pg_conn_details = PgConnectionDetail(
+            user=params["user"], password="", database="postgres", schema="public",
+            host=params["host"], port=params["port"]
+        )
+        results = run_benchmark(
+            pg_conn_details, args.frames, args.rows, args.batch_sizes, args.pool_sizes, args.processes,
+            args.copy_format, args.repeat
+        )
+    write_results("load", results, args.output, args.label)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import sys
+import json
+import platform
+import subprocess
+import numpy as np
+import pandas as pd
+import psycopg
+
+
+def get_environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "psycopg": psycopg.__version__,
+    }
+
+
+def write_results(benchmark: str, results: list, output: str = None, label: str = None):
+    """
+    Writes the results as JSON to the output file, or to stdout.
+    """
+    document = {"benchmark": benchmark, "label": label, "environment": get_environment(), "results": results}
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, "w") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
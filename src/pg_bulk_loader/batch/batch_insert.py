@@ -1,14 +1,41 @@
-import io
+import copy
+import time
+import itertools
 import pandas as pd
 import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from psycopg_pool import PoolTimeout
 from .pg_connection_detail import PgConnectionDetail
-from ..utils.common_utils import get_ranges
+from .copy_encoder import CsvCopyEncoder, BinaryCopyEncoder
+from .batch_size_tuner import BatchSizeTuner
+from .concurrency_controller import AdaptiveConcurrencyLimiter
+from .load_ledger import LoadLedger, get_row_hashes, get_fingerprint
+from .load_metrics import LoadMetrics, BatchMetrics, FAILED
+from .dry_run import (
+    NullConnectionPool, infer_pg_types, create_dry_run_report, start_memory_tracing, stop_memory_tracing
+)
+from .partition_router import PartitionRouter
+from ..utils.common_utils import get_ranges, get_ranges_by_size, estimate_row_sizes, round_robin
+from ..utils.constants import (
+    COPY_FORMAT_CSV, COPY_FORMAT_BINARY, COPY_FORMATS, DEFAULT_COPY_CHUNK_SIZE, AUTO_BATCH_SIZE, LOAD_MODES,
+    LOAD_MODE_APPEND, LOAD_MODE_TRUNCATE, LOAD_MODE_UPSERT, UPSERT_STAGING_TABLE
+)
+from ..utils.async_retry import async_retry
 import logging
-from retry import retry
 
 logger = logging.getLogger(__name__)
 
 
+def encode_next_chunk(chunks):
+    """
+    Runs in the encode executor.
+    :return: Tuple of the next encoded chunk (None once all chunks are encoded) and the seconds spent encoding it
+    """
+    start_time = time.perf_counter()
+    chunk = next(chunks, None)
+    return chunk, time.perf_counter() - start_time
+
+
 class BatchInsert:
 
     def __init__(
@@ -17,78 +44,691 @@ class BatchInsert:
             table_name: str,
             pg_conn_details: PgConnectionDetail,
             min_conn: int = 5,
-            max_conn: int = 10
+            max_conn: int = 10,
+            copy_format: str = COPY_FORMAT_CSV,
+            copy_chunk_size: int = DEFAULT_COPY_CHUNK_SIZE,
+            encode_executor: Executor = None,
+            batch_bytes: int = None,
+            batch_size_tuner: BatchSizeTuner = None,
+            adaptive_concurrency: bool = False,
+            load_ledger: LoadLedger = None,
+            metrics: LoadMetrics = None,
+            commit_every_batches: int = None,
+            commit_every_bytes: int = None,
+            session_settings: dict = None,
+            mode: str = LOAD_MODE_APPEND,
+            conflict_columns: list = None,
+            update_columns: list = None,
+            partition_routing: bool = False
     ):
         """
-        :param batch_size: Number of records to insert at a time
+        :param batch_size: Number of records to insert at a time. Can be None when batch_bytes is given.
+        "auto" tunes the batch size from the throughput observed for the previous batches, see batch_size_tuner.
         :param table_name: Name of the table
         :param pg_conn_details: Instance of PgConnectionDetail class which contains postgres connection details
         :param min_conn: Min PG connections created and saved in connection pool
         :param max_conn: Max PG connections created and saved in connection pool
+        :param copy_format: "csv" or "binary". The binary format encodes numeric, boolean and datetime columns
+        straight from their numpy buffers and falls back to csv when a column cannot be encoded in binary.
+        :param copy_chunk_size: Size in bytes of the chunks a batch is encoded and streamed to postgres in.
+        It bounds the memory held per in-flight batch.
+        :param encode_executor: Executor the batches are encoded in, off the event loop. By default, a thread pool
+        with min_conn threads is created and shut down along with the connection pool.
+        :param batch_bytes: Targeted size in bytes of every COPY payload. The rows are split into variable-sized
+        batches from per row size estimates. batch_size, if given, still limits the number of records per batch.
+        With batch_size="auto", it is the memory ceiling of the tuned batch size.
+        :param batch_size_tuner: Instance of BatchSizeTuner used when batch_size is "auto". A tuner of a previous
+        load can be passed to start from its result. The tuning history is available on it after the load.
+        :param adaptive_concurrency: Adapts the number of concurrent COPY streams between 1 and max_conn to the
+        observed throughput and latency instead of always running min_conn streams.
+        The limiter and its history are available as concurrency_limiter.
+        :param load_ledger: Instance of FileLoadLedger or TableLoadLedger recording every committed batch.
+        With resume=True on the ledger, the batches recorded by a previous run of the same load are skipped.
+        :param metrics: Instance of LoadMetrics the measurements of every batch are recorded to. By default, a new one
+        is created. It is available as metrics.
+        :param commit_every_batches: Groups this number of batches in one transaction. Every worker then keeps its
+        connection for the whole transaction and runs one COPY per batch in it. By default, every batch is
+        committed on its own.
+        :param commit_every_bytes: Commits the transaction of a worker once this number of encoded bytes is loaded
+        in it. Can be combined with commit_every_batches, the first limit reached commits.
+        :param session_settings: Settings (GUCs) applied to every pooled connection when it is created, e.g.
+        LOAD_SESSION_SETTINGS. They are added to the session_settings of pg_conn_details, overriding the same names.
+        :param mode: "append" or "truncate". In truncate mode, the table is truncated and all the rows of all the
+        execute calls are loaded with COPY FREEZE in the same transaction, on one connection. A partitioned table
+        doesn't accept COPY FREEZE, its rows are COPYed without FREEZE unless routed to a leaf partition, see
+        partition_routing. The transaction is
+        committed by finish() and rolled back by close_connection_pool() if finish() was not called, so a failed
+        load leaves the table untouched. The batches are encoded in parallel but streamed one at a time, and
+        commit_every_batches and commit_every_bytes don't apply. batch_size="auto" and adaptive_concurrency are
+        rejected, the batches being only measured once the load is committed.
+        In upsert mode, every batch is COPYed into a temporary staging table of its connection, then applied to the
+        table with one INSERT ... ON CONFLICT DO UPDATE, in the transaction of the batch. The rows of every DataFrame
+        are de-duplicated on the conflict_columns, the last one winning, and sorted by them, so that the batches are
+        disjoint key ranges and the concurrent upserts never wait on each other's rows.
+        :param conflict_columns: Columns of the primary key or of a unique constraint or index of the table, the
+        conflict target of the upsert mode
+        :param update_columns: Columns updated when a row conflicts. By default, all the loaded columns but the
+        conflict_columns. The conflicting rows are skipped when it is empty.
+        :param partition_routing: For a table partitioned by LIST or RANGE on one column, the rows of every DataFrame
+        are split by partition from the bounds in the catalog and COPYed straight into their leaf partition, see
+        PartitionRouter. The batches are created per partition and taken in turn from every partition, so that the
+        concurrent COPYs are spread across the partitions.
         """
+        if copy_format not in COPY_FORMATS:
+            raise Exception(f"Invalid copy format! Supported formats are {COPY_FORMATS}")
+        if not isinstance(copy_chunk_size, int) or copy_chunk_size <= 0:
+            raise Exception("Copy chunk size must be a positive integer!")
+        if batch_bytes is not None and (not isinstance(batch_bytes, int) or batch_bytes <= 0):
+            raise Exception("Batch bytes must be a positive integer!")
+        for name, value in (("Commit every batches", commit_every_batches), ("Commit every bytes", commit_every_bytes)):
+            if value is not None and (not isinstance(value, int) or value <= 0):
+                raise Exception(f"{name} must be a positive integer!")
+        if load_ledger and batch_size == AUTO_BATCH_SIZE:
+            raise Exception("A load ledger can't be used with batch_size='auto'!")
+        if mode not in LOAD_MODES:
+            raise Exception(f"Invalid load mode! Supported modes are {LOAD_MODES}")
+        if load_ledger and mode == LOAD_MODE_TRUNCATE:
+            raise Exception("A load ledger can't be used with mode='truncate'!")
+        # In truncate mode, the batches are streamed one at a time and only recorded once the load is committed
+        if batch_size == AUTO_BATCH_SIZE and mode == LOAD_MODE_TRUNCATE:
+            raise Exception("Batch size 'auto' can't be used with mode='truncate'!")
+        if adaptive_concurrency and mode == LOAD_MODE_TRUNCATE:
+            raise Exception("Adaptive concurrency can't be used with mode='truncate'!")
+        if mode == LOAD_MODE_UPSERT and not conflict_columns:
+            raise Exception("Conflict columns are required with mode='upsert'!")
+
         self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.batch_size_tuner = None
+        if batch_size == AUTO_BATCH_SIZE:
+            self.batch_size_tuner = batch_size_tuner or BatchSizeTuner(
+                **({"max_batch_bytes": batch_bytes} if batch_bytes else {})
+            )
         self.pg_conn_details = pg_conn_details
         self.table_name = table_name
         self.min_conn = min_conn
         self.max_conn = max_conn
+        self.copy_format = copy_format
+        self.copy_chunk_size = copy_chunk_size
+        self.concurrency_limiter = None
+        if adaptive_concurrency:
+            self.concurrency_limiter = AdaptiveConcurrencyLimiter(initial_limit=min_conn, max_limit=max_conn)
+        self.commit_every_batches = commit_every_batches
+        self.commit_every_bytes = commit_every_bytes
+        self.load_ledger = load_ledger
+        self.metrics = metrics or LoadMetrics()
+        self.mode = mode
+        self.conflict_columns = list(conflict_columns or [])
+        self.update_columns = None if update_columns is None else list(update_columns)
+        self.partition_routing = partition_routing
+        # Read from the catalog by the first execute call, None when the rows of the table are not routed
+        self.partition_router = None
+        self.partition_router_loaded = False
+        # (start, end, table name) of the rows of every partition of the DataFrame being loaded, and the table of
+        # every range of it
+        self.partition_groups = []
+        self.range_tables = {}
+        # Connection holding the transaction of a load in truncate mode, and the batches loaded in it
+        self.freeze_session = None
+        self.freeze_batches = []
+        # Whether the table of the load in truncate mode is partitioned, read when its transaction starts
+        self.freeze_partitioned = False
+        # Ledger entry of every range of the DataFrame being loaded
+        self.ledger_entries = {}
         self.data_df = None
-        self.pool = self.pg_conn_details.create_connection_pool(min_size=self.min_conn, max_size=self.max_conn)
+        self.encoder = None
+        self.session_settings = {**pg_conn_details.session_settings, **(session_settings or {})}
+        self.pool = self.pg_conn_details.create_connection_pool(
+            min_size=self.min_conn, max_size=self.max_conn, session_settings=self.session_settings
+        )
 
-    @retry(Exception, tries=3, delay=2, backoff=1)
+        self.owns_encode_executor = encode_executor is None
+        self.encode_executor = encode_executor or ThreadPoolExecutor(
+            max_workers=self.max_conn if adaptive_concurrency else self.min_conn,
+            thread_name_prefix="pg_bulk_loader_encoder"
+        )
+        # Seconds spent encoding the batches and streaming them to postgres over the lifetime of the instance
+        self.encode_time = 0.0
+        self.io_time = 0.0
+
+    @async_retry(tries=3, delay=2)
     async def open_connection_pool(self):
         await self.pool.open(wait=True)
 
-    @retry(Exception, tries=3, delay=2, backoff=1)
+    @async_retry(tries=3, delay=2)
     async def close_connection_pool(self):
+        if self.freeze_session is not None:
+            logger.warning(f"Rolling back the truncate of {self.table_name}, the load was not finished!")
+            await self.end_freeze_transaction(commit=False)
         await self.pool.close()
+        if self.owns_encode_executor:
+            self.encode_executor.shutdown(wait=False)
 
-    async def execute(self, data_df: pd.DataFrame, col_names: list = None):
+    async def execute(self, data_df: pd.DataFrame, col_names: list = None, dry_run: bool = False):
         """
         :param data_df: Data to be inserted
         :param col_names: column(s) to be considered for insert from the data_df
+        :param dry_run: This being True, the data is partitioned and encoded but not sent to postgres, see dry_run
+        :return: The dry run report, with dry_run=True
         """
+        if dry_run:
+            return await self.dry_run(data_df, col_names)
+
         try:
-            partition_ranges = get_ranges(data_df.shape[0], self.batch_size)
-            logger.debug(f"Created {len(partition_ranges)} partitions!")
+            if col_names:
+                data_df = data_df[col_names]
+            if self.mode == LOAD_MODE_UPSERT:
+                data_df = self.get_upsert_data(data_df)
+            if self.partition_routing:
+                data_df = await self.route_rows(data_df)
+
+            partition_ranges = self.get_partition_ranges(data_df)
+            if isinstance(partition_ranges, list):
+                logger.debug(f"Created {len(partition_ranges)} partitions!")
 
             if not partition_ranges:
                 logger.warning("No data found to be inserted!")
                 return
 
-            if col_names:
-                data_df = data_df[col_names]
+            if self.load_ledger:
+                partition_ranges = await self.get_pending_ranges(data_df, partition_ranges)
+                if not partition_ranges:
+                    logger.info("All the batches are already loaded!")
+                    return
 
             col_names = ",".join(col_names if col_names else data_df.columns)
 
             # Sharing the data among all processes
             self.data_df = data_df
+            self.encoder = await self.get_encoder(data_df)
+
+            encode_time, io_time = self.encode_time, self.io_time
             await self.handle_csv_bulk_insert(partition_ranges, col_names)
+            logger.debug(
+                f"Spent {(self.encode_time - encode_time):.4f}s encoding and "
+                f"{(self.io_time - io_time):.4f}s streaming {data_df.shape[0]} records"
+            )
         except Exception as e:
             raise e
         finally:
             self.data_df = None
+            self.encoder = None
+            self.ledger_entries = {}
+            self.partition_groups = []
+            self.range_tables = {}
 
-    async def handle_csv_bulk_insert(self, partition_ranges, col_names):
-        tasks = []
-        # At a time only self.min_conn async threads are allowed to execute
-        semaphore = asyncio.Semaphore(self.min_conn)
-        for range_ in partition_ranges:
-            tasks.append(
-                self.bulk_load(
-                    range_, f"{self.pg_conn_details.schema}.{self.table_name}", col_names, self.pool, semaphore
-                )
+    async def dry_run(self, data_df: pd.DataFrame, col_names: list = None):
+        """
+        Runs the partitioning and encoding pipeline of execute at the configured concurrency into a null sink. No
+        connection is opened and the load ledger is not used. The binary format uses the postgres types matching
+        the dtypes of the data_df instead of the types of the table. The batch size tuner and the concurrency limiter
+        are copied for the dry run, so that the timings of the null sink don't tune the ones of the real load.
+
+        :return: Report of the rows/s and bytes/s the client can encode, its peak memory and the projected wall time
+        of the load when postgres keeps up with the client
+        """
+        if col_names:
+            data_df = data_df[col_names]
+        column_types = dict(zip([str(col_name).lower() for col_name in data_df.columns], infer_pg_types(data_df)))
+
+        pool, load_ledger, metrics, mode = self.pool, self.load_ledger, self.metrics, self.mode
+        partition_routing, batch_size_tuner, concurrency_limiter = (
+            self.partition_routing, self.batch_size_tuner, self.concurrency_limiter
+        )
+        encode_time, io_time = self.encode_time, self.io_time
+        self.pool, self.load_ledger, self.metrics = NullConnectionPool(column_types), None, LoadMetrics()
+        self.mode, self.partition_routing = LOAD_MODE_APPEND, False
+        self.batch_size_tuner = copy.deepcopy(batch_size_tuner)
+        if concurrency_limiter:
+            self.concurrency_limiter = AdaptiveConcurrencyLimiter(
+                initial_limit=concurrency_limiter.limit, max_limit=concurrency_limiter.max_limit,
+                min_limit=concurrency_limiter.min_limit, decrease_factor=concurrency_limiter.decrease_factor,
+                tolerance=concurrency_limiter.tolerance, latency_spike_factor=concurrency_limiter.latency_spike_factor
             )
-        await asyncio.gather(*tasks)
+        memory_tracing = start_memory_tracing()
+        start_time = time.perf_counter()
+        try:
+            try:
+                await self.execute(data_df)
+            finally:
+                peak_memory = stop_memory_tracing(memory_tracing)
+            # The adaptive concurrency can reach the max size of the pool
+            concurrency = self.max_conn if self.concurrency_limiter else self.min_conn
+            return create_dry_run_report(self.metrics, time.perf_counter() - start_time, concurrency, peak_memory)
+        finally:
+            self.pool, self.load_ledger, self.metrics, self.mode = pool, load_ledger, metrics, mode
+            self.partition_routing, self.batch_size_tuner, self.concurrency_limiter = (
+                partition_routing, batch_size_tuner, concurrency_limiter
+            )
+            self.encode_time, self.io_time = encode_time, io_time
+
+    def get_upsert_data(self, data_df: pd.DataFrame):
+        """
+        :return: The rows of the data_df de-duplicated on the conflict columns, the last one winning, and sorted by
+        them. A key then belongs to one batch, and the batches loaded at a time upsert disjoint ranges of keys.
+        """
+        missing_columns = [col_name for col_name in self.conflict_columns if col_name not in data_df.columns]
+        if missing_columns:
+            raise Exception(f"Conflict columns {missing_columns} are missing from the data!")
+        data_df = data_df.drop_duplicates(subset=self.conflict_columns, keep="last")
+        return data_df.sort_values(self.conflict_columns, kind="stable").reset_index(drop=True)
+
+    def get_upsert_query(self, table_name: str, col_names: str):
+        update_columns = self.update_columns
+        if update_columns is None:
+            update_columns = [col_name for col_name in col_names.split(",") if col_name not in self.conflict_columns]
+        action = "DO NOTHING"
+        if update_columns:
+            action = "DO UPDATE SET " + ", ".join(f"{col_name} = EXCLUDED.{col_name}" for col_name in update_columns)
+        return f"""
+            INSERT INTO {table_name} ({col_names}) SELECT {col_names} FROM {UPSERT_STAGING_TABLE}
+            ON CONFLICT ({",".join(self.conflict_columns)}) {action}
+        """
+
+    async def route_rows(self, data_df: pd.DataFrame):
+        """
+        :return: The rows of the data_df grouped by leaf partition, see PartitionRouter. The groups are kept as
+        partition_groups, get_partition_ranges creates the ranges of the batches per group.
+        """
+        table_name = f"{self.pg_conn_details.schema}.{self.table_name}"
+        if not self.partition_router_loaded:
+            async with self.pool.connection(timeout=60) as pg_session:
+                self.partition_router = await PartitionRouter.from_catalog(pg_session, table_name)
+            self.partition_router_loaded = True
+        if self.partition_router is None or data_df.empty:
+            return data_df
+
+        data_df, self.partition_groups = self.partition_router.route(data_df)
+        logger.debug(f"Routed the rows to {len(self.partition_groups)} partitions of {table_name}")
+        return data_df
+
+    def get_partition_ranges(self, data_df: pd.DataFrame):
+        """
+        :return: Row ranges of the batches. With batch_size="auto", they are created lazily when a connection is free
+        to load the next batch, so that every range is created with the latest tuned batch size. The rows routed to
+        partitions are split per partition, and the ranges of the partitions are taken in turn.
+        """
+        if self.partition_groups:
+            ranges = round_robin([self.iter_group_ranges(data_df, *group) for group in self.partition_groups])
+            return ranges if self.batch_size_tuner else list(ranges)
+        return self.get_ranges(data_df)
+
+    def iter_group_ranges(self, data_df: pd.DataFrame, start: int, end: int, table_name: str):
+        for range_start, range_end in self.get_ranges(data_df[start: end]):
+            range_ = (start + range_start, start + range_end)
+            self.range_tables[range_] = table_name
+            yield range_
+
+    def get_ranges(self, data_df: pd.DataFrame):
+        if self.batch_size_tuner:
+            return self.iter_tuned_ranges(data_df.shape[0]) if data_df.shape[0] else []
+        if self.batch_bytes:
+            return get_ranges_by_size(estimate_row_sizes(data_df), self.batch_bytes, self.batch_size)
+        return get_ranges(data_df.shape[0], self.batch_size)
+
+    async def get_pending_ranges(self, data_df: pd.DataFrame, partition_ranges: list):
+        """
+        Creates the ledger entries of the partition_ranges.
+        :return: The partition_ranges which are not recorded as loaded in the ledger
+        """
+        await self.load_ledger.prepare(self.pool)
+        row_hashes = get_row_hashes(data_df)
+        table_name = f"{self.pg_conn_details.schema}.{self.table_name}"
+        pending_ranges = []
+        for range_ in partition_ranges:
+            entry = self.load_ledger.get_entry(table_name, range_, get_fingerprint(row_hashes[range_[0]: range_[1]]))
+            if not self.load_ledger.is_completed(entry):
+                self.ledger_entries[range_] = entry
+                pending_ranges.append(range_)
+
+        skipped = len(partition_ranges) - len(pending_ranges)
+        if skipped:
+            logger.info(f"Skipping {skipped} of {len(partition_ranges)} batches already loaded!")
+        return pending_ranges
+
+    def iter_tuned_ranges(self, data_size: int):
+        start = 0
+        while start < data_size:
+            end = min(data_size, start + self.batch_size_tuner.next_batch_size())
+            yield start, end
+            start = end
+
+    async def get_column_types(self):
+        """
+        :return: Mapping of the column names of the table to their postgres type names
+        """
+        query = """
+            select a.attname, t.typname from pg_attribute a join pg_type t on t.oid = a.atttypid
+            where a.attrelid = %s::regclass and a.attnum > 0 and not a.attisdropped
+        """
+        async with self.pool.connection(timeout=60) as pg_session:
+            async with pg_session.cursor() as acur:
+                await acur.execute(query, (f"{self.pg_conn_details.schema}.{self.table_name}",))
+                return {col_name: type_name for col_name, type_name in await acur.fetchall()}
+
+    async def get_encoder(self, data_df: pd.DataFrame):
+        if self.copy_format == COPY_FORMAT_BINARY:
+            column_types = await self.get_column_types()
+            # Unquoted column names in the COPY statement are folded to lower case by postgres
+            pg_types = [column_types.get(str(col_name).lower()) for col_name in data_df.columns]
+            unsupported_columns = BinaryCopyEncoder.unsupported_columns(data_df, pg_types)
+            if not unsupported_columns:
+                return BinaryCopyEncoder(pg_types)
+            logger.warning(f"Falling back to csv format! Columns {unsupported_columns} can't be encoded in binary")
+        return CsvCopyEncoder()
+
+    async def handle_csv_bulk_insert(self, partition_ranges, col_names):
+        table_name = f"{self.pg_conn_details.schema}.{self.table_name}"
+        if self.mode == LOAD_MODE_TRUNCATE:
+            return await self.freeze_load(partition_ranges, table_name, col_names)
+        if self.concurrency_limiter:
+            # Enough workers for the highest limit, the limiter decides how many of them load at a time
+            semaphore, no_of_workers = self.concurrency_limiter, self.max_conn
+        else:
+            # At a time only self.min_conn async threads are allowed to execute
+            semaphore, no_of_workers = asyncio.Semaphore(self.min_conn), self.min_conn
+        errors = []
+        # The workers share one iterator, every range is taken by the first free worker.
+        # No new batch is started once a batch failed for good, the in-flight ones are completed.
+        ranges = itertools.takewhile(lambda _: not errors, partition_ranges)
+
+        async def worker():
+            for range_ in ranges:
+                batch_metrics = BatchMetrics(table_name, range_[0], range_[1])
+                try:
+                    # Only the failed range is retried, see bulk_load
+                    await self.bulk_load(range_, table_name, col_names, self.pool, semaphore, batch_metrics)
+                except Exception as e:
+                    self.record_failed([(range_, batch_metrics)], e)
+                    errors.append(e)
+                    return
+
+        async def transaction_worker():
+            while True:
+                group = []
+                try:
+                    await self.bulk_load_group(ranges, group, table_name, col_names, self.pool, semaphore)
+                except Exception as e:
+                    self.record_failed(group, e)
+                    errors.append(e)
+                    return
+                if not group:
+                    return
+
+        grouped = self.commit_every_batches or self.commit_every_bytes
+        await asyncio.gather(*[(transaction_worker if grouped else worker)() for _ in range(no_of_workers)])
+        if errors:
+            raise errors[0]
+
+    def record_failed(self, group: list, error: Exception):
+        for range_, batch_metrics in group:
+            logger.error(f"Failed to load the records {range_[0]} to {range_[1]}: {error}")
+            batch_metrics.status, batch_metrics.error = FAILED, str(error)
+            self.metrics.record(batch_metrics)
+
+    async def record_committed(self, group: list):
+        """
+        Records the batches of a committed transaction to the ledger, the metrics, the batch size tuner and the
+        concurrency limiter.
+        """
+        for range_, batch_metrics in group:
+            if self.load_ledger:
+                await self.load_ledger.record_committed(self.ledger_entries[range_])
+            await self.record_batch(batch_metrics)
+
+    async def record_batch(self, batch_metrics: BatchMetrics):
+        """
+        Feeds the measurements of a loaded batch to the metrics, the batch size tuner and the concurrency limiter.
+        """
+        self.metrics.record(batch_metrics)
+        if self.batch_size_tuner:
+            self.batch_size_tuner.record(batch_metrics.rows, batch_metrics.bytes, batch_metrics.total_time)
+        if self.concurrency_limiter:
+            await self.concurrency_limiter.record_batch(batch_metrics.rows, batch_metrics.total_time)
+
+    def start_encoding(self, range_):
+        """
+        :return: Tuple of the lazy chunk iterator of the range and the future of its first encoded chunk
+        """
+        chunks = self.encoder.iter_chunks(self.data_df[range_[0]: range_[1]], self.copy_chunk_size)
+        return chunks, asyncio.get_running_loop().run_in_executor(self.encode_executor, encode_next_chunk, chunks)
+
+    async def copy_range(
+            self, pg_session, range_, table_name: str, col_names: str, batch_metrics: BatchMetrics, encoding=None,
+            freeze: bool = False
+    ):
+        """
+        Streams one range of rows of self.data_df with a COPY in the current transaction of the pg_session.
+        :param encoding: Result of start_encoding, when the encoding of the range is already started
+        :param freeze: COPY with FREEZE, the table must be created or truncated in the current transaction
+        :return: Size of the encoded batch in bytes
+        """
+        loop = asyncio.get_running_loop()
+        # The COPY of a range routed to a partition goes straight into the partition. A partitioned table rejects
+        # COPY FREEZE, only the leaf partitions the rows are routed to accept it.
+        routed_table_name = self.range_tables.get(range_, table_name)
+        freeze = freeze and not (self.freeze_partitioned and routed_table_name == table_name)
+        table_name = batch_metrics.table_name = routed_table_name
+        upsert = self.mode == LOAD_MODE_UPSERT
+        copy_options = self.encoder.copy_options + (", FREEZE" if freeze else "")
+        copy_table = UPSERT_STAGING_TABLE if upsert else table_name
+        copy_query = f"""COPY {copy_table} ({col_names}) FROM STDIN WITH ({copy_options})"""
+        chunks, next_chunk = encoding or self.start_encoding(range_)
+        size_in_bytes = 0
+        encode_time = encode_wait_time = 0.0
+        copy_start_time = time.perf_counter()
+        try:
+            async with pg_session.cursor() as acur:
+                if upsert:
+                    # Only the loaded columns are staged, without the constraints of the table
+                    await acur.execute(
+                        f"CREATE TEMP TABLE {UPSERT_STAGING_TABLE} AS SELECT {col_names} FROM {table_name} WITH NO DATA"
+                    )
+                async with acur.copy(copy_query) as copy:
+                    while True:
+                        wait_start_time = time.perf_counter()
+                        chunk, chunk_encode_time = await next_chunk
+                        encode_wait_time += time.perf_counter() - wait_start_time
+                        encode_time += chunk_encode_time
+                        if chunk is None:
+                            break
+
+                        # The next chunk gets encoded while the current one is streamed to postgres
+                        next_chunk = loop.run_in_executor(self.encode_executor, encode_next_chunk, chunks)
+                        await copy.write(chunk)
+                        size_in_bytes += len(chunk)
+                if upsert:
+                    await acur.execute(self.get_upsert_query(table_name, col_names))
+                    await acur.execute(f"DROP TABLE {UPSERT_STAGING_TABLE}")
+            if self.load_ledger:
+                await self.load_ledger.record_in_transaction(pg_session, self.ledger_entries[range_])
+        finally:
+            next_chunk.cancel()
+            copy_time = time.perf_counter() - copy_start_time - encode_wait_time
+            self.encode_time += encode_time
+            self.io_time += copy_time
+            batch_metrics.encode_time += encode_time
+            batch_metrics.encode_wait_time += encode_wait_time
+            batch_metrics.copy_time += copy_time
+            batch_metrics.total_time += copy_time + encode_wait_time
+
+        batch_metrics.bytes = size_in_bytes
+        return size_in_bytes
+
+    def add_commit_time(self, batch_metrics: BatchMetrics, commit_time: float):
+        self.io_time += commit_time
+        batch_metrics.copy_time += commit_time
+        batch_metrics.total_time += commit_time
+
+    @async_retry(tries=3, delay=1)
+    async def bulk_load(
+            self, range_, table_name: str, col_names: list[str], pool, semaphore, batch_metrics: BatchMetrics = None
+    ):
+        """
+        Loads one range of rows of self.data_df in its own COPY and transaction. Transient failures (lost
+        connections, serialization failures, pool timeouts) are retried for this range only, with exponential
+        backoff and without holding the semaphore while waiting.
+        :param batch_metrics: Measurements of the batch, accumulated over the attempts
+        :return: Size of the encoded batch in bytes
+        """
+        batch_metrics = batch_metrics or BatchMetrics(table_name, range_[0], range_[1])
+        if batch_metrics.started_at is None:
+            batch_metrics.started_at = time.time()
+        else:
+            batch_metrics.retries += 1
+
+        async with semaphore:
+            start_time = time.perf_counter()
+            # The first chunk gets encoded while a connection is checked out of the pool
+            encoding = self.start_encoding(range_)
+            try:
+                async with pool.connection(timeout=60) as pg_session:
+                    pool_wait_time = time.perf_counter() - start_time
+                    batch_metrics.pool_wait_time += pool_wait_time
+                    batch_metrics.total_time += pool_wait_time
+                    await self.copy_range(pg_session, range_, table_name, col_names, batch_metrics, encoding)
+                    commit_start_time = time.perf_counter()
+                # The transaction is committed when the connection is returned to the pool
+                self.add_commit_time(batch_metrics, time.perf_counter() - commit_start_time)
+            except PoolTimeout as e:
+                if self.concurrency_limiter:
+                    self.concurrency_limiter.record_timeout()
+                raise e
+            finally:
+                encoding[1].cancel()
+
+            await self.record_committed([(range_, batch_metrics)])
+            return batch_metrics.bytes
+
+    def is_group_complete(self, group_batches: int, group_bytes: int):
+        if self.commit_every_batches and group_batches >= self.commit_every_batches:
+            return True
+        return bool(self.commit_every_bytes and group_bytes >= self.commit_every_bytes)
+
+    @staticmethod
+    def take_range(ranges, group: list, table_name: str):
+        """
+        Adds the next range of the shared ranges iterator to the group.
+        :return: False when there are no ranges left
+        """
+        range_ = next(ranges, None)
+        if range_ is None:
+            return False
+        batch_metrics = BatchMetrics(table_name, range_[0], range_[1])
+        batch_metrics.started_at = time.time()
+        group.append((range_, batch_metrics))
+        return True
+
+    @async_retry(tries=3, delay=1)
+    async def bulk_load_group(self, ranges, group: list, table_name: str, col_names: str, pool, semaphore):
+        """
+        Loads consecutive ranges taken from the shared ranges iterator with one connection, as one COPY per range
+        in a single transaction. The transaction is committed once commit_every_batches ranges or
+        commit_every_bytes bytes are loaded, or when there are no ranges left.
+        :param group: (range, BatchMetrics) of the ranges of the transaction, filled by this method. After a
+        failure, the retry loads them again before taking new ranges, since their rows were rolled back.
+        """
+        for _, batch_metrics in group:
+            batch_metrics.retries += 1
+        if not group and not self.take_range(ranges, group, table_name):
+            return
 
-    @retry(Exception, tries=3, delay=2, backoff=1)
-    async def bulk_load(self, range_, table_name: str, col_names: list[str], pool, semaphore):
         async with semaphore:
-            copy_query = f"""COPY {table_name} ({col_names}) FROM STDIN WITH (FORMAT CSV, DELIMITER ',')"""
-            async with pool.connection(timeout=60) as pg_session:
-                async with pg_session.cursor() as acur:
-                    async with acur.copy(copy_query) as copy:
-                        with io.StringIO() as io_buffer:
-                            data_df = self.data_df[range_[0]: range_[1]]
-                            data_df.to_csv(io_buffer, header=False, index=False)
-                            io_buffer.seek(0)
-                            await copy.write(io_buffer.read())
+            start_time = time.perf_counter()
+            try:
+                async with pool.connection(timeout=60) as pg_session:
+                    pool_wait_time = time.perf_counter() - start_time
+                    group_bytes = 0
+                    for range_, batch_metrics in group:
+                        group_bytes += await self.copy_range(pg_session, range_, table_name, col_names, batch_metrics)
+
+                    while not self.is_group_complete(len(group), group_bytes):
+                        if not self.take_range(ranges, group, table_name):
+                            break
+                        range_, batch_metrics = group[-1]
+                        group_bytes += await self.copy_range(pg_session, range_, table_name, col_names, batch_metrics)
+                    commit_start_time = time.perf_counter()
+            except PoolTimeout as e:
+                if self.concurrency_limiter:
+                    self.concurrency_limiter.record_timeout()
+                raise e
+
+            # The transaction is committed when the connection is returned to the pool. The pool wait is accounted
+            # to the first batch of the transaction and the commit to the last one.
+            group[0][1].pool_wait_time += pool_wait_time
+            group[0][1].total_time += pool_wait_time
+            self.add_commit_time(group[-1][1], time.perf_counter() - commit_start_time)
+            await self.record_committed(group)
+
+    async def start_freeze_transaction(self, table_name: str):
+        start_time = time.perf_counter()
+        self.freeze_session = await self.pool.getconn(timeout=60)
+        try:
+            await self.freeze_session.execute(f"TRUNCATE {table_name}")
+            async with self.freeze_session.cursor() as acur:
+                await acur.execute(
+                    "select relkind from pg_class where oid = to_regclass(%(table)s)", {"table": table_name}
+                )
+                result = await acur.fetchone()
+            # A partitioned table rejects COPY FREEZE
+            self.freeze_partitioned = result is not None and result[0] == "p"
+        except Exception as e:
+            await self.end_freeze_transaction(commit=False)
+            raise e
+        self.io_time += time.perf_counter() - start_time
+
+    async def end_freeze_transaction(self, commit: bool):
+        pg_session, self.freeze_session = self.freeze_session, None
+        freeze_batches, self.freeze_batches = self.freeze_batches, []
+        try:
+            if commit:
+                commit_start_time = time.perf_counter()
+                await pg_session.commit()
+                if freeze_batches:
+                    self.add_commit_time(freeze_batches[-1][1], time.perf_counter() - commit_start_time)
+            else:
+                await pg_session.rollback()
+        finally:
+            await self.pool.putconn(pg_session)
+        if commit:
+            await self.record_committed(freeze_batches)
+
+    async def freeze_load(self, partition_ranges, table_name: str, col_names: str):
+        """
+        Loads the ranges in the transaction of the truncate mode, started by the first call. The ranges are
+        streamed one at a time, the first chunk of the next range gets encoded while the current one is streamed.
+        """
+        if self.freeze_session is None:
+            await self.start_freeze_transaction(table_name)
+
+        ranges = iter(partition_ranges)
+        range_ = next(ranges, None)
+        encoding = self.start_encoding(range_) if range_ else None
+        while range_ is not None:
+            batch_metrics = BatchMetrics(table_name, range_[0], range_[1])
+            batch_metrics.started_at = time.time()
+            next_range = next(ranges, None)
+            next_encoding = self.start_encoding(next_range) if next_range else None
+            try:
+                await self.copy_range(
+                    self.freeze_session, range_, table_name, col_names, batch_metrics, encoding, freeze=True
+                )
+            except Exception as e:
+                if next_encoding:
+                    next_encoding[1].cancel()
+                # The transaction is aborted, nothing of the load is kept
+                self.record_failed([(range_, batch_metrics)], e)
+                raise e
+            self.freeze_batches.append((range_, batch_metrics))
+            range_, encoding = next_range, next_encoding
+
+    async def finish(self):
+        """
+        Commits the transaction of a load in truncate mode, once all the DataFrames are loaded with execute.
+        The table is truncated even if there was no data to load.
+        """
+        if self.mode != LOAD_MODE_TRUNCATE:
+            return
+        if self.freeze_session is None:
+            await self.start_freeze_transaction(f"{self.pg_conn_details.schema}.{self.table_name}")
+        await self.end_freeze_transaction(commit=True)
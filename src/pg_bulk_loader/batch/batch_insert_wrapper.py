@@ -1,15 +1,37 @@
 from .pg_connection_detail import PgConnectionDetail
 from .fast_load_hack import FastLoadHack
+from .shadow_table import ShadowTable
 from .batch_insert import BatchInsert
+from .batch_size_tuner import BatchSizeTuner
+from .load_ledger import LoadLedger
+from .load_metrics import LoadMetrics
+from .dry_run import merge_dry_run_reports
+from .loader_worker import init_loader_worker, run_loader_worker_task
 import pandas as pd
 import logging
 from ..utils.time_it_decorator import time_it
+from ..utils.constants import (
+    COPY_FORMAT_CSV, DEFAULT_PREFETCH_QUEUE_DEPTH, DEFAULT_MAX_PARALLEL_INDEX_BUILDS, AUTO_DROP_AND_CREATE_INDEX,
+    LOAD_MODE_APPEND, LOAD_MODE_REPLACE, LOAD_MODE_UPSERT, AUTO_BATCH_SIZE
+)
+from ..utils.shared_memory_utils import (
+    to_shared_memory, from_shared_memory, close_shared_memory, release_shared_memory
+)
 import asyncio
-from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import math
+import time
+import os
 
 logger = logging.getLogger(__name__)
 
+# Marks the end of the data generator in the prefetch queue
+END_OF_DATA = object()
+
+# Batch size tuner of the current loader process with batch_size="auto", shared by all the dfs the process loads
+_process_batch_size_tuner = None
+
 
 def __optimize_connection_pool_size(min_conn, total_data_size, batch_size):
     """
@@ -17,18 +39,57 @@ def __optimize_connection_pool_size(min_conn, total_data_size, batch_size):
     The total number of insert tasks running in coroutines at a time are = (total_data_size / batch_size).
     So we need (total_data_size / batch_size) number of minimum connection in the connection pool open and ready.
     """
-    return min(min_conn, math.ceil(total_data_size/batch_size))
+    if not isinstance(batch_size, int) or not batch_size:
+        # The number of batches is only known once the rows are split by their size or the batch size is tuned
+        return min_conn
+    # At least one connection, e.g. to truncate the table in truncate mode when there is no data to load
+    return min(min_conn, max(1, math.ceil(total_data_size/batch_size)))
 
 
-def run_batch_task(data_df, batch_size, pg_conn_details, table_name, min_conn, max_conn):  # pragma: no cover
+def run_batch_task(
+        data_df, batch_size, pg_conn_details, table_name, min_conn, max_conn, batch_options=None
+):  # pragma: no cover
     """
         Helper method to achieve multiprocess execution with ProcessPoolExecutor class.
         This method can be executed per process.
+        batch_options are the additional keyword arguments of the BatchInsert instance.
+        With batch_size="auto", the dfs loaded by the process share one BatchSizeTuner, so that the tuning carries
+        over from one df to the next.
+        Returns the LoadMetrics of the task, to be recorded by the parent process.
     """
-    asyncio.run(run(data_df, batch_size, pg_conn_details, table_name, min_conn, max_conn))
+    global _process_batch_size_tuner
+    if batch_size == AUTO_BATCH_SIZE:
+        batch_options = batch_options or {}
+        if _process_batch_size_tuner is None:
+            batch_bytes = batch_options.get("batch_bytes")
+            _process_batch_size_tuner = BatchSizeTuner(**({"max_batch_bytes": batch_bytes} if batch_bytes else {}))
+        batch_options = {**batch_options, "batch_size_tuner": _process_batch_size_tuner}
+    return asyncio.run(
+        run(data_df, batch_size, pg_conn_details, table_name, min_conn, max_conn, **(batch_options or {}))
+    )
 
 
-async def run(data_df, batch_size, pg_conn_details, table_name, min_conn, max_conn):
+def run_shared_memory_batch_task(
+        descriptor, batch_size, pg_conn_details, table_name, min_conn, max_conn, batch_options=None
+):  # pragma: no cover
+    """
+        Same as run_batch_task, but the DataFrame is re-created from the shared memory block described by the
+        descriptor instead of being pickled into the process.
+    """
+    data_df, shm = from_shared_memory(descriptor)
+    try:
+        return run_batch_task(data_df, batch_size, pg_conn_details, table_name, min_conn, max_conn, batch_options)
+    finally:
+        del data_df
+        close_shared_memory(shm)
+
+
+async def run(
+        data_df, batch_size, pg_conn_details, table_name, min_conn, max_conn, dry_run=False, **batch_options
+):
+    """
+    :return: The LoadMetrics of the load, or the dry run report with dry_run=True
+    """
     min_conn = __optimize_connection_pool_size(min_conn, data_df.shape[0], batch_size)
 
     batch_ = BatchInsert(
@@ -36,30 +97,209 @@ async def run(data_df, batch_size, pg_conn_details, table_name, min_conn, max_co
         pg_conn_details=pg_conn_details,
         table_name=table_name,
         min_conn=min_conn,
-        max_conn=max_conn
+        max_conn=max_conn,
+        **batch_options
     )
     try:
+        if dry_run:
+            return await batch_.execute(data_df, dry_run=True)
         await batch_.open_connection_pool()
         await batch_.execute(data_df)
+        await batch_.finish()
     finally:
         await batch_.close_connection_pool()
+    return batch_.metrics
+
+
+async def prefetch_data(data_generator, queue: asyncio.Queue, executor: ThreadPoolExecutor):
+    """
+    Producer stage of the generator pipeline. The generator is advanced in the single thread of the executor, so that
+    reading the next DataFrame (e.g. from a file or a database extract) overlaps with the COPY of the current one.
+    Putting into the bounded queue blocks once the consumer falls behind, which keeps at most `queue.maxsize`
+    DataFrames in memory. An exception raised by the generator is handed over to the consumer through the queue.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = iter(data_generator)
+    try:
+        while True:
+            data_df = await loop.run_in_executor(executor, next, iterator, END_OF_DATA)
+            await queue.put(data_df)
+            if data_df is END_OF_DATA:
+                return
+    except Exception as e:
+        await queue.put(e)
 
 
-async def run_with_generator(data_generator, batch_size, pg_conn_details, table_name, min_conn, max_conn):
+async def run_with_generator(
+        data_generator, batch_size, pg_conn_details, table_name, min_conn, max_conn,
+        prefetch_queue_depth=DEFAULT_PREFETCH_QUEUE_DEPTH, dry_run=False, **batch_options
+):
+    """
+    :return: The LoadMetrics of the load, or the dry run report of all the DataFrames with dry_run=True
+    """
+    if not isinstance(prefetch_queue_depth, int) or prefetch_queue_depth < 0:
+        raise Exception("Prefetch queue depth must be a non-negative integer!")
 
     batch_ = BatchInsert(
         batch_size=batch_size,
         pg_conn_details=pg_conn_details,
         table_name=table_name,
         min_conn=min_conn,
-        max_conn=max_conn
+        max_conn=max_conn,
+        **batch_options
     )
+    # Without prefetch, the generator is advanced inline, on the thread it was created in
+    iterator = iter(data_generator) if not prefetch_queue_depth else None
+    queue = asyncio.Queue(maxsize=prefetch_queue_depth) if prefetch_queue_depth else None
+    prefetch_executor = None
+    producer = None
+    dry_run_reports = []
+    start_time = time.perf_counter()
     try:
-        await batch_.open_connection_pool()
-        for data_df in data_generator:
-            await batch_.execute(data_df)
+        if not dry_run:
+            await batch_.open_connection_pool()
+        if queue:
+            # One dedicated thread, so that the generator is always advanced by the same thread
+            prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pg_bulk_loader_prefetch")
+            producer = asyncio.create_task(prefetch_data(data_generator, queue, prefetch_executor))
+        while True:
+            data_df = await queue.get() if queue else next(iterator, END_OF_DATA)
+            if data_df is END_OF_DATA:
+                break
+            if isinstance(data_df, Exception):
+                raise data_df
+            if dry_run:
+                dry_run_reports.append(await batch_.execute(data_df, dry_run=True))
+            else:
+                await batch_.execute(data_df)
+        if not dry_run:
+            await batch_.finish()
     finally:
+        if producer:
+            producer.cancel()
+        if prefetch_executor:
+            prefetch_executor.shutdown(wait=False)
         await batch_.close_connection_pool()
+    if dry_run:
+        return merge_dry_run_reports(dry_run_reports, time.perf_counter() - start_time)
+    return batch_.metrics
+
+
+@time_it
+def drop_indexes_for_load(fast_load_hack: FastLoadHack, drop_and_create_index, incoming_rows: int = None):
+    """
+    :param drop_and_create_index: True drops all the non-pk indexes, "auto" only the ones cheaper to re-create
+    than to maintain during the load of incoming_rows
+    :return: The dropped indexes, to be re-created after the load, and the sizes of the indexes before the drop
+    """
+    if not drop_and_create_index:
+        return {}, {}
+
+    indexes = fast_load_hack.get_indexes()
+    # Captured before the drop, to create the largest indexes first
+    index_sizes = fast_load_hack.get_index_sizes()
+    if drop_and_create_index == AUTO_DROP_AND_CREATE_INDEX:
+        indexes = fast_load_hack.get_indexes_to_rebuild(indexes, index_sizes, incoming_rows)
+    logger.debug(f'Indexes to be dropped and re-created: {indexes.keys()}')
+    fast_load_hack.drop_indexes(list(indexes.keys()))
+    return indexes, index_sizes
+
+
+def check_fast_mode(fast_load_hack: FastLoadHack):
+    """
+    :return: True when the table is to be switched to UNLOGGED for the load, False when it already is UNLOGGED.
+    Raises when the switch is unsafe.
+    """
+    blockers = fast_load_hack.get_unlogged_blockers()
+    if blockers:
+        raise Exception(f"Fast mode is unsafe for {fast_load_hack.table_name}: {', '.join(blockers)}!")
+    return fast_load_hack.is_table_logged()
+
+
+def restore_table(
+        fast_load_hack: FastLoadHack, metrics: LoadMetrics, indexes: dict, index_sizes: dict, use_multi_process: bool,
+        constraints_and_triggers: dict = None, set_logged: bool = False
+):
+    """
+    Switches the table back to LOGGED, re-creates the dropped indexes, then restores the disabled constraints and
+    triggers. Every step is attempted even if a previous one failed. The table is switched back before the indexes
+    are created, so that the SET LOGGED rewrite only copies the heap.
+    """
+    try:
+        if set_logged:
+            start_time = time.perf_counter()
+            fast_load_hack.set_table_logged()
+            metrics.set_logged_time = time.perf_counter() - start_time
+            logger.info(f"Table {fast_load_hack.table_name} set LOGGED in {metrics.set_logged_time:.4f}s")
+    finally:
+        try:
+            fast_load_hack.create_indexes(indexes, use_multi_process, index_sizes)
+        finally:
+            metrics.index_builds = fast_load_hack.index_builds
+            if constraints_and_triggers:
+                fast_load_hack.restore_constraints_and_triggers(constraints_and_triggers)
+
+
+@contextmanager
+def prepare_table_for_load(
+        fast_load_hack: FastLoadHack, metrics: LoadMetrics, drop_and_create_index,
+        disable_constraints_and_triggers: bool, fast_mode: bool, use_multi_process: bool, incoming_rows: int = None
+):
+    """
+    Drops the indexes, disables the constraints and triggers and switches the table to UNLOGGED for the load run in
+    the with block, then restores the table by restore_table, even if the load failed.
+    """
+    switch_to_unlogged = fast_mode and check_fast_mode(fast_load_hack)
+    indexes, index_sizes = drop_indexes_for_load(fast_load_hack, drop_and_create_index, incoming_rows)
+    constraints_and_triggers = None
+
+    unlogged = False
+    try:
+        # In the try block, so that the dropped indexes are re-created when it fails. Nothing is disabled then,
+        # the constraints and triggers are disabled in one transaction.
+        if disable_constraints_and_triggers:
+            constraints_and_triggers = fast_load_hack.disable_constraints_and_triggers()
+        if switch_to_unlogged:
+            fast_load_hack.set_table_unlogged()
+            unlogged = True
+        yield
+    finally:
+        if drop_and_create_index or constraints_and_triggers or unlogged:
+            restore_table(
+                fast_load_hack, metrics, indexes, index_sizes, use_multi_process, constraints_and_triggers, unlogged
+            )
+
+
+async def replace_with_shadow_table(
+        shadow_table: ShadowTable, input_data, batch_size, pg_conn_details: PgConnectionDetail, min_conn: int,
+        max_conn: int, prefetch_queue_depth: int, use_multi_process: bool, metrics: LoadMetrics, batch_options: dict
+):
+    """
+    Loads the input_data into the shadow table in append mode, builds its indexes, constraints and triggers, then
+    swaps it in. The shadow table is dropped if any step fails, leaving the table untouched.
+    """
+    blockers = shadow_table.get_blockers()
+    if blockers:
+        raise Exception(f"Replace mode is unsafe for {shadow_table.table_name}: {', '.join(blockers)}!")
+
+    shadow_table.create()
+    batch_options = {**batch_options, "mode": LOAD_MODE_APPEND}
+    try:
+        if isinstance(input_data, pd.DataFrame):
+            await run(input_data, batch_size, pg_conn_details, shadow_table.name, min_conn, max_conn, **batch_options)
+        else:
+            await run_with_generator(
+                input_data, batch_size, pg_conn_details, shadow_table.name, min_conn, max_conn, prefetch_queue_depth,
+                **batch_options
+            )
+        try:
+            shadow_table.build(use_multi_process)
+        finally:
+            metrics.index_builds = shadow_table.index_builds
+        shadow_table.swap()
+    except Exception as e:
+        shadow_table.drop()
+        raise e
 
 
 @time_it
@@ -71,42 +311,159 @@ async def batch_insert_to_postgres(
         min_conn_pool_size: int = 5,
         max_conn_pool_size: int = 10,
         use_multi_process_for_create_index: bool = True,
-        drop_and_create_index: bool = True
+        drop_and_create_index=True,
+        copy_format: str = COPY_FORMAT_CSV,
+        prefetch_queue_depth: int = DEFAULT_PREFETCH_QUEUE_DEPTH,
+        batch_bytes: int = None,
+        batch_size_tuner: BatchSizeTuner = None,
+        adaptive_concurrency: bool = False,
+        load_ledger: LoadLedger = None,
+        metrics: LoadMetrics = None,
+        dry_run: bool = False,
+        commit_every_batches: int = None,
+        commit_every_bytes: int = None,
+        max_parallel_index_builds: int = DEFAULT_MAX_PARALLEL_INDEX_BUILDS,
+        maintenance_work_mem_budget: int = None,
+        disable_constraints_and_triggers: bool = False,
+        fast_mode: bool = False,
+        mode: str = LOAD_MODE_APPEND,
+        swap_lock_timeout: str = "5s",
+        conflict_columns: list = None,
+        update_columns: list = None,
+        partition_routing: bool = False
 ):
     """
     :param pg_conn_details: Instance of PgConnectionDetail class which contains postgres connection details
     :param table_name: Name of the table
     :param input_data: Data can be a pd.DataFrame | DataFrame Generator
-    :param batch_size: Number of records to insert at a time
+    :param batch_size: Number of records to insert at a time. Can be None when batch_bytes is given.
+    "auto" tunes the batch size from the throughput observed for the previous batches.
     :param min_conn_pool_size: Min PG connections created and saved in connection pool
     :param max_conn_pool_size: Max PG connections created and saved in connection pool
     :param use_multi_process_for_create_index: This being True, makes the index(es) creation in parallel
     :param drop_and_create_index: This being True, drops the indexes from the table, inserts data and crates them back
     Note: Only non-pk indexes are dropped and re-created.
-    :return:
+    "auto" only drops the indexes cheaper to re-create than to maintain during the load, estimated from the
+    catalog statistics of the table and of the indexes and the number of rows of input_data. Indexes are only
+    dropped from an empty table when input_data is a generator, its number of rows being unknown.
+    :param copy_format: "csv" or "binary". The binary format falls back to csv for columns it cannot encode.
+    :param prefetch_queue_depth: Number of DataFrames pulled ahead from a DataFrame generator while the current
+    one is loaded, in a dedicated thread. The generator must then support being advanced in another thread than the
+    one it was created in, which is not the case of e.g. pd.read_sql on a sqlite3 connection. With 0 (default), the
+    generator is advanced inline. Not used when input_data is a DataFrame.
+    :param batch_bytes: Targeted size in bytes of every COPY payload. The rows are split into variable-sized batches
+    from per row size estimates, batch_size still limits the number of records per batch.
+    :param batch_size_tuner: Instance of BatchSizeTuner used when batch_size is "auto". The tuned batch sizes and the
+    tuning history are available on it after the load.
+    :param adaptive_concurrency: This being True, the number of concurrent COPY streams is adapted between 1 and
+    max_conn_pool_size to the observed throughput and latency instead of always running min_conn_pool_size streams.
+    :param load_ledger: Instance of FileLoadLedger or TableLoadLedger recording every committed batch. A failed load
+    can be rerun with a ledger of the same load_id and resume=True to only load the missing batches.
+    :param metrics: Instance of LoadMetrics the measurements of every batch are recorded to, e.g. to register
+    callbacks exporting them. By default, a new one is created.
+    :param dry_run: This being True, the data is partitioned and encoded at the configured concurrency into a null
+    sink. No connection is opened and the indexes are left untouched.
+    :param commit_every_batches: Groups this number of batches in one transaction, loaded with one connection as one
+    COPY per batch. By default, every batch is committed on its own.
+    :param commit_every_bytes: Commits a transaction once this number of encoded bytes is loaded in it.
+    :param max_parallel_index_builds: Max number of indexes re-created at a time with
+    use_multi_process_for_create_index=True. The largest indexes are re-created first.
+    :param maintenance_work_mem_budget: Total maintenance_work_mem in bytes shared by the indexes re-created at a time.
+    The duration and error of every index build are available as index_builds on the returned LoadMetrics.
+    :param disable_constraints_and_triggers: This being True, drops the foreign keys and the non-pk unique constraints
+    of the table and disables its user triggers during the load. They are restored afterwards, the foreign keys as
+    NOT VALID followed by one VALIDATE CONSTRAINT each.
+    :param fast_mode: This being True, the table is switched to UNLOGGED for the load and back to LOGGED afterwards,
+    even if the load fails. The rows then skip the WAL, but SET LOGGED rewrites the table, its time is available as
+    set_logged_time on the returned LoadMetrics. Raises before touching the table when replicas, publications or
+    inbound foreign keys make the switch unsafe.
+    :param mode: "append" (default), "truncate", "replace" or "upsert". "truncate" replaces the content of the table:
+    it is truncated and all the rows are loaded with COPY FREEZE in the same transaction, so they are written
+    already frozen and no vacuum pass is needed after the load. The rows are streamed on one connection and a failed
+    load leaves the table untouched. batch_size="auto" and adaptive_concurrency can't be used in this mode.
+    "replace" also replaces the content of the table, with the rows loaded in parallel into a shadow copy of the table.
+    The indexes, constraints and triggers of the table are created on the shadow table after the load, then the table
+    is dropped and the shadow table renamed in one short transaction. Readers of the table never wait on the load
+    and never see it half loaded. Raises before the load when partitioning, inheritance, row level security,
+    publications, views or inbound foreign keys of the table make the swap unsafe. drop_and_create_index,
+    disable_constraints_and_triggers and fast_mode are not used, the shadow table being loaded without indexes.
+    "upsert" inserts the new rows and updates the existing ones: every batch is COPYed into a temporary staging
+    table of its connection and applied to the table with one INSERT ... ON CONFLICT DO UPDATE. The rows are
+    de-duplicated on the conflict_columns and sorted by them, so the concurrent batches upsert disjoint key ranges.
+    The unique constraints can't be disabled in this mode, one of them being the conflict target.
+    :param swap_lock_timeout: Max time the swap of mode="replace" waits for the lock of the table, e.g. behind a long
+    running query, before it is retried. Waiting longer would queue the readers of the table behind the swap.
+    :param conflict_columns: Columns of the primary key or of a unique constraint of the table, required with
+    mode="upsert"
+    :param update_columns: Columns updated by mode="upsert" when a row exists. By default, all the columns of
+    input_data but the conflict_columns. The existing rows are left untouched when it is empty.
+    :param partition_routing: This being True, the rows for a table partitioned by LIST or RANGE on one column are
+    split by partition on the client and COPYed straight into the partitions, the concurrent COPYs being spread across
+    the partitions. The rows which can't be routed, e.g. the ones of the default partition, go through the table.
+    :return: The LoadMetrics of the load. With dry_run=True, a report of the rows/s and bytes/s the client can encode,
+    its peak memory and the projected wall time of the load when postgres keeps up with the client.
     """
     if input_data is None:
         raise Exception("Data input cannot be empty!")
 
-    fast_load_hack = FastLoadHack(pg_conn_details=pg_conn_details, table_name=table_name)
-    indexes = {}
-    if drop_and_create_index:
-        indexes: dict = fast_load_hack.get_indexes()
-        logger.debug(f'Indexes to be dropped and re-created: {indexes.keys()}')
-        fast_load_hack.drop_indexes(list(indexes.keys()))
+    metrics = metrics or LoadMetrics()
+    batch_options = {
+        "copy_format": copy_format,
+        "batch_bytes": batch_bytes,
+        "batch_size_tuner": batch_size_tuner,
+        "adaptive_concurrency": adaptive_concurrency,
+        "load_ledger": load_ledger,
+        "metrics": metrics,
+        "commit_every_batches": commit_every_batches,
+        "commit_every_bytes": commit_every_bytes,
+        "mode": mode,
+        "conflict_columns": conflict_columns,
+        "update_columns": update_columns,
+        "partition_routing": partition_routing
+    }
+    if mode == LOAD_MODE_UPSERT and disable_constraints_and_triggers:
+        raise Exception("Constraints and triggers can't be disabled with mode='upsert'!")
+    if mode == LOAD_MODE_REPLACE and load_ledger:
+        raise Exception("A load ledger can't be used with mode='replace'!")
+    if mode == LOAD_MODE_REPLACE and not dry_run:
+        shadow_table = ShadowTable(
+            pg_conn_details=pg_conn_details, table_name=table_name,
+            max_parallel_index_builds=max_parallel_index_builds,
+            maintenance_work_mem_budget=maintenance_work_mem_budget, lock_timeout=swap_lock_timeout
+        )
+        await replace_with_shadow_table(
+            shadow_table, input_data, batch_size, pg_conn_details, min_conn_pool_size, max_conn_pool_size,
+            prefetch_queue_depth, use_multi_process_for_create_index, metrics, batch_options
+        )
+        return metrics
+    if mode == LOAD_MODE_REPLACE:
+        batch_options["mode"] = LOAD_MODE_APPEND
 
-    try:
+    if dry_run:
+        drop_and_create_index = False
+        disable_constraints_and_triggers = False
+        fast_mode = False
+
+    fast_load_hack = FastLoadHack(
+        pg_conn_details=pg_conn_details, table_name=table_name, max_parallel_index_builds=max_parallel_index_builds,
+        maintenance_work_mem_budget=maintenance_work_mem_budget
+    )
+    incoming_rows = len(input_data) if isinstance(input_data, pd.DataFrame) else None
+    with prepare_table_for_load(
+            fast_load_hack, metrics, drop_and_create_index, disable_constraints_and_triggers, fast_mode,
+            use_multi_process_for_create_index, incoming_rows
+    ):
         if isinstance(input_data, pd.DataFrame):
-            await run(input_data, batch_size, pg_conn_details, table_name, min_conn_pool_size, max_conn_pool_size)
+            result = await run(
+                input_data, batch_size, pg_conn_details, table_name, min_conn_pool_size, max_conn_pool_size,
+                dry_run, **batch_options
+            )
         else:
-            await run_with_generator(
-                input_data, batch_size, pg_conn_details, table_name, min_conn_pool_size, max_conn_pool_size
+            result = await run_with_generator(
+                input_data, batch_size, pg_conn_details, table_name, min_conn_pool_size, max_conn_pool_size,
+                prefetch_queue_depth, dry_run, **batch_options
             )
-    except Exception as e:
-        raise e
-    finally:
-        if drop_and_create_index:
-            fast_load_hack.create_indexes(list(indexes.values()), use_multi_process_for_create_index)
+    return result if dry_run else metrics
 
 
 @time_it
@@ -118,7 +475,22 @@ async def batch_insert_to_postgres_with_multi_process(
         min_conn_pool_size: int = 5,
         max_conn_pool_size: int = 10,
         no_of_processes: int = 1,
-        drop_and_create_index: bool = True
+        drop_and_create_index=True,
+        copy_format: str = COPY_FORMAT_CSV,
+        use_shared_memory: bool = False,
+        persistent_workers: bool = False,
+        max_tasks_per_process: int = 2,
+        batch_bytes: int = None,
+        adaptive_concurrency: bool = False,
+        load_ledger: LoadLedger = None,
+        metrics: LoadMetrics = None,
+        commit_every_batches: int = None,
+        commit_every_bytes: int = None,
+        max_parallel_index_builds: int = DEFAULT_MAX_PARALLEL_INDEX_BUILDS,
+        maintenance_work_mem_budget: int = None,
+        disable_constraints_and_triggers: bool = False,
+        fast_mode: bool = False,
+        partition_routing: bool = False
 ):
     """
     This wrapper function is useful when you have a data generator on Dataframes
@@ -127,44 +499,125 @@ async def batch_insert_to_postgres_with_multi_process(
     :param pg_conn_details: Instance of PgConnectionDetail class which contains postgres connection details
     :param table_name: Name of the table
     :param data_generator: generator to provide dataset per process
-    :param batch_size: Number of records to insert at a time
+    :param batch_size: Number of records to insert at a time. Can be None when batch_bytes is given.
+    "auto" tunes the batch size per process from the throughput observed for its previous batches, of all the dfs
+    the process loaded.
     :param min_conn_pool_size: Min PG connections created and saved in connection pool
     :param max_conn_pool_size: Max PG connections created and saved in connection pool
     :param no_of_processes: int = 1
     :param drop_and_create_index: This being True, drops the indexes from the table, inserts data and crates them back
     Note: Only non-pk indexes are dropped and re-created.
-    :return:
+    "auto" only drops the indexes from an empty table, the number of rows of data_generator being unknown.
+    :param copy_format: "csv" or "binary". The binary format falls back to csv for columns it cannot encode.
+    :param use_shared_memory: This being True, the column buffers of every df are placed in shared memory and the
+    processes re-create the df from zero-copy views instead of receiving a pickled copy of it.
+    :param persistent_workers: This being True, every process creates one event loop and one connection pool at
+    startup and loads all the dfs it takes from the executor queue with them. Otherwise, a new event loop and a new
+    connection pool are created per df.
+    :param max_tasks_per_process: At most (max_tasks_per_process * no_of_processes) dfs are pulled from the
+    data_generator and in flight at a time. The next df is pulled only when one of them is loaded.
+    :param batch_bytes: Targeted size in bytes of every COPY payload. The rows are split into variable-sized batches
+    from per row size estimates, batch_size still limits the number of records per batch.
+    :param adaptive_concurrency: This being True, every process adapts its number of concurrent COPY streams between 1
+    and max_conn_pool_size to the observed throughput and latency.
+    :param load_ledger: Instance of FileLoadLedger or TableLoadLedger recording every committed batch, shared by all
+    the processes. See batch_insert_to_postgres.
+    :param metrics: Instance of LoadMetrics the measurements of every batch are recorded to. The batches loaded by a
+    process are recorded (and passed to the callbacks) in this process once the process is done with the df.
+    :param commit_every_batches: Groups this number of batches in one transaction. See batch_insert_to_postgres.
+    :param commit_every_bytes: Commits a transaction once this number of encoded bytes is loaded in it.
+    :param max_parallel_index_builds: Max number of indexes re-created at a time. See batch_insert_to_postgres.
+    :param maintenance_work_mem_budget: Total maintenance_work_mem in bytes shared by the indexes re-created at a time.
+    :param disable_constraints_and_triggers: This being True, drops the foreign keys and the non-pk unique constraints
+    of the table and disables its user triggers during the load. See batch_insert_to_postgres.
+    :param fast_mode: This being True, the table is switched to UNLOGGED for the load and back to LOGGED afterwards.
+    See batch_insert_to_postgres.
+    :param partition_routing: This being True, the rows are COPYed straight into the partitions of a partitioned
+    table. See batch_insert_to_postgres.
+    :return: The LoadMetrics of the load
     """
     if not data_generator:
         raise Exception("Invalid data input!")
 
-    fast_load_hack = FastLoadHack(pg_conn_details=pg_conn_details, table_name=table_name)
-    indexes = {}
-    if drop_and_create_index:
-        indexes = fast_load_hack.get_indexes()
-        logger.debug(f'Indexes to be dropped and re-created: {indexes.keys()}')
-        fast_load_hack.drop_indexes(list(indexes.keys()))
+    if not isinstance(max_tasks_per_process, int) or max_tasks_per_process < 1:
+        raise Exception("Max tasks per process must be a positive integer!")
 
-    try:
-        loop = asyncio.get_running_loop()
-        with ProcessPoolExecutor(max_workers=no_of_processes) as executor:
-            tasks = []
-            for df in data_generator:
-                tasks.append(
-                    loop.run_in_executor(
-                        executor,
-                        run_batch_task,
-                        df,
-                        batch_size,
-                        pg_conn_details,
-                        table_name,
-                        min_conn_pool_size,
-                        max_conn_pool_size
-                    )
-                )
-        await asyncio.gather(*tasks)
-    except Exception as e:
-        raise e
-    finally:
-        if drop_and_create_index:
-            fast_load_hack.create_indexes(list(indexes.values()), use_multi_process=True)
+    fast_load_hack = FastLoadHack(
+        pg_conn_details=pg_conn_details, table_name=table_name, max_parallel_index_builds=max_parallel_index_builds,
+        maintenance_work_mem_budget=maintenance_work_mem_budget
+    )
+    # Shared memory block of every in-flight task, released as soon as the task is done
+    shared_memory_blocks = {}
+    metrics = metrics or LoadMetrics()
+
+    def complete(done_tasks):
+        for done_task in done_tasks:
+            shm = shared_memory_blocks.pop(done_task, None)
+            if shm:
+                release_shared_memory(shm)
+        for done_task in done_tasks:
+            metrics.extend(done_task.result())
+
+    loop = asyncio.get_running_loop()
+    batch_options = {
+        "copy_format": copy_format,
+        "batch_bytes": batch_bytes,
+        "adaptive_concurrency": adaptive_concurrency,
+        "load_ledger": load_ledger,
+        "commit_every_batches": commit_every_batches,
+        "commit_every_bytes": commit_every_bytes,
+        "partition_routing": partition_routing
+    }
+    load_config = (
+        batch_size, pg_conn_details, table_name, min_conn_pool_size, max_conn_pool_size, batch_options
+    )
+    executor_kwargs = {}
+    if persistent_workers:
+        executor_kwargs = {"initializer": init_loader_worker, "initargs": load_config}
+
+    with prepare_table_for_load(
+            fast_load_hack, metrics, drop_and_create_index, disable_constraints_and_triggers, fast_mode, True
+    ):
+        try:
+            with ProcessPoolExecutor(max_workers=no_of_processes, **executor_kwargs) as executor:
+                # Only a bounded number of dfs is pulled from the generator and queued in the executor at a
+                # time. The next df is pulled once a task completes, which keeps the memory flat irrespective of
+                # the input size.
+                max_in_flight = max_tasks_per_process * (no_of_processes or os.cpu_count() or 1)
+                pending = set()
+                try:
+                    data_iterator = iter(data_generator)
+                    while True:
+                        if len(pending) >= max_in_flight:
+                            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                            complete(done)
+
+                        df = next(data_iterator, None)
+                        if df is None:
+                            break
+
+                        data = df
+                        if use_shared_memory:
+                            data, shm = to_shared_memory(df)
+
+                        if persistent_workers:
+                            task = loop.run_in_executor(executor, run_loader_worker_task, data, use_shared_memory)
+                        else:
+                            task_func = run_shared_memory_batch_task if use_shared_memory else run_batch_task
+                            task = loop.run_in_executor(executor, task_func, data, *load_config)
+                        if use_shared_memory:
+                            shared_memory_blocks[task] = shm
+                        pending.add(task)
+
+                    if pending:
+                        done, pending = await asyncio.wait(pending)
+                        complete(done)
+                except BaseException as e:
+                    # Dropping the queued tasks. The running ones are awaited when leaving the executor context.
+                    for task in pending:
+                        task.cancel()
+                    raise e
+        finally:
+            for shm in shared_memory_blocks.values():
+                release_shared_memory(shm)
+    return metrics
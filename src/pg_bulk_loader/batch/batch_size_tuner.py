@@ -0,0 +1,151 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+GROWING = "growing"
+SHRINKING = "shrinking"
+REFINING = "refining"
+CONVERGED = "converged"
+
+
+class BatchSizeTuner:
+    """
+    Hill climbing search of the batch size with the best per batch throughput (rows/s).
+
+    The batch size is multiplied by growth_factor as long as the throughput improves by more than tolerance. When the
+    first growth step doesn't improve it, the batch size is divided by growth_factor instead, as long as the
+    throughput improves. After the first step without improvement, the midpoint between the best size and the last
+    one is tried once, and the best of all the tried sizes is kept from then on. Every size is measured over
+    samples_per_step batches.
+    The batch size never exceeds max_batch_bytes, converted to rows with the observed average row size.
+    """
+
+    def __init__(
+            self,
+            initial_batch_size: int = 10000,
+            min_batch_size: int = 1000,
+            max_batch_size: int = 1000000,
+            max_batch_bytes: int = 256 * 1024 * 1024,
+            growth_factor: int = 2,
+            samples_per_step: int = 2,
+            tolerance: float = 0.05
+    ):
+        """
+        :param initial_batch_size: Batch size of the first batches
+        :param min_batch_size: Lower bound of the batch size
+        :param max_batch_size: Upper bound of the batch size
+        :param max_batch_bytes: Memory ceiling of a batch in bytes
+        :param growth_factor: Factor the batch size is multiplied or divided by while the throughput improves
+        :param samples_per_step: Number of batches a batch size is measured with
+        :param tolerance: Relative throughput gain below which a bigger batch size is not considered better
+        """
+        if not min_batch_size or min_batch_size > max_batch_size:
+            raise Exception("Invalid batch size bounds!")
+
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.growth_factor = growth_factor
+        self.samples_per_step = samples_per_step
+        self.tolerance = tolerance
+
+        self._samples = []
+        self._total_rows = 0
+        self._total_bytes = 0
+
+        self.batch_size = self._bounded(initial_batch_size)
+        # Batch size of the first measured step, the search shrinks when growing from it doesn't pay off
+        self._start_batch_size = None
+        self.phase = GROWING
+        self.best_batch_size = None
+        self.best_throughput = 0.0
+        self.history = []
+
+    def _bounded(self, batch_size: int):
+        max_batch_size = self.max_batch_size
+        if self.max_batch_bytes and self._average_row_bytes():
+            max_batch_size = min(max_batch_size, int(self.max_batch_bytes / self._average_row_bytes()))
+        return max(self.min_batch_size, min(max_batch_size, int(batch_size)))
+
+    def _average_row_bytes(self):
+        if not self._total_rows:
+            return 0
+        return self._total_bytes / self._total_rows
+
+    def next_batch_size(self):
+        return self.batch_size
+
+    def record(self, rows: int, size_in_bytes: int, seconds: float):
+        """
+        Records the measurement of a loaded batch and moves the batch size once the current step is measured.
+        Batches with another number of rows than the current batch size (created before the last move, or the
+        smaller last batch of a DataFrame) are kept in the history but don't count for the current step.
+
+        :param rows: Number of rows of the batch
+        :param size_in_bytes: Encoded size of the batch
+        :param seconds: Time taken to load the batch
+        """
+        seconds = max(seconds, 1e-9)
+        self._total_rows += rows
+        self._total_bytes += size_in_bytes
+        self.history.append({
+            "batch_size": self.batch_size,
+            "rows": rows,
+            "bytes": size_in_bytes,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds,
+            "bytes_per_second": size_in_bytes / seconds,
+            "phase": self.phase,
+        })
+
+        if self.phase == CONVERGED or rows != self.batch_size:
+            return
+
+        self._samples.append(rows / seconds)
+        if len(self._samples) < self.samples_per_step:
+            return
+
+        throughput = sum(self._samples) / len(self._samples)
+        self._samples = []
+        self._move(throughput)
+
+    def _move(self, throughput: float):
+        improved = throughput > self.best_throughput * (1 + self.tolerance)
+        if self._start_batch_size is None:
+            self._start_batch_size = self.batch_size
+        if improved or self.best_batch_size is None:
+            self.best_batch_size, self.best_throughput = self.batch_size, throughput
+
+        previous_batch_size = self.batch_size
+        if self.phase == GROWING and improved:
+            self.batch_size = self._bounded(self.batch_size * self.growth_factor)
+            if self.batch_size == previous_batch_size:
+                # The upper bound is reached
+                self.phase = CONVERGED
+        elif self.phase == GROWING and self.best_batch_size == self._start_batch_size:
+            # Growing doesn't pay off from the first size, the smaller sizes are tried
+            self.phase = SHRINKING
+            self.batch_size = self._bounded(self.best_batch_size // self.growth_factor)
+            if self.batch_size == self.best_batch_size:
+                # The lower bound is reached
+                self.phase = CONVERGED
+        elif self.phase == SHRINKING and improved:
+            self.batch_size = self._bounded(self.batch_size // self.growth_factor)
+            if self.batch_size == previous_batch_size:
+                # The lower bound is reached
+                self.phase = CONVERGED
+        elif self.phase in (GROWING, SHRINKING):
+            self.phase = REFINING
+            self.batch_size = self._bounded((self.best_batch_size + self.batch_size) // 2)
+            if self.batch_size in (self.best_batch_size, previous_batch_size):
+                self.phase = CONVERGED
+                self.batch_size = self.best_batch_size
+        else:
+            self.phase = CONVERGED
+            self.batch_size = self._bounded(self.best_batch_size)
+
+        if self.batch_size != previous_batch_size or self.phase == CONVERGED:
+            logger.debug(
+                f"Batch size moved from {previous_batch_size} to {self.batch_size} ({self.phase}), "
+                f"best throughput: {self.best_throughput:.0f} rows/s at batch size {self.best_batch_size}"
+            )
@@ -0,0 +1,125 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) replacement of asyncio.Semaphore for the in-flight COPY streams.
+
+    The throughput of all the batches completed in a window of `limit` batches is compared with the one of the
+    previous window. The limit is increased by one while the throughput keeps improving by more than tolerance, and
+    multiplied by decrease_factor when the latency per row spikes above latency_spike_factor times the best latency
+    seen so far, or when a connection can't be acquired from the pool in time.
+    """
+
+    def __init__(
+            self,
+            initial_limit: int,
+            max_limit: int,
+            min_limit: int = 1,
+            decrease_factor: float = 0.5,
+            tolerance: float = 0.05,
+            latency_spike_factor: float = 2.0
+    ):
+        """
+        :param initial_limit: Number of concurrent streams to start with
+        :param max_limit: Upper bound of the concurrent streams, usually the max size of the connection pool
+        :param min_limit: Lower bound of the concurrent streams
+        :param decrease_factor: Factor the limit is multiplied with on congestion
+        :param tolerance: Relative throughput gain below which the limit is not increased
+        :param latency_spike_factor: Latency per row, relative to the best one seen, considered as a spike
+        """
+        if not min_limit or min_limit > max_limit:
+            raise Exception("Invalid concurrency limits!")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(max_limit, initial_limit))
+        self.decrease_factor = decrease_factor
+        self.tolerance = tolerance
+        self.latency_spike_factor = latency_spike_factor
+        self.in_flight = 0
+        self.history = []
+
+        self._condition = None
+        self._best_latency = None
+        self._previous_throughput = None
+        self._window_start_time = None
+        self._window_rows = 0
+        self._window_batches = 0
+        self._window_spike = False
+
+    def _get_condition(self):
+        # Created lazily to be bound to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def __aenter__(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            if self._window_start_time is None:
+                self._window_start_time = time.perf_counter()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    async def record_batch(self, rows: int, seconds: float):
+        """
+        Records a completed batch and re-evaluates the limit once the window is complete.
+
+        :param rows: Number of rows of the batch
+        :param seconds: Time taken to load the batch, without the time waited for a free slot
+        """
+        latency = seconds / max(rows, 1)
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+        elif latency > self._best_latency * self.latency_spike_factor:
+            self._window_spike = True
+
+        self._window_rows += rows
+        self._window_batches += 1
+        if self._window_batches < self.limit:
+            return
+
+        now = time.perf_counter()
+        throughput = self._window_rows / max(now - self._window_start_time, 1e-9)
+        if self._window_spike:
+            self._decrease("latency spike", throughput)
+        elif self._previous_throughput is None or throughput > self._previous_throughput * (1 + self.tolerance):
+            await self._increase(throughput)
+
+        self._previous_throughput = throughput
+        self._window_start_time = now
+        self._window_rows = 0
+        self._window_batches = 0
+        self._window_spike = False
+
+    def record_timeout(self):
+        self._decrease("pool timeout")
+
+    async def _increase(self, throughput: float):
+        if self.limit >= self.max_limit:
+            return
+        self._set_limit(self.limit + 1, "throughput improved", throughput)
+        condition = self._get_condition()
+        async with condition:
+            condition.notify_all()
+
+    def _decrease(self, reason: str, throughput: float = None):
+        self._set_limit(max(self.min_limit, int(self.limit * self.decrease_factor)), reason, throughput)
+
+    def _set_limit(self, limit: int, reason: str, throughput: float = None):
+        if limit == self.limit:
+            return
+        logger.debug(f"Concurrency limit changed from {self.limit} to {limit} ({reason})")
+        self.history.append({"limit": limit, "previous_limit": self.limit, "reason": reason, "throughput": throughput})
+        self.limit = limit
@@ -0,0 +1,199 @@
+import struct
+import numpy as np
+import pandas as pd
+
+# Microseconds and days between the unix epoch and the postgres epoch (2000-01-01)
+PG_EPOCH_MICROSECONDS = 946684800000000
+PG_EPOCH_DAYS = 10957
+
+BINARY_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+BINARY_COPY_TRAILER = struct.pack(">h", -1)
+
+# Postgres type name -> big-endian numpy dtype of its binary wire representation
+BINARY_TYPES = {
+    "int2": np.dtype(">i2"),
+    "int4": np.dtype(">i4"),
+    "int8": np.dtype(">i8"),
+    "float4": np.dtype(">f4"),
+    "float8": np.dtype(">f8"),
+    "bool": np.dtype("u1"),
+    "date": np.dtype(">i4"),
+    "timestamp": np.dtype(">i8"),
+    "timestamptz": np.dtype(">i8"),
+}
+
+
+class CopyEncoder:
+    """
+    Base class of the encoders. Sub-classes implement `encode_rows` and may surround the rows with a header and a
+    trailer.
+    """
+    copy_options = None
+    header = ""
+    trailer = ""
+
+    # Number of rows encoded in the first chunk, before the encoded row size is known
+    probe_rows = 256
+
+    def encode_rows(self, data_df: pd.DataFrame):
+        raise NotImplementedError
+
+    def encode(self, data_df: pd.DataFrame):
+        return self.header + self.encode_rows(data_df) + self.trailer
+
+    def initial_rows_per_chunk(self, chunk_size: int):
+        return self.probe_rows
+
+    def iter_chunks(self, data_df: pd.DataFrame, chunk_size: int):
+        """
+        Encodes the data_df lazily so that only one chunk of roughly chunk_size bytes is held in memory at a time.
+        The number of rows per chunk is re-estimated from the size of the previously encoded chunk.
+
+        :param data_df: Data to be encoded
+        :param chunk_size: Targeted size of a chunk in bytes
+        """
+        if self.header:
+            yield self.header
+
+        total_rows = data_df.shape[0]
+        rows_per_chunk = self.initial_rows_per_chunk(chunk_size)
+        start = 0
+        while start < total_rows:
+            end = min(total_rows, start + rows_per_chunk)
+            chunk = self.encode_rows(data_df.iloc[start:end])
+            yield chunk
+            rows_per_chunk = max(1, int(chunk_size * (end - start) / max(len(chunk), 1)))
+            start = end
+
+        if self.trailer:
+            yield self.trailer
+
+
+class CsvCopyEncoder(CopyEncoder):
+    """
+    Encodes a DataFrame into the CSV format understood by `COPY ... FROM STDIN WITH (FORMAT CSV)`
+    """
+    copy_options = "FORMAT CSV, DELIMITER ','"
+
+    def encode_rows(self, data_df: pd.DataFrame):
+        return data_df.to_csv(header=False, index=False)
+
+
+class BinaryCopyEncoder(CopyEncoder):
+    """
+    Encodes a DataFrame into the postgres binary COPY format straight from the numpy buffers of its columns.
+    Only fixed width types (see BINARY_TYPES) are supported. Use `unsupported_columns` to find out whether a
+    DataFrame can be encoded before creating an encoder for it.
+    """
+    copy_options = "FORMAT BINARY"
+    header = BINARY_COPY_HEADER
+    trailer = BINARY_COPY_TRAILER
+
+    def __init__(self, pg_types: list[str]):
+        """
+        :param pg_types: Postgres type names of the target columns, in the same order as the DataFrame columns
+        """
+        self.pg_types = pg_types
+        fields = [("field_count", ">i2")]
+        for position, pg_type in enumerate(pg_types):
+            fields.append((f"length_{position}", ">i4"))
+            fields.append((f"value_{position}", BINARY_TYPES[pg_type]))
+        self.row_dtype = np.dtype(fields)
+
+    @staticmethod
+    def unsupported_columns(data_df: pd.DataFrame, pg_types: list[str]):
+        """
+        :param data_df: Data to be encoded
+        :param pg_types: Postgres type names of the target columns, in the same order as the DataFrame columns
+        :return: Names of the columns which cannot be encoded in binary format
+        """
+        unsupported = []
+        for col_name, pg_type in zip(data_df.columns, pg_types):
+            if not _is_binary_compatible(data_df[col_name].dtype, pg_type):
+                unsupported.append(col_name)
+        return unsupported
+
+    def initial_rows_per_chunk(self, chunk_size: int):
+        # Rows without nulls have exactly the size of the record, so it is an upper bound of the encoded row size
+        return max(1, chunk_size // self.row_dtype.itemsize)
+
+    def encode_rows(self, data_df: pd.DataFrame):
+        """
+        Encodes the tuples of the data_df without the binary COPY header and trailer.
+        Every row is laid out as a fixed width numpy record. The value bytes of the null cells are removed
+        afterwards with a single boolean mask over the whole buffer.
+        """
+        rows = np.empty(data_df.shape[0], dtype=self.row_dtype)
+        rows["field_count"] = len(self.pg_types)
+
+        null_masks = []
+        for position, pg_type in enumerate(self.pg_types):
+            values, null_mask = _to_binary_values(data_df.iloc[:, position], pg_type)
+            value_size = BINARY_TYPES[pg_type].itemsize
+            rows[f"value_{position}"] = values
+            if null_mask is None:
+                rows[f"length_{position}"] = value_size
+            else:
+                rows[f"length_{position}"] = np.where(null_mask, -1, value_size)
+                null_masks.append((self.row_dtype.fields[f"value_{position}"][1], value_size, null_mask))
+
+        if not null_masks:
+            return rows.tobytes()
+
+        raw = rows.view(np.uint8).reshape(rows.shape[0], self.row_dtype.itemsize)
+        keep = np.ones(raw.shape, dtype=bool)
+        for offset, value_size, null_mask in null_masks:
+            keep[null_mask, offset: offset + value_size] = False
+        return raw[keep].tobytes()
+
+
+def _is_binary_compatible(dtype, pg_type: str):
+    if pg_type in ("int2", "int4", "int8"):
+        # uint64 values may not fit into any postgres integer type
+        return pd.api.types.is_integer_dtype(dtype) and np.dtype(getattr(dtype, "numpy_dtype", dtype)) != np.uint64
+    if pg_type in ("float4", "float8"):
+        return pd.api.types.is_float_dtype(dtype) or pd.api.types.is_integer_dtype(dtype)
+    if pg_type == "bool":
+        return pd.api.types.is_bool_dtype(dtype)
+    if pg_type in ("date", "timestamp"):
+        # tz-aware values would be shifted to UTC by the encoder but are truncated by postgres in CSV format
+        return pd.api.types.is_datetime64_dtype(dtype)
+    if pg_type == "timestamptz":
+        # naive values are interpreted in the session time zone by postgres, so only tz-aware values are exact
+        return isinstance(dtype, pd.DatetimeTZDtype)
+    return False
+
+
+def _to_binary_values(series: pd.Series, pg_type: str):
+    """
+    :return: Tuple of the numpy values in the wire representation of pg_type and the null mask (None without nulls)
+    """
+    null_mask = series.isna().to_numpy()
+    if not null_mask.any():
+        null_mask = None
+
+    if pg_type in ("date", "timestamp", "timestamptz"):
+        if isinstance(series.dtype, pd.DatetimeTZDtype):
+            series = series.dt.tz_convert("UTC").dt.tz_localize(None)
+        unit = "D" if pg_type == "date" else "us"
+        values = series.to_numpy().astype(f"datetime64[{unit}]").view("i8")
+        values = values - (PG_EPOCH_DAYS if pg_type == "date" else PG_EPOCH_MICROSECONDS)
+    elif pg_type == "bool":
+        values = series.to_numpy(dtype=bool, na_value=False)
+    else:
+        kind = "f8" if pg_type in ("float4", "float8") else "i8"
+        values = series.to_numpy(dtype=kind, na_value=0)
+        if pd.api.types.is_float_dtype(series.dtype):
+            # NaN is written as NULL in CSV format as well
+            null_mask = np.isnan(values) if null_mask is None else null_mask | np.isnan(values)
+            if not null_mask.any():
+                null_mask = None
+
+    if null_mask is not None:
+        values = np.where(null_mask, 0, values)
+
+    if pg_type in ("int2", "int4", "date"):
+        limits = np.iinfo(BINARY_TYPES[pg_type])
+        if values.size and (values.min() < limits.min or values.max() > limits.max):
+            raise Exception(f"Value of column {series.name} is out of range for type {pg_type}!")
+    return values, null_mask
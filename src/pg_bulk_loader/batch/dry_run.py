@@ -0,0 +1,189 @@
+import heapq
+import logging
+import contextlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+from .load_metrics import LoadMetrics, LOADED
+
+logger = logging.getLogger(__name__)
+
+
+class NullCopy:
+    """
+    Sink of a COPY in a dry run. The written chunks are dropped.
+    """
+
+    async def write(self, data):
+        pass
+
+
+class NullCursor:
+
+    def __init__(self, column_types: dict):
+        self.column_types = column_types
+
+    async def execute(self, query: str, params=None):
+        pass
+
+    async def fetchall(self):
+        # Only the column types of the table are queried, see BatchInsert.get_column_types
+        return list(self.column_types.items())
+
+    @contextlib.asynccontextmanager
+    async def copy(self, query: str):
+        yield NullCopy()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class NullConnection:
+
+    def __init__(self, column_types: dict):
+        self.column_types = column_types
+
+    def cursor(self):
+        return NullCursor(self.column_types)
+
+    async def execute(self, query: str, params=None):
+        pass
+
+
+class NullConnectionPool:
+    """
+    Stands in for the connection pool in a dry run, so that the batches go through the whole partitioning and
+    encoding pipeline without any connection being opened.
+    """
+
+    def __init__(self, column_types: dict = None):
+        """
+        :param column_types: Mapping of the column names to the postgres type names reported for the table
+        """
+        self.column_types = column_types or {}
+
+    @contextlib.asynccontextmanager
+    async def connection(self, timeout: float = None):
+        yield NullConnection(self.column_types)
+
+
+def infer_pg_types(data_df: pd.DataFrame):
+    """
+    :return: Postgres type names matching the dtypes of the data_df, used by a dry run in binary format instead of
+    the types of the table. None for the columns without binary counterpart.
+    """
+    pg_types = []
+    for col_name in data_df.columns:
+        dtype = data_df[col_name].dtype
+        if isinstance(dtype, pd.DatetimeTZDtype):
+            pg_types.append("timestamptz")
+        elif pd.api.types.is_datetime64_dtype(dtype):
+            pg_types.append("timestamp")
+        elif pd.api.types.is_bool_dtype(dtype):
+            pg_types.append("bool")
+        elif pd.api.types.is_integer_dtype(dtype):
+            # Unsigned integers need the signed type of twice their size
+            size = np.dtype(dtype.type).itemsize * (2 if pd.api.types.is_unsigned_integer_dtype(dtype) else 1)
+            pg_types.append({1: "int2", 2: "int2", 4: "int4"}.get(size, "int8"))
+        elif pd.api.types.is_float_dtype(dtype):
+            pg_types.append("float4" if np.dtype(dtype.type).itemsize == 4 else "float8")
+        else:
+            pg_types.append(None)
+    return pg_types
+
+
+def start_memory_tracing():
+    """
+    Starts measuring the memory allocated by the dry run with tracemalloc. When the caller already traces the
+    allocations, only the traced peak is reset.
+    :return: State to be passed to stop_memory_tracing
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    return started, tracemalloc.get_traced_memory()[0]
+
+
+def stop_memory_tracing(state):
+    """
+    :return: Peak of the memory allocated since start_memory_tracing in bytes, on top of the memory in use then
+    """
+    started, start_size = state
+    peak_size = tracemalloc.get_traced_memory()[1]
+    if started:
+        tracemalloc.stop()
+    return max(peak_size - start_size, 0)
+
+
+def project_wall_time(batch_times: list, concurrency: int):
+    """
+    :param batch_times: Time every batch takes on the client, in the order the batches are loaded
+    :param concurrency: Number of batches loaded at a time
+    :return: Time the batches take when every batch starts on the first free connection and postgres keeps up with
+    the client
+    """
+    finish_times = [0.0] * max(concurrency or 1, 1)
+    for batch_time in batch_times:
+        heapq.heapreplace(finish_times, finish_times[0] + batch_time)
+    return max(finish_times)
+
+
+def merge_dry_run_reports(reports: list, wall_time: float):
+    """
+    :return: Report of a dry run over several DataFrames, from the reports of every DataFrame
+    """
+    rows = sum(report["rows"] for report in reports)
+    size_in_bytes = sum(report["bytes"] for report in reports)
+    wall_time = max(wall_time, 1e-9)
+    return {
+        "batches": sum(report["batches"] for report in reports),
+        "rows": rows,
+        "bytes": size_in_bytes,
+        "concurrency": max((report["concurrency"] for report in reports), default=None),
+        "encode_time": sum(report["encode_time"] for report in reports),
+        "rows_per_second": rows / wall_time,
+        "bytes_per_second": size_in_bytes / wall_time,
+        "peak_memory_bytes": max((report["peak_memory_bytes"] for report in reports), default=0),
+        "wall_time": wall_time,
+        # The DataFrames are loaded one after the other
+        "projected_wall_time": sum(report["projected_wall_time"] for report in reports),
+    }
+
+
+def create_dry_run_report(metrics: LoadMetrics, wall_time: float, concurrency: int, peak_memory: int):
+    """
+    :param metrics: Metrics of the batches encoded by the dry run
+    :param wall_time: Time the dry run took
+    :param concurrency: Number of batches loaded at a time by the load, the max size of the pool with an adaptive
+    concurrency
+    :param peak_memory: Peak of the memory allocated by the dry run in bytes, see stop_memory_tracing
+    :return: Client side throughput of the load. The projected wall time is the time the load takes at the
+    concurrency when postgres keeps up with the client, from the time every batch was encoded and streamed into the
+    null sink, see project_wall_time. The COPY of the batches by postgres is not included, hence it is a lower bound
+    of the real load time.
+    """
+    batches = sorted(
+        [batch for batch in metrics.batches if batch.status == LOADED], key=lambda batch: batch.range_start
+    )
+    rows = sum(batch.rows for batch in batches)
+    size_in_bytes = sum(batch.bytes for batch in batches)
+    wall_time = max(wall_time, 1e-9)
+    return {
+        "batches": len(batches),
+        "rows": rows,
+        "bytes": size_in_bytes,
+        "concurrency": concurrency,
+        "encode_time": sum(batch.encode_time for batch in batches),
+        "rows_per_second": rows / wall_time,
+        "bytes_per_second": size_in_bytes / wall_time,
+        "peak_memory_bytes": peak_memory,
+        "wall_time": wall_time,
+        "projected_wall_time": project_wall_time(
+            [batch.encode_time + batch.copy_time for batch in batches], concurrency
+        ),
+    }
@@ -1,17 +1,81 @@
+import re
+import logging
 from .pg_connection_detail import PgConnectionDetail
-from concurrent.futures import ProcessPoolExecutor
+from .index_build_scheduler import IndexBuildScheduler
 from ..utils.time_it_decorator import time_it
+from ..utils.constants import (
+    DEFAULT_MAX_PARALLEL_INDEX_BUILDS, INDEX_INSERT_COST_FACTOR, INDEX_RANDOM_IO_COST_FACTOR, DEFAULT_ROWS_PER_PAGE
+)
+
+logger = logging.getLogger(__name__)
+
+# ENABLE TRIGGER clause restoring the firing mode of a trigger, by pg_trigger.tgenabled
+TRIGGER_FIRING_MODES = {"O": "TRIGGER", "A": "ALWAYS TRIGGER", "R": "REPLICA TRIGGER"}
+
+# Max length of a postgres identifier
+MAX_IDENTIFIER_LENGTH = 63
+# Identifier as printed by pg_get_indexdef and pg_get_triggerdef, quoted or not, optionally schema qualified
+IDENTIFIER_PATTERN = r'(?:"(?:[^"]|"")*"|[^\s."]+)'
+QUALIFIED_NAME_PATTERN = rf"{IDENTIFIER_PATTERN}(?:\.{IDENTIFIER_PATTERN})?"
+# Definition of an index of a partitioned table, which only creates the index of the partitioned table itself
+PARTITIONED_INDEX_PATTERN = re.compile(
+    rf"^(CREATE (?:UNIQUE )?INDEX )({IDENTIFIER_PATTERN}) ON ONLY {QUALIFIED_NAME_PATTERN}( .*)$", re.S
+)
+
+
+def quote_identifier(name: str):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def unquote_identifier(name: str):
+    if name.startswith('"'):
+        return name[1:-1].replace('""', '"')
+    return name
+
+
+def get_index_costs(table_rows: float, incoming_rows: int, index_size: int, cache_size: int):
+    """
+    Both costs are in rows processed by an index build. Re-creating the index sorts all the rows of the table,
+    the loaded ones included. Keeping it costs one B-tree insert per loaded row, which is INDEX_INSERT_COST_FACTOR
+    times as expensive, plus INDEX_RANDOM_IO_COST_FACTOR when the index is larger than the cache. The log(n) factor
+    of the sort and of the B-tree descent is the same on both sides and left out.
+
+    :param table_rows: Estimated number of rows in the table before the load
+    :param incoming_rows: Number of rows to load
+    :param index_size: Size of the index in bytes
+    :param cache_size: Size of shared_buffers in bytes
+    :return: Cost of keeping the index during the load, cost of dropping and re-creating it
+    """
+    insert_cost_factor = INDEX_INSERT_COST_FACTOR
+    if index_size > cache_size:
+        insert_cost_factor += INDEX_RANDOM_IO_COST_FACTOR
+    return incoming_rows * insert_cost_factor, table_rows + incoming_rows
 
 
 class FastLoadHack:
 
-    def __init__(self, pg_conn_details: PgConnectionDetail, table_name: str):
+    def __init__(
+            self,
+            pg_conn_details: PgConnectionDetail,
+            table_name: str,
+            max_parallel_index_builds: int = DEFAULT_MAX_PARALLEL_INDEX_BUILDS,
+            maintenance_work_mem_budget: int = None
+    ):
+        """
+        :param max_parallel_index_builds: Max number of indexes re-created at a time with use_multi_process=True
+        :param maintenance_work_mem_budget: Total maintenance_work_mem in bytes shared by the indexes re-created at a
+        time. By default, every build gets the maintenance_work_mem of the index_session_settings.
+        """
         self.pg_conn_details = pg_conn_details
         self.schema = self.pg_conn_details.schema
         self.table_name = table_name
+        self.max_parallel_index_builds = max_parallel_index_builds
+        self.maintenance_work_mem_budget = maintenance_work_mem_budget
+        # Report of the last create_indexes call
+        self.index_builds = []
 
     @time_it
-    def set_table_unlogged(self):  # pragma: no cover
+    def set_table_unlogged(self):
         pg_session = self.pg_conn_details.get_psycopg_connection()
         try:
             with pg_session.cursor() as cursor:
@@ -22,7 +86,7 @@ class FastLoadHack:
             pg_session.close()
 
     @time_it
-    def set_table_logged(self):  # pragma: no cover
+    def set_table_logged(self):
         pg_session = self.pg_conn_details.get_psycopg_connection()
         try:
             with pg_session.cursor() as cursor:
@@ -32,6 +96,52 @@ class FastLoadHack:
         finally:
             pg_session.close()
 
+    def is_table_logged(self):
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            with pg_session.cursor() as cursor:
+                query = "select relpersistence from pg_class where oid = to_regclass(%s)"
+                result = cursor.execute(query, (f"{self.schema}.{self.table_name}",)).fetchone()
+                if result is None:
+                    raise Exception(f"Table {self.schema}.{self.table_name} not found!")
+                return result[0] == "p"
+        finally:
+            pg_session.close()
+
+    def get_unlogged_blockers(self):
+        """
+        An UNLOGGED table is not replicated, so its content is lost for the replicas and the subscribers of its
+        publications, and it can't be referenced by the foreign key of a LOGGED table.
+
+        :return: The reasons why switching the table to UNLOGGED is unsafe, empty when it is safe
+        """
+        table = f"{self.schema}.{self.table_name}"
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            with pg_session.cursor() as cursor:
+                blockers = []
+                query = """
+                    select (select count(1) from pg_stat_replication) + (select count(1) from pg_replication_slots)
+                """
+                if cursor.execute(query).fetchone()[0]:
+                    blockers.append("the server has replicas or replication slots")
+
+                query = "select pubname from pg_publication_tables where schemaname = %s and tablename = %s"
+                publications = [row[0] for row in cursor.execute(query, (self.schema, self.table_name))]
+                if publications:
+                    blockers.append(f"the table is published by {publications}")
+
+                query = """
+                    select conname, conrelid::regclass::text from pg_constraint
+                    where contype = 'f' and confrelid = to_regclass(%(table)s) and conrelid != confrelid
+                """
+                foreign_keys = [f"{row[1]}.{row[0]}" for row in cursor.execute(query, {"table": table})]
+                if foreign_keys:
+                    blockers.append(f"the table is referenced by the foreign keys {foreign_keys}")
+                return blockers
+        finally:
+            pg_session.close()
+
     @time_it
     def drop_indexes(self, index_names: list[str]):
         if not index_names:
@@ -47,7 +157,8 @@ class FastLoadHack:
             pg_session.close()
 
     def create_index(self, index_query: str):
-        pg_session = self.pg_conn_details.get_psycopg_connection()
+        # The index builds get their own session settings, e.g. a larger maintenance_work_mem
+        pg_session = self.pg_conn_details.get_psycopg_connection(self.pg_conn_details.index_session_settings)
         try:
             with pg_session.cursor() as cursor:
                 cursor.execute(index_query)
@@ -56,14 +167,166 @@ class FastLoadHack:
             pg_session.close()
 
     @time_it
-    def create_indexes(self, index_queries: list[str], use_multi_process=False):
-        if use_multi_process:
-            with ProcessPoolExecutor() as executor:
-                for index_query in index_queries:
-                    executor.submit(self.create_index, index_query)
-        else:
-            for index_query in index_queries:
-                self.create_index(index_query)
+    def create_indexes(self, index_queries, use_multi_process=False, index_sizes: dict = None):
+        """
+        :param index_queries: Mapping of the index names to their CREATE INDEX queries, as returned by get_indexes,
+        or list of the queries
+        :param use_multi_process: This being True, up to max_parallel_index_builds indexes are created at a time
+        :param index_sizes: Mapping of the index names to their size in bytes before they were dropped, as returned by
+        get_index_sizes. The largest indexes are created first. The indexes of a partitioned table are created per
+        partition, see get_partition_index_queries.
+        :return: Duration and error of every index build. Raises once all the builds are done if any of them failed.
+        """
+        if not isinstance(index_queries, dict):
+            index_queries = {index_query: index_query for index_query in index_queries}
+
+        attach_queries = {}
+        if any(PARTITIONED_INDEX_PATTERN.match(index_query) for index_query in index_queries.values()):
+            parent_queries, index_queries, index_sizes, attach_queries = self.get_partition_index_queries(
+                index_queries, index_sizes
+            )
+            for parent_query in parent_queries:
+                self.create_index(parent_query)
+
+        scheduler = IndexBuildScheduler(
+            pg_conn_details=self.pg_conn_details,
+            max_parallel_builds=self.max_parallel_index_builds if use_multi_process else 1,
+            maintenance_work_mem_budget=self.maintenance_work_mem_budget
+        )
+        self.index_builds = scheduler.run(index_queries, index_sizes)
+        for build in self.index_builds:
+            logger.debug(f"Index build: {build}")
+
+        # The index of the partitioned table is valid once the indexes of all its partitions are attached
+        for build in self.index_builds:
+            if build["index"] in attach_queries and not build["error"]:
+                self.create_index(attach_queries[build["index"]])
+
+        failed_indexes = [build["index"] for build in self.index_builds if build["error"]]
+        if failed_indexes:
+            raise Exception(f"Failed to create the indexes {failed_indexes}!")
+        return self.index_builds
+
+    def get_partitions(self):
+        """
+        :return: Schema, name, kind and size in bytes of every partition of the table, empty when the table is not
+        partitioned
+        """
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            with pg_session.cursor() as cursor:
+                query = """
+                    select n.nspname, c.relname, c.relkind, pg_relation_size(c.oid) from pg_inherits i
+                    join pg_class c on c.oid = i.inhrelid join pg_namespace n on n.oid = c.relnamespace
+                    where i.inhparent = to_regclass(%s)
+                """
+                return cursor.execute(query, (f"{self.schema}.{self.table_name}",)).fetchall()
+        finally:
+            pg_session.close()
+
+    def get_partition_index_queries(self, index_queries: dict, index_sizes: dict = None):
+        """
+        Splits the indexes of a partitioned table, whose definitions only create the index of the table itself (ON
+        ONLY), into one index per partition. The partitions are then indexed in parallel, the largest first, and
+        their indexes are attached to the index of the table. For a table with sub-partitioned partitions, the
+        indexes are created on the whole table by one CREATE INDEX each.
+
+        :return: The queries creating the (still invalid) indexes of the table, the queries of the index builds with
+        their sizes, the size of a partition standing for the size of its index, and the ALTER INDEX ... ATTACH
+        PARTITION query of every partition index
+        """
+        partitions = self.get_partitions()
+        sub_partitioned = any(relkind == "p" for _, _, relkind, _ in partitions)
+        parent_queries, build_queries, build_sizes, attach_queries = [], {}, dict(index_sizes or {}), {}
+        for index_name, index_query in index_queries.items():
+            match = PARTITIONED_INDEX_PATTERN.match(index_query)
+            if not match or not partitions:
+                build_queries[index_name] = index_query
+            elif sub_partitioned:
+                build_queries[index_name] = index_query.replace(" ON ONLY ", " ON ", 1)
+            else:
+                parent_queries.append(index_query)
+                parent_index = f"{self.schema}.{match.group(2)}"
+                for schema, partition, _, size in partitions:
+                    name = quote_identifier(f"{partition}_{unquote_identifier(match.group(2))}"[:MAX_IDENTIFIER_LENGTH])
+                    partition_index = f"{quote_identifier(schema)}.{name}"
+                    build_queries[partition_index] = (
+                        f"{match.group(1)}{name} ON {quote_identifier(schema)}.{quote_identifier(partition)}"
+                        f"{match.group(3)}"
+                    )
+                    build_sizes[partition_index] = size
+                    attach_queries[partition_index] = f"ALTER INDEX {parent_index} ATTACH PARTITION {partition_index}"
+        return parent_queries, build_queries, build_sizes, attach_queries
+
+    def get_table_stats(self):
+        """
+        :return: Estimated number of rows and pages of the table from pg_class, and the size of shared_buffers in bytes
+        """
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            with pg_session.cursor() as cursor:
+                query = """
+                    select c.reltuples, c.relpages, pg_size_bytes(current_setting('shared_buffers'))
+                    from pg_class c join pg_namespace n on n.oid = c.relnamespace
+                    where n.nspname = %s and c.relname = %s
+                """
+                result = cursor.execute(query, (self.schema, self.table_name)).fetchone()
+                if result is None:
+                    raise Exception(f"Table {self.schema}.{self.table_name} not found!")
+                reltuples, relpages, cache_size = result
+                if reltuples < 0:
+                    # Never vacuumed or analyzed
+                    reltuples = relpages * DEFAULT_ROWS_PER_PAGE
+                return {"rows": reltuples, "pages": relpages, "cache_size": cache_size}
+        finally:
+            pg_session.close()
+
+    def get_indexes_to_rebuild(self, indexes: dict, index_sizes: dict, incoming_rows: int = None):
+        """
+        Decides per index whether dropping it and re-creating it after the load is cheaper than maintaining it
+        during the load, see get_index_costs. Every decision is logged.
+
+        :param indexes: Mapping of the index names to their CREATE INDEX queries, as returned by get_indexes
+        :param index_sizes: Mapping of the index names to their size in bytes, as returned by get_index_sizes
+        :param incoming_rows: Number of rows to load. When unknown, e.g. for a DataFrame generator, the indexes
+        are only dropped from an empty table.
+        :return: The indexes to drop and re-create
+        """
+        table_stats = self.get_table_stats()
+        indexes_to_rebuild = {}
+        for index_name, index_query in indexes.items():
+            if incoming_rows is None:
+                rebuild = table_stats["rows"] == 0
+                reason = f"unknown number of incoming rows, table of ~{table_stats['rows']:.0f} rows"
+            else:
+                keep_cost, rebuild_cost = get_index_costs(
+                    table_stats["rows"], incoming_rows, index_sizes.get(index_name, 0), table_stats["cache_size"]
+                )
+                rebuild = rebuild_cost < keep_cost
+                reason = (
+                    f"{incoming_rows} incoming rows, table of ~{table_stats['rows']:.0f} rows, "
+                    f"keep cost {keep_cost:.0f}, rebuild cost {rebuild_cost:.0f}"
+                )
+            logger.info(f"Index {index_name} is {'dropped and re-created' if rebuild else 'kept'} ({reason})")
+            if rebuild:
+                indexes_to_rebuild[index_name] = index_query
+        return indexes_to_rebuild
+
+    def get_index_sizes(self):
+        """
+        :return: Mapping of the index names of the table, prefixed by the schema, to their size in bytes
+        """
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            with pg_session.cursor() as cursor:
+                query = """
+                    select indexname, pg_relation_size(format('%%I.%%I', schemaname, indexname)::regclass)
+                    from pg_indexes where schemaname = %s and tablename = %s
+                """
+                results = cursor.execute(query, (self.schema, self.table_name))
+                return {f"{self.schema}.{result[0]}": result[1] for result in results}
+        finally:
+            pg_session.close()
 
     def get_indexes(self):
         pg_session = self.pg_conn_details.get_psycopg_connection()
@@ -81,3 +344,106 @@ class FastLoadHack:
                 return indexes
         finally:
             pg_session.close()
+
+    def get_constraints_and_triggers(self):
+        """
+        :return: Foreign keys and unique constraints (but the ones referenced by a foreign key) of the table with their
+        definitions, and its enabled user triggers with their firing mode
+        """
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            with pg_session.cursor() as cursor:
+                query = """
+                    select c.conname, c.contype, pg_get_constraintdef(c.oid), c.convalidated
+                    from pg_constraint c
+                    where c.conrelid = to_regclass(%(table)s) and (
+                        c.contype = 'f' or (c.contype = 'u' and not exists (
+                            select 1 from pg_constraint r where r.contype = 'f' and r.conindid = c.conindid
+                        ))
+                    )
+                    order by c.conname
+                """
+                table = f"{self.schema}.{self.table_name}"
+                foreign_keys, unique_constraints = {}, {}
+                for name, constraint_type, definition, validated in cursor.execute(query, {"table": table}):
+                    if constraint_type == "f":
+                        foreign_keys[name] = {"definition": definition, "validated": validated}
+                    else:
+                        unique_constraints[name] = {"definition": definition}
+
+                query = """
+                    select tgname, tgenabled from pg_trigger
+                    where tgrelid = to_regclass(%(table)s) and not tgisinternal and tgenabled != 'D'
+                    order by tgname
+                """
+                triggers = dict(cursor.execute(query, {"table": table}).fetchall())
+                return {"foreign_keys": foreign_keys, "unique_constraints": unique_constraints, "triggers": triggers}
+        finally:
+            pg_session.close()
+
+    @time_it
+    def disable_constraints_and_triggers(self):
+        """
+        Drops the foreign keys and the unique constraints of the table and disables its user triggers, so that they
+        are not checked or fired for every loaded row.
+
+        :return: The dropped constraints and disabled triggers, to be passed to restore_constraints_and_triggers
+        """
+        state = self.get_constraints_and_triggers()
+        table = f"{self.schema}.{self.table_name}"
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            with pg_session.cursor() as cursor:
+                for name in list(state["foreign_keys"]) + list(state["unique_constraints"]):
+                    cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {quote_identifier(name)}")
+                for name in state["triggers"]:
+                    cursor.execute(f"ALTER TABLE {table} DISABLE TRIGGER {quote_identifier(name)}")
+                pg_session.commit()
+        finally:
+            pg_session.close()
+        logger.debug(f"Disabled constraints and triggers: {state}")
+        return state
+
+    @time_it
+    def restore_constraints_and_triggers(self, state: dict):
+        """
+        Re-enables the triggers and re-adds the constraints returned by disable_constraints_and_triggers. The foreign
+        keys are added as NOT VALID and validated afterwards, one set-based check of the loaded rows per foreign key
+        instead of one check per row. A constraint which fails is logged and the others are restored regardless.
+        Raises once all of them are processed if any failed.
+        """
+        table = f"{self.schema}.{self.table_name}"
+        queries = []
+        for name, tg_enabled in state["triggers"].items():
+            queries.append(
+                (name, f"ALTER TABLE {table} ENABLE {TRIGGER_FIRING_MODES[tg_enabled]} {quote_identifier(name)}")
+            )
+        for name, constraint in state["unique_constraints"].items():
+            queries.append(
+                (name, f"ALTER TABLE {table} ADD CONSTRAINT {quote_identifier(name)} {constraint['definition']}")
+            )
+        for name, constraint in state["foreign_keys"].items():
+            definition = constraint["definition"]
+            if constraint["validated"]:
+                definition += " NOT VALID"
+            queries.append((name, f"ALTER TABLE {table} ADD CONSTRAINT {quote_identifier(name)} {definition}"))
+        for name, constraint in state["foreign_keys"].items():
+            if constraint["validated"]:
+                queries.append((name, f"ALTER TABLE {table} VALIDATE CONSTRAINT {quote_identifier(name)}"))
+
+        failed = []
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            for name, query in queries:
+                try:
+                    # One transaction per statement, so that a failure doesn't roll the others back
+                    pg_session.execute(query)
+                    pg_session.commit()
+                except Exception as e:
+                    pg_session.rollback()
+                    logger.error(f"Failed to restore {name} on {table}: {e}")
+                    failed.append(name)
+        finally:
+            pg_session.close()
+        if failed:
+            raise Exception(f"Failed to restore the constraints and triggers {failed}!")
@@ -0,0 +1,103 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .pg_connection_detail import PgConnectionDetail
+from ..utils.constants import DEFAULT_MAX_PARALLEL_INDEX_BUILDS
+
+logger = logging.getLogger(__name__)
+
+# Lowest value postgres accepts for maintenance_work_mem
+MIN_MAINTENANCE_WORK_MEM_KB = 1024
+
+
+class IndexBuildScheduler:
+    """
+    Runs CREATE INDEX queries on a bounded number of connections. The work is done by the server, so one thread per
+    connection is enough. The largest indexes are started first so that the longest builds don't end up running
+    alone at the end, and the maintenance_work_mem budget is shared by the builds running at the same time.
+    """
+
+    def __init__(
+            self,
+            pg_conn_details: PgConnectionDetail,
+            max_parallel_builds: int = DEFAULT_MAX_PARALLEL_INDEX_BUILDS,
+            maintenance_work_mem_budget: int = None
+    ):
+        """
+        :param pg_conn_details: Instance of PgConnectionDetail class which contains postgres connection details.
+        The index_session_settings are applied to the sessions of the builds.
+        :param max_parallel_builds: Max number of indexes built at a time
+        :param maintenance_work_mem_budget: Total maintenance_work_mem in bytes of the builds running at a time.
+        By default, every build gets the maintenance_work_mem of its session.
+        """
+        if not isinstance(max_parallel_builds, int) or max_parallel_builds <= 0:
+            raise Exception("Max parallel builds must be a positive integer!")
+        if maintenance_work_mem_budget is not None and (
+                not isinstance(maintenance_work_mem_budget, int) or maintenance_work_mem_budget <= 0
+        ):
+            raise Exception("Maintenance work mem budget must be a positive integer!")
+
+        self.pg_conn_details = pg_conn_details
+        self.max_parallel_builds = max_parallel_builds
+        self.maintenance_work_mem_budget = maintenance_work_mem_budget
+
+    def get_maintenance_work_mem(self, parallel_builds: int):
+        """
+        :param parallel_builds: Number of builds sharing the budget
+        :return: maintenance_work_mem of a build, None without budget
+        """
+        if self.maintenance_work_mem_budget is None:
+            return None
+        share = self.maintenance_work_mem_budget // parallel_builds // 1024
+        return f"{max(MIN_MAINTENANCE_WORK_MEM_KB, share)}kB"
+
+    def build_index(self, index_name: str, index_query: str, size: int, maintenance_work_mem: str = None):
+        session_settings = dict(self.pg_conn_details.index_session_settings)
+        if maintenance_work_mem:
+            session_settings["maintenance_work_mem"] = maintenance_work_mem
+
+        build = {
+            "index": index_name,
+            "size": size,
+            "maintenance_work_mem": maintenance_work_mem,
+            "duration": None,
+            "error": None,
+        }
+        start_time = time.perf_counter()
+        try:
+            pg_session = self.pg_conn_details.get_psycopg_connection(session_settings)
+            try:
+                with pg_session.cursor() as cursor:
+                    cursor.execute(index_query)
+                    pg_session.commit()
+            finally:
+                pg_session.close()
+        except Exception as e:
+            build["error"] = str(e)
+            logger.error(f"Failed to create the index {index_name}: {e}")
+        finally:
+            build["duration"] = time.perf_counter() - start_time
+        logger.debug(f"Index {index_name} created in {build['duration']:.4f}s")
+        return build
+
+    def run(self, indexes: dict, index_sizes: dict = None):
+        """
+        :param indexes: Mapping of the index names to their CREATE INDEX queries
+        :param index_sizes: Mapping of the index names to their size in bytes, e.g. before they were dropped.
+        The indexes of unknown size are built last.
+        :return: Report of every build, in the order they were started, with its duration and error if it failed
+        """
+        if not indexes:
+            return []
+
+        index_sizes = index_sizes or {}
+        index_names = sorted(indexes, key=lambda name: index_sizes.get(name, -1), reverse=True)
+        parallel_builds = min(self.max_parallel_builds, len(index_names))
+        # A build starts when another one is done, so never more than parallel_builds share the budget
+        maintenance_work_mem = self.get_maintenance_work_mem(parallel_builds)
+        with ThreadPoolExecutor(max_workers=parallel_builds) as executor:
+            futures = [
+                executor.submit(self.build_index, name, indexes[name], index_sizes.get(name), maintenance_work_mem)
+                for name in index_names
+            ]
+            return [future.result() for future in futures]
@@ -0,0 +1,188 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import datetime
+import numpy as np
+import pandas as pd
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+
+def get_row_hashes(data_df: pd.DataFrame):
+    """
+    :return: One 64-bit hash per row of the data_df, computed from the values of its columns
+    """
+    return pd.util.hash_pandas_object(data_df, index=False).to_numpy()
+
+
+def get_fingerprint(row_hashes: np.ndarray):
+    """
+    :return: Content fingerprint of a batch, from the hashes of its rows
+    """
+    return hashlib.blake2b(np.ascontiguousarray(row_hashes).tobytes(), digest_size=16).hexdigest()
+
+
+class LoadLedger:
+    """
+    Record of the batches of a load which are committed. A batch is identified by the target table, its row range
+    and the fingerprint of its content, so that a rerun of a failed load with resume=True only loads the batches
+    which are missing. The ranges of the rerun have to be the same as the ones of the failed load, hence a
+    ledger can't be used with batch_size="auto".
+    """
+
+    def __init__(self, load_id: str, resume: bool = False):
+        """
+        :param load_id: Identifier of the load, the same for every run of it
+        :param resume: This being True, the batches already recorded for load_id are skipped
+        """
+        if not load_id:
+            raise Exception("Load id cannot be empty!")
+        self.load_id = load_id
+        self.resume = resume
+        self._completed_batches = None
+
+    def get_entry(self, table_name: str, range_, fingerprint: str):
+        return {
+            "load_id": self.load_id,
+            "table_name": table_name,
+            "range_start": int(range_[0]),
+            "range_end": int(range_[1]),
+            "fingerprint": fingerprint,
+        }
+
+    @staticmethod
+    def get_key(entry: dict):
+        return entry["table_name"], entry["range_start"], entry["range_end"], entry["fingerprint"]
+
+    async def prepare(self, pool):
+        """
+        Called before every load. Reads the batches recorded for load_id once, when resuming.
+        """
+        if self.resume and self._completed_batches is None:
+            self._completed_batches = {self.get_key(entry) for entry in await self.read_entries(pool)}
+
+    def is_completed(self, entry: dict):
+        return self.resume and self.get_key(entry) in (self._completed_batches or ())
+
+    async def read_entries(self, pool):
+        raise NotImplementedError
+
+    async def record_in_transaction(self, pg_session, entry: dict):
+        """
+        Called with the connection of the COPY of the batch, before its transaction is committed.
+        """
+
+    async def record_committed(self, entry: dict):
+        """
+        Called once the transaction of the COPY of the batch is committed.
+        """
+        if self._completed_batches is not None:
+            self._completed_batches.add(self.get_key(entry))
+
+
+class FileLoadLedger(LoadLedger):
+    """
+    Ledger kept in a local JSON lines file. A batch is appended to the file right after its commit, so a crash in
+    between loads the batch again on resume.
+    """
+
+    def __init__(self, load_id: str, path: str, resume: bool = False):
+        """
+        :param load_id: Identifier of the load, the same for every run of it
+        :param path: Path of the ledger file, created on the first recorded batch
+        :param resume: This being True, the batches already recorded for load_id are skipped
+        """
+        super().__init__(load_id, resume)
+        self.path = path
+
+    async def read_entries(self, pool):
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path) as ledger_file:
+            for line in ledger_file:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of a process killed while writing it
+                    logger.warning(f"Skipping the corrupted ledger entry: {line}")
+                    continue
+                if entry["load_id"] == self.load_id:
+                    entries.append(entry)
+        return entries
+
+    def append_line(self, line: str):
+        # Lines are appended in one write, the file can be shared by the processes of a multi-process load
+        with open(self.path, "a") as ledger_file:
+            ledger_file.write(line + "\n")
+            ledger_file.flush()
+            os.fsync(ledger_file.fileno())
+
+    async def record_committed(self, entry: dict):
+        line = json.dumps({**entry, "loaded_at": datetime.datetime.now(datetime.timezone.utc).isoformat()})
+        # In a worker thread, so that the fsync doesn't block the other COPYs of the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.append_line, line)
+        await super().record_committed(entry)
+
+
+class TableLoadLedger(LoadLedger):
+    """
+    Ledger kept in a table of the target database. A batch is inserted into the ledger table in the transaction of
+    its COPY, so a batch is recorded if and only if its rows are committed.
+    """
+
+    def __init__(self, load_id: str, ledger_table: str = "public.pg_bulk_loader_ledger", resume: bool = False):
+        """
+        :param load_id: Identifier of the load, the same for every run of it
+        :param ledger_table: Schema qualified name of the ledger table, created if it doesn't exist
+        :param resume: This being True, the batches already recorded for load_id are skipped
+        """
+        super().__init__(load_id, resume)
+        self.ledger_table = ledger_table
+
+    async def create_ledger_table(self, pool):
+        query = f"""
+            CREATE TABLE IF NOT EXISTS {self.ledger_table} (
+                load_id varchar NOT NULL,
+                table_name varchar NOT NULL,
+                range_start int8 NOT NULL,
+                range_end int8 NOT NULL,
+                fingerprint varchar NOT NULL,
+                loaded_at timestamptz NOT NULL DEFAULT now(),
+                PRIMARY KEY (load_id, table_name, range_start, range_end, fingerprint)
+            )
+        """
+        try:
+            async with pool.connection(timeout=60) as pg_session:
+                await pg_session.execute(query)
+        except (psycopg.errors.UniqueViolation, psycopg.errors.DuplicateTable):
+            # Created at the same time by another process
+            pass
+
+    async def prepare(self, pool):
+        await self.create_ledger_table(pool)
+        await super().prepare(pool)
+
+    async def read_entries(self, pool):
+        query = f"""
+            select load_id, table_name, range_start, range_end, fingerprint from {self.ledger_table}
+            where load_id = %s
+        """
+        async with pool.connection(timeout=60) as pg_session:
+            async with pg_session.cursor() as acur:
+                await acur.execute(query, (self.load_id,))
+                columns = [column.name for column in acur.description]
+                return [dict(zip(columns, row)) for row in await acur.fetchall()]
+
+    async def record_in_transaction(self, pg_session, entry: dict):
+        query = f"""
+            INSERT INTO {self.ledger_table} (load_id, table_name, range_start, range_end, fingerprint)
+            VALUES (%(load_id)s, %(table_name)s, %(range_start)s, %(range_end)s, %(fingerprint)s)
+            ON CONFLICT (load_id, table_name, range_start, range_end, fingerprint) DO UPDATE SET loaded_at = now()
+        """
+        await pg_session.execute(query, entry)
@@ -0,0 +1,114 @@
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOADED = "loaded"
+FAILED = "failed"
+
+PERCENTILES = (50, 90, 99)
+
+# Disjoint parts of the time of a batch, the largest one tells what the load is bound by:
+# encode_wait_time - the COPY waits for the client to encode the rows (client CPU)
+# pool_wait_time - the batch waits for a free connection (connection pool size)
+# copy_time - the rows are streamed to postgres and committed (network / server)
+BOTTLENECKS = {"encode_wait_time": "encode", "pool_wait_time": "pool", "copy_time": "copy"}
+
+
+class BatchMetrics:
+    """
+    Measurements of the load of one batch. Times are in seconds.
+    """
+
+    def __init__(self, table_name: str, range_start: int, range_end: int):
+        self.table_name = table_name
+        self.range_start = range_start
+        self.range_end = range_end
+        self.rows = range_end - range_start
+        self.bytes = 0
+        self.encode_time = 0.0
+        self.encode_wait_time = 0.0
+        self.pool_wait_time = 0.0
+        self.copy_time = 0.0
+        self.total_time = 0.0
+        self.retries = 0
+        self.status = LOADED
+        self.error = None
+        # Set by the first attempt and when the batch is recorded
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class LoadMetrics:
+    """
+    Collector of the BatchMetrics of a load. Every recorded batch is passed to the callbacks, e.g. to export it
+    to a monitoring system, and summary() aggregates all of them.
+    """
+
+    def __init__(self, callbacks: list = None):
+        """
+        :param callbacks: Functions called with the BatchMetrics of every loaded or failed batch
+        """
+        self.callbacks = list(callbacks or [])
+        self.batches = []
+        # Duration and error of every index re-created after the load, see FastLoadHack.create_indexes
+        self.index_builds = []
+        # Time in seconds of the SET LOGGED rewrite of the table after a load in fast mode
+        self.set_logged_time = None
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def record(self, batch_metrics: BatchMetrics):
+        if batch_metrics.finished_at is None:
+            batch_metrics.finished_at = time.time()
+        self.batches.append(batch_metrics)
+        for callback in self.callbacks:
+            try:
+                callback(batch_metrics)
+            except Exception as e:
+                # Monitoring must not fail the load
+                logger.warning(f"Metrics callback {callback} failed: {e}")
+
+    def extend(self, load_metrics):
+        """
+        Records the batches of another collector, e.g. the one of a loader process.
+        """
+        for batch_metrics in load_metrics.batches:
+            self.record(batch_metrics)
+
+    def summary(self):
+        """
+        :return: Totals of the load and percentiles of the per batch times
+        """
+        loaded = [batch for batch in self.batches if batch.status == LOADED]
+        summary = {
+            "batches": len(loaded),
+            "failed_batches": len(self.batches) - len(loaded),
+            "rows": sum(batch.rows for batch in loaded),
+            "bytes": sum(batch.bytes for batch in loaded),
+            "retries": sum(batch.retries for batch in self.batches),
+        }
+        if not self.batches:
+            return summary
+
+        started_at = min(batch.started_at or batch.finished_at for batch in self.batches)
+        wall_time = max(max(batch.finished_at for batch in self.batches) - started_at, 1e-9)
+        summary["wall_time"] = wall_time
+        summary["rows_per_second"] = summary["rows"] / wall_time
+        summary["bytes_per_second"] = summary["bytes"] / wall_time
+
+        for name in ("encode_time", "encode_wait_time", "pool_wait_time", "copy_time", "total_time"):
+            values = np.array([getattr(batch, name) for batch in self.batches])
+            summary[name] = {
+                "total": float(values.sum()),
+                "max": float(values.max()),
+                **{f"p{percentile}": float(np.percentile(values, percentile)) for percentile in PERCENTILES}
+            }
+
+        summary["bottleneck"] = BOTTLENECKS[max(BOTTLENECKS, key=lambda name: summary[name]["total"])]
+        return summary
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from multiprocessing import util
+from .batch_insert import BatchInsert
+from .load_metrics import LoadMetrics
+from ..utils.shared_memory_utils import from_shared_memory, close_shared_memory
+
+logger = logging.getLogger(__name__)
+
+# State of a persistent loader process. It is set up once per process by init_loader_worker and reused by every
+# task the process takes from the ProcessPoolExecutor queue.
+_worker_loop = None
+_worker_batch = None
+_worker_init_error = None
+
+
+def init_loader_worker(
+        batch_size, pg_conn_details, table_name, min_conn, max_conn, batch_options=None
+):  # pragma: no cover
+    """
+        Initializer of the ProcessPoolExecutor processes. Creates one event loop and one open connection pool per
+        process, which are closed when the process exits.
+        batch_options are the additional keyword arguments of the BatchInsert instance.
+    """
+    global _worker_loop, _worker_batch, _worker_init_error
+    try:
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+        _worker_batch = BatchInsert(
+            batch_size=batch_size,
+            pg_conn_details=pg_conn_details,
+            table_name=table_name,
+            min_conn=min_conn,
+            max_conn=max_conn,
+            **(batch_options or {})
+        )
+        _worker_loop.run_until_complete(_worker_batch.open_connection_pool())
+    except Exception as e:
+        # Raising here would break the whole executor and hide the cause, so it is raised by every task instead
+        _worker_init_error = e
+        return
+
+    # Runs on the regular exit of the process, once the executor is shut down
+    util.Finalize(None, close_loader_worker, exitpriority=10)
+
+
+def close_loader_worker():  # pragma: no cover
+    try:
+        _worker_loop.run_until_complete(_worker_batch.close_connection_pool())
+    finally:
+        _worker_loop.close()
+
+
+def run_loader_worker_task(data, is_shared_memory_descriptor=False):  # pragma: no cover
+    """
+        Loads a DataFrame (or the DataFrame described by a shared memory descriptor) with the connection pool of
+        the current process.
+        Returns the LoadMetrics of the task, to be recorded by the parent process.
+    """
+    if _worker_init_error is not None:
+        raise _worker_init_error
+
+    _worker_batch.metrics = LoadMetrics()
+    if not is_shared_memory_descriptor:
+        _worker_loop.run_until_complete(_worker_batch.execute(data))
+        return _worker_batch.metrics
+
+    data_df, shm = from_shared_memory(data)
+    try:
+        _worker_loop.run_until_complete(_worker_batch.execute(data_df))
+    finally:
+        del data_df
+        close_shared_memory(shm)
+    return _worker_batch.metrics
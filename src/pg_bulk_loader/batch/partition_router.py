@@ -0,0 +1,203 @@
+import re
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Partition bounds as printed by pg_get_expr, e.g. FOR VALUES FROM (MINVALUE) TO ('2024-02-01') or FOR VALUES IN (1, 2)
+RANGE_BOUND_PATTERN = re.compile(r"^FOR VALUES FROM \((.*)\) TO \((.*)\)$", re.S)
+LIST_BOUND_PATTERN = re.compile(r"^FOR VALUES IN \((.*)\)$", re.S)
+# Literal of a bound: quoted string or unquoted number or keyword (NULL, MINVALUE, MAXVALUE, true, false)
+BOUND_LITERAL_PATTERN = re.compile(r"'((?:[^']|'')*)'|([^\s,()]+)")
+
+# Code of the rows which are not routed to a leaf partition but COPYed into the partitioned table
+PARENT_CODE = -1
+
+
+def parse_bound_literals(bound: str):
+    """
+    :return: The literals of a bound, the quoted ones unescaped. The keywords are returned in upper case, NULL as None.
+    """
+    literals = []
+    for quoted, unquoted in BOUND_LITERAL_PATTERN.findall(bound):
+        if quoted or not unquoted:
+            literals.append(quoted.replace("''", "'"))
+        elif unquoted.upper() == "NULL":
+            literals.append(None)
+        elif unquoted.upper() in ("MINVALUE", "MAXVALUE"):
+            literals.append(unquoted.upper())
+        else:
+            literals.append(unquoted)
+    return literals
+
+
+def get_timestamp(literal: str, series: pd.Series):
+    """
+    :return: The literal as a Timestamp comparable with the values of the datetime series
+    """
+    timestamp = pd.Timestamp(literal)
+    if (timestamp.tz is None) != (series.dt.tz is None):
+        raise ValueError(f"Bound {literal} and column {series.name} don't both have a time zone")
+    return timestamp
+
+
+class PartitionRouter:
+    """
+    Routes the rows of a DataFrame to the leaf partitions of a table partitioned by LIST or RANGE on one column, with
+    vectorized operations, from the partition bounds in the catalog. The rows are then COPYed straight into their leaf
+    partition, without the per row tuple routing of postgres. The rows it can't route, e.g. the ones of the default
+    partition, a NULL range key or a key type without a safe comparison (text ranges depend on the collation), are
+    COPYed into the partitioned table as before, without FREEZE in truncate mode.
+    """
+
+    def __init__(self, table_name: str, key_column: str, strategy: str, partitions: list):
+        """
+        :param table_name: Schema qualified name of the partitioned table
+        :param key_column: Partition key column
+        :param strategy: "r" (range) or "l" (list), as in pg_partitioned_table.partstrat
+        :param partitions: (schema qualified name, bound) of every leaf partition, the bound as printed by pg_get_expr
+        """
+        self.table_name = table_name
+        self.key_column = key_column
+        self.strategy = strategy
+        self.partitions = partitions
+
+    @classmethod
+    async def from_catalog(cls, pg_session, table_name: str):
+        """
+        :param table_name: Schema qualified name of the table
+        :return: The router of the table, None when the table is not partitioned or its partitioning is not supported
+        """
+        query = """
+            select p.partstrat, p.partnatts, a.attname from pg_partitioned_table p
+            left join pg_attribute a on a.attrelid = p.partrelid and a.attnum = p.partattrs[0]
+            where p.partrelid = to_regclass(%(table)s)
+        """
+        async with pg_session.cursor() as acur:
+            await acur.execute(query, {"table": table_name})
+            result = await acur.fetchone()
+            if result is None:
+                logger.info(f"Table {table_name} is not partitioned, the rows are not routed")
+                return None
+            strategy, key_count, key_column = result
+            if strategy not in ("r", "l") or key_count != 1 or key_column is None:
+                logger.info(f"Table {table_name} is not partitioned by LIST or RANGE on a column, rows are not routed")
+                return None
+
+            query = """
+                select format('%%I.%%I', n.nspname, c.relname), pg_get_expr(c.relpartbound, c.oid), c.relkind
+                from pg_inherits i join pg_class c on c.oid = i.inhrelid join pg_namespace n on n.oid = c.relnamespace
+                where i.inhparent = to_regclass(%(table)s)
+            """
+            await acur.execute(query, {"table": table_name})
+            partitions = await acur.fetchall()
+        if any(relkind == "p" for _, _, relkind in partitions):
+            logger.info(f"Table {table_name} has sub-partitioned partitions, the rows are not routed")
+            return None
+        return cls(table_name, key_column, strategy, [(name, bound) for name, bound, _ in partitions])
+
+    def get_range_codes(self, series: pd.Series):
+        """
+        :return: Index of the partition of every value of the series in self.partitions, PARENT_CODE for the values
+        which are not routed
+        """
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            # Nanoseconds since the epoch, in UTC for a tz-aware column
+            utc_series = series if series.dt.tz is None else series.dt.tz_convert("UTC").dt.tz_localize(None)
+            values = utc_series.to_numpy(dtype="datetime64[ns]").view(np.int64)
+            min_value, max_value = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+            def get_key(literal):
+                return get_timestamp(literal, series).value
+        elif pd.api.types.is_integer_dtype(series.dtype) or pd.api.types.is_float_dtype(series.dtype):
+            values = series.to_numpy(dtype="float64", na_value=np.nan)
+            min_value, max_value = -np.inf, np.inf
+            get_key = float
+            if pd.api.types.is_integer_dtype(series.dtype):
+                # Exact comparisons of the 64-bit keys
+                values = series.to_numpy(dtype="int64", na_value=0)
+                min_value, max_value = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+                get_key = int
+        else:
+            raise TypeError(f"Range partitioning on {series.dtype} column {series.name} is not routed")
+
+        lowers, uppers, codes = [], [], []
+        for code, (_, bound) in enumerate(self.partitions):
+            match = RANGE_BOUND_PATTERN.match(bound or "")
+            if not match:
+                # Default partition
+                continue
+            (lower,), (upper,) = parse_bound_literals(match.group(1)), parse_bound_literals(match.group(2))
+            lowers.append(min_value if lower == "MINVALUE" else get_key(lower))
+            uppers.append(max_value if upper == "MAXVALUE" else get_key(upper))
+            codes.append(code)
+        if not codes:
+            return np.full(len(series), PARENT_CODE)
+
+        order = np.argsort(lowers, kind="stable")
+        lowers, uppers, codes = np.array(lowers)[order], np.array(uppers)[order], np.array(codes)[order]
+        positions = np.clip(np.searchsorted(lowers, values, side="right") - 1, 0, None)
+        routed = (values >= lowers[positions]) & (values < uppers[positions]) & ~series.isna().to_numpy()
+        return np.where(routed, codes[positions], PARENT_CODE)
+
+    def get_list_codes(self, series: pd.Series):
+        """
+        :return: Index of the partition of every value of the series in self.partitions, PARENT_CODE for the values
+        which are not routed
+        """
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            def get_key(literal):
+                return get_timestamp(literal, series)
+        elif pd.api.types.is_bool_dtype(series.dtype):
+            def get_key(literal):
+                return literal.lower() == "true"
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            get_key = int
+        elif pd.api.types.is_float_dtype(series.dtype):
+            get_key = float
+        else:
+            # Text, the values of other types never equal a str and stay with the partitioned table
+            get_key = str
+
+        value_codes, null_code = {}, PARENT_CODE
+        for code, (_, bound) in enumerate(self.partitions):
+            match = LIST_BOUND_PATTERN.match(bound or "")
+            if not match:
+                # Default partition
+                continue
+            for literal in parse_bound_literals(match.group(1)):
+                if literal is None:
+                    null_code = code
+                else:
+                    value_codes[get_key(literal)] = code
+        codes = series.map(value_codes).to_numpy(dtype="float64", na_value=np.nan)
+        codes = np.where(np.isnan(codes), PARENT_CODE, codes).astype(np.int64)
+        return np.where(series.isna().to_numpy(), null_code, codes)
+
+    def route(self, data_df: pd.DataFrame):
+        """
+        :return: The rows of the data_df grouped by partition, in their order within a partition, and the
+        (start, end, table name) of every group. The rows which are not routed are in a group of the partitioned table.
+        """
+        key_columns = [col_name for col_name in data_df.columns if str(col_name).lower() == self.key_column]
+        if not key_columns:
+            return data_df, [(0, data_df.shape[0], self.table_name)]
+
+        series = data_df[key_columns[0]]
+        try:
+            codes = self.get_range_codes(series) if self.strategy == "r" else self.get_list_codes(series)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Rows of {self.table_name} are not routed to its partitions: {e}")
+            return data_df, [(0, data_df.shape[0], self.table_name)]
+
+        if np.any(np.diff(codes) < 0):
+            order = np.argsort(codes, kind="stable")
+            codes = codes[order]
+            data_df = data_df.iloc[order].reset_index(drop=True)
+        boundaries = [0, *(np.flatnonzero(np.diff(codes)) + 1), len(codes)]
+        groups = []
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            code = codes[start]
+            groups.append((int(start), int(end), self.table_name if code == PARENT_CODE else self.partitions[code][0]))
+        return data_df, groups
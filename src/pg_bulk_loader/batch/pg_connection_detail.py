@@ -2,27 +2,68 @@ import psycopg
 from psycopg_pool import AsyncConnectionPool
 from ..utils.constants import SSL_MODE
 
+# set_config takes the name and the value as parameters, unlike SET
+SET_CONFIG_QUERY = "SELECT set_config(%s, %s, false)"
+
+
+def validate_session_settings(session_settings: dict):
+    if session_settings is None:
+        return
+    if not isinstance(session_settings, dict) or not all(isinstance(name, str) for name in session_settings):
+        raise Exception("Session settings must be a dict of setting names and values!")
+
 
 class PgConnectionDetail:
     def __init__(
-            self, user: str, password: str, database: str, schema: str, host: str = "localhost", port: int = 5432
+            self, user: str, password: str, database: str, schema: str, host: str = "localhost", port: int = 5432,
+            session_settings: dict = None, index_session_settings: dict = None
     ):
+        """
+        :param session_settings: Settings (GUCs) applied to every pooled connection of the loads when it is created,
+        e.g. LOAD_SESSION_SETTINGS
+        :param index_session_settings: Settings applied to the sessions re-creating the indexes,
+        e.g. INDEX_SESSION_SETTINGS
+        """
+        validate_session_settings(session_settings)
+        validate_session_settings(index_session_settings)
         self.user = user
         self.password = password
         self.db = database
         self.host = host
         self.port = port
         self.schema = schema
+        self.session_settings = session_settings or {}
+        self.index_session_settings = index_session_settings or {}
 
-    def create_connection_pool(self, min_size=5, max_size=10):
+    def create_connection_pool(self, min_size=5, max_size=10, session_settings: dict = None):
+        """
+        :param session_settings: Settings applied to every connection of the pool when it is created. By default,
+        the session_settings of the instance.
+        """
         if not min_size or not max_size:
             raise Exception("min and max connection pool size cannot be null or zero!")
 
+        settings = self.session_settings if session_settings is None else session_settings
+        validate_session_settings(settings)
+
+        async def configure(connection):
+            async with connection.cursor() as cursor:
+                for name, value in settings.items():
+                    await cursor.execute(SET_CONFIG_QUERY, (name, str(value)))
+            # The pool expects the connection to be idle
+            await connection.commit()
+
         conn_str = f"host={self.host} user={self.user} password={self.password} dbname={self.db} port={self.port} sslmode={SSL_MODE}"
-        return AsyncConnectionPool(conninfo=conn_str, min_size=min_size, max_size=max_size, open=False)
+        return AsyncConnectionPool(
+            conninfo=conn_str, min_size=min_size, max_size=max_size, open=False,
+            configure=configure if settings else None
+        )
 
-    def get_psycopg_connection(self):
-        return psycopg.connect(
+    def get_psycopg_connection(self, session_settings: dict = None):
+        """
+        :param session_settings: Settings applied to the session, e.g. index_session_settings
+        """
+        pg_session = psycopg.connect(
             host=self.host,
             port=self.port,
             dbname=self.db,
@@ -30,3 +71,9 @@ class PgConnectionDetail:
             password=self.password,
             sslmode=SSL_MODE
         )
+        if session_settings:
+            with pg_session.cursor() as cursor:
+                for name, value in session_settings.items():
+                    cursor.execute(SET_CONFIG_QUERY, (name, str(value)))
+            pg_session.commit()
+        return pg_session
@@ -0,0 +1,301 @@
+import re
+import logging
+import psycopg
+from .pg_connection_detail import PgConnectionDetail
+from .index_build_scheduler import IndexBuildScheduler
+from .fast_load_hack import (
+    quote_identifier, TRIGGER_FIRING_MODES, IDENTIFIER_PATTERN, QUALIFIED_NAME_PATTERN, MAX_IDENTIFIER_LENGTH
+)
+from ..utils.time_it_decorator import time_it
+from ..utils.constants import DEFAULT_MAX_PARALLEL_INDEX_BUILDS
+
+logger = logging.getLogger(__name__)
+
+SHADOW_TABLE_SUFFIX = "__pg_bulk_loader_shadow"
+
+INDEX_DEFINITION_PATTERN = re.compile(
+    rf"^(CREATE (?:UNIQUE )?INDEX ){IDENTIFIER_PATTERN}( ON (?:ONLY )?){QUALIFIED_NAME_PATTERN}( .*)$", re.S
+)
+TRIGGER_DEFINITION_PATTERN = re.compile(
+    rf"^(CREATE (?:CONSTRAINT )?TRIGGER .*? ON ){QUALIFIED_NAME_PATTERN}( .*)$", re.S
+)
+
+
+def get_shadow_index_name(index_oid: int):
+    # Index names are unique per schema, the ones of the shadow table are renamed on swap
+    return f"pg_bulk_loader_shadow_{index_oid}"
+
+
+class ShadowTable:
+    """
+    Copy of a table, loaded while the live table keeps serving the readers, then swapped in. The shadow table is
+    created with the columns, defaults, check constraints and privileges of the table. Its indexes, primary key,
+    unique constraints, foreign keys and triggers are created after the load. The swap drops the table and renames
+    the shadow table in one short transaction, so readers see either the old or the new content.
+    """
+
+    def __init__(
+            self,
+            pg_conn_details: PgConnectionDetail,
+            table_name: str,
+            max_parallel_index_builds: int = DEFAULT_MAX_PARALLEL_INDEX_BUILDS,
+            maintenance_work_mem_budget: int = None,
+            lock_timeout: str = "5s",
+            swap_tries: int = 3
+    ):
+        """
+        :param max_parallel_index_builds: Max number of indexes of the shadow table created at a time
+        :param maintenance_work_mem_budget: Total maintenance_work_mem in bytes shared by the index builds
+        :param lock_timeout: Max time the swap waits for the lock of the table, so that it doesn't queue the readers
+        behind a long running query. The swap is retried swap_tries times.
+        """
+        self.pg_conn_details = pg_conn_details
+        self.schema = pg_conn_details.schema
+        self.table_name = table_name
+        self.name = table_name[:MAX_IDENTIFIER_LENGTH - len(SHADOW_TABLE_SUFFIX)] + SHADOW_TABLE_SUFFIX
+        self.max_parallel_index_builds = max_parallel_index_builds
+        self.maintenance_work_mem_budget = maintenance_work_mem_budget
+        self.lock_timeout = lock_timeout
+        self.swap_tries = swap_tries
+        # Report of the index builds of the shadow table
+        self.index_builds = []
+
+    @property
+    def qualified_table(self):
+        return f"{self.schema}.{self.table_name}"
+
+    @property
+    def qualified_name(self):
+        return f"{self.schema}.{self.name}"
+
+    def fetch_all(self, query: str, params=None):
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            return pg_session.execute(query, params).fetchall()
+        finally:
+            pg_session.close()
+
+    def execute(self, queries: list):
+        """
+        Runs the queries in one transaction.
+        """
+        pg_session = self.pg_conn_details.get_psycopg_connection()
+        try:
+            with pg_session.cursor() as cursor:
+                for query in queries:
+                    cursor.execute(query)
+                pg_session.commit()
+        finally:
+            pg_session.close()
+
+    def get_blockers(self):
+        """
+        :return: The reasons why the table can't be replaced by a shadow table, empty when it can
+        """
+        table = {"table": self.qualified_table}
+        result = self.fetch_all(
+            "select relkind, relispartition, relrowsecurity from pg_class where oid = to_regclass(%(table)s)", table
+        )
+        if not result:
+            raise Exception(f"Table {self.qualified_table} not found!")
+
+        relkind, is_partition, row_security = result[0]
+        blockers = []
+        if relkind != "r" or is_partition:
+            blockers.append("the table is partitioned or a partition")
+        if row_security:
+            blockers.append("the table has row level security")
+
+        checks = (
+            ("the table has inheritance children or parents", """
+                select inhrelid::regclass::text from pg_inherits
+                where inhparent = to_regclass(%(table)s) or inhrelid = to_regclass(%(table)s)
+            """),
+            ("the table is referenced by the foreign keys", """
+                select conrelid::regclass::text || '.' || conname from pg_constraint
+                where contype = 'f' and confrelid = to_regclass(%(table)s) and conrelid != confrelid
+            """),
+            ("the table is used by the views", """
+                select distinct r.ev_class::regclass::text from pg_depend d join pg_rewrite r on r.oid = d.objid
+                where d.refobjid = to_regclass(%(table)s) and r.ev_class != d.refobjid
+            """),
+            ("the table is published by", """
+                select p.pubname from pg_publication_rel r join pg_publication p on p.oid = r.prpubid
+                where r.prrelid = to_regclass(%(table)s)
+            """),
+            ("the table has the exclusion constraints", """
+                select conname from pg_constraint where contype = 'x' and conrelid = to_regclass(%(table)s)
+            """),
+        )
+        for reason, query in checks:
+            names = [row[0] for row in self.fetch_all(query, table)]
+            if names:
+                blockers.append(f"{reason} {names}")
+        return blockers
+
+    @time_it
+    def create(self):
+        """
+        Creates the shadow table, replacing the one of a previous failed load.
+        """
+        queries = [
+            f"DROP TABLE IF EXISTS {self.qualified_name}",
+            f"CREATE TABLE {self.qualified_name} (LIKE {self.qualified_table} INCLUDING ALL EXCLUDING INDEXES)",
+        ]
+        query = """
+            select quote_ident(pg_get_userbyid(c.relowner)), quote_ident(current_user),
+                case when a.grantee = 0 then 'PUBLIC' else quote_ident(pg_get_userbyid(a.grantee)) end,
+                a.privilege_type, a.is_grantable
+            from pg_class c left join lateral aclexplode(c.relacl) a on true
+            where c.oid = to_regclass(%(table)s)
+        """
+        owner = current_user = None
+        for owner, current_user, grantee, privilege, is_grantable in self.fetch_all(
+                query, {"table": self.qualified_table}
+        ):
+            if privilege:
+                grant_option = " WITH GRANT OPTION" if is_grantable else ""
+                queries.append(f"GRANT {privilege} ON {self.qualified_name} TO {grantee}{grant_option}")
+        if owner != current_user:
+            queries.append(f"ALTER TABLE {self.qualified_name} OWNER TO {owner}")
+        self.execute(queries)
+
+    def get_indexes(self):
+        """
+        :return: The indexes of the table with their oid, definition, size and constraint, if any
+        """
+        query = """
+            select i.indexrelid, pg_get_indexdef(i.indexrelid), pg_relation_size(i.indexrelid),
+                c.contype, c.condeferrable, c.condeferred
+            from pg_index i left join pg_constraint c on c.conindid = i.indexrelid and c.conrelid = i.indrelid
+            where i.indrelid = to_regclass(%(table)s)
+        """
+        return self.fetch_all(query, {"table": self.qualified_table})
+
+    def get_shadow_index_definition(self, index_oid: int, definition: str):
+        match = INDEX_DEFINITION_PATTERN.match(definition)
+        if not match:
+            raise Exception(f"Unsupported index definition: {definition}")
+        return (
+            f"{match.group(1)}{get_shadow_index_name(index_oid)}{match.group(2)}{self.qualified_name}{match.group(3)}"
+        )
+
+    @time_it
+    def build(self, use_multi_process: bool = True):
+        """
+        Creates the indexes, primary key, unique constraints, foreign keys and triggers of the table on the loaded
+        shadow table. The indexes are created in parallel, largest first, by an IndexBuildScheduler. The shadow table
+        is analyzed last, so that it is swapped in with the statistics of the loaded rows.
+        """
+        indexes = self.get_indexes()
+        scheduler = IndexBuildScheduler(
+            pg_conn_details=self.pg_conn_details,
+            max_parallel_builds=self.max_parallel_index_builds if use_multi_process else 1,
+            maintenance_work_mem_budget=self.maintenance_work_mem_budget
+        )
+        self.index_builds = scheduler.run(
+            {get_shadow_index_name(oid): self.get_shadow_index_definition(oid, definition)
+             for oid, definition, _, _, _, _ in indexes},
+            {get_shadow_index_name(oid): size for oid, _, size, _, _, _ in indexes}
+        )
+        failed_indexes = [build["index"] for build in self.index_builds if build["error"]]
+        if failed_indexes:
+            raise Exception(f"Failed to create the indexes {failed_indexes} of {self.qualified_name}!")
+
+        queries = []
+        for oid, _, _, constraint_type, deferrable, deferred in indexes:
+            if constraint_type in ("p", "u"):
+                index_name = get_shadow_index_name(oid)
+                constraint = "PRIMARY KEY" if constraint_type == "p" else "UNIQUE"
+                deferral = (" DEFERRABLE" if deferrable else "") + (" INITIALLY DEFERRED" if deferred else "")
+                queries.append(
+                    f"ALTER TABLE {self.qualified_name} ADD CONSTRAINT {index_name} {constraint} "
+                    f"USING INDEX {index_name}{deferral}"
+                )
+
+        query = """
+            select conname, pg_get_constraintdef(oid), confrelid = conrelid from pg_constraint
+            where contype = 'f' and conrelid = to_regclass(%(table)s)
+        """
+        for name, definition, self_reference in self.fetch_all(query, {"table": self.qualified_table}):
+            if self_reference:
+                definition = re.sub(
+                    rf"REFERENCES {QUALIFIED_NAME_PATTERN}\(", f"REFERENCES {self.qualified_name}(", definition, count=1
+                )
+            queries.append(f"ALTER TABLE {self.qualified_name} ADD CONSTRAINT {quote_identifier(name)} {definition}")
+
+        query = """
+            select tgname, pg_get_triggerdef(oid), tgenabled from pg_trigger
+            where tgrelid = to_regclass(%(table)s) and not tgisinternal
+        """
+        for name, definition, tg_enabled in self.fetch_all(query, {"table": self.qualified_table}):
+            match = TRIGGER_DEFINITION_PATTERN.match(definition)
+            if not match:
+                raise Exception(f"Unsupported trigger definition: {definition}")
+            queries.append(f"{match.group(1)}{self.qualified_name}{match.group(2)}")
+            mode = "DISABLE TRIGGER" if tg_enabled == "D" else f"ENABLE {TRIGGER_FIRING_MODES[tg_enabled]}"
+            queries.append(f"ALTER TABLE {self.qualified_name} {mode} {quote_identifier(name)}")
+
+        # The sequences of the identity columns of the shadow table are its own, the ones of the serial columns are
+        # owned by the table. Both continue after the loaded values.
+        query = """
+            select quote_ident(attname), coalesce(
+                pg_get_serial_sequence(%(shadow)s, attname), pg_get_serial_sequence(%(table)s, attname)
+            ), pg_get_serial_sequence(%(table)s, attname)
+            from pg_attribute where attrelid = to_regclass(%(shadow)s) and attnum > 0 and not attisdropped
+                and pg_get_serial_sequence(%(table)s, attname) is not null
+        """
+        for column, sequence, table_sequence in self.fetch_all(
+                query, {"table": self.qualified_table, "shadow": self.qualified_name}
+        ):
+            queries.append(
+                f"SELECT setval('{sequence}', greatest((SELECT max({column}) FROM {self.qualified_name}), "
+                f"pg_sequence_last_value('{table_sequence}'), 1))"
+            )
+        # Before the swap, so that the ACCESS EXCLUSIVE lock isn't held while the rows are sampled
+        queries.append(f"ANALYZE {self.qualified_name}")
+        self.execute(queries)
+        return self.index_builds
+
+    @time_it
+    def swap(self):
+        """
+        Drops the table and renames the shadow table and its indexes to the names of the table and of its indexes,
+        in one transaction. The sequences owned by the columns of the table (serial columns) are handed over to the
+        shadow table first, since its defaults use them.
+        """
+        table = {"table": self.qualified_table}
+        index_names = self.fetch_all("""
+            select i.indexrelid, quote_ident(c.relname) from pg_index i join pg_class c on c.oid = i.indexrelid
+            where i.indrelid = to_regclass(%(table)s)
+        """, table)
+        owned_sequences = self.fetch_all("""
+            select d.objid::regclass::text, a.attname from pg_depend d
+            join pg_class s on s.oid = d.objid and s.relkind = 'S'
+            join pg_attribute a on a.attrelid = d.refobjid and a.attnum = d.refobjsubid
+            where d.refobjid = to_regclass(%(table)s) and d.deptype = 'a'
+        """, table)
+
+        queries = [
+            f"SET LOCAL lock_timeout = '{self.lock_timeout}'",
+            f"LOCK TABLE {self.qualified_table} IN ACCESS EXCLUSIVE MODE",
+        ]
+        for sequence, column in owned_sequences:
+            queries.append(f"ALTER SEQUENCE {sequence} OWNED BY {self.qualified_name}.{quote_identifier(column)}")
+        queries.append(f"DROP TABLE {self.qualified_table}")
+        queries.append(f"ALTER TABLE {self.qualified_name} RENAME TO {quote_identifier(self.table_name)}")
+        for oid, index_name in index_names:
+            # The index of a constraint is renamed along with the constraint
+            queries.append(f"ALTER INDEX {self.schema}.{get_shadow_index_name(oid)} RENAME TO {index_name}")
+
+        for attempt in range(1, self.swap_tries + 1):
+            try:
+                self.execute(queries)
+                return
+            except psycopg.errors.LockNotAvailable as e:
+                if attempt == self.swap_tries:
+                    raise e
+                logger.warning(f"Swap of {self.qualified_table} timed out waiting for its lock, retrying")
+
+    def drop(self):
+        self.execute([f"DROP TABLE IF EXISTS {self.qualified_name}"])
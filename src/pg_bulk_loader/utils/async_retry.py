@@ -0,0 +1,58 @@
+import random
+import asyncio
+import functools
+import logging
+import psycopg
+from psycopg_pool import PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+# Transient failures a new attempt can succeed after. psycopg.OperationalError covers lost connections, admin
+# shutdowns, serialization failures and deadlocks. Data and integrity errors fail the same way on every attempt.
+RETRYABLE_EXCEPTIONS = (psycopg.OperationalError, PoolTimeout, ConnectionError, asyncio.TimeoutError)
+
+
+def is_retryable(exception: BaseException):
+    return isinstance(exception, RETRYABLE_EXCEPTIONS)
+
+
+def get_backoff_delay(attempt: int, delay: float, backoff: float, max_delay: float):
+    """
+    Full jitter: a random delay between 0 and the exponential delay of the attempt, so that the streams failing
+    together don't retry together.
+
+    :param attempt: Number of the failed attempt, starting at 1
+    """
+    return random.uniform(0, min(max_delay, delay * backoff ** (attempt - 1)))
+
+
+def async_retry(tries: int = 3, delay: float = 1, backoff: float = 2, max_delay: float = 30, retryable=is_retryable):
+    """
+    Retries a coroutine function with exponential backoff and jitter. The wait doesn't block the event loop.
+
+    :param tries: Max number of attempts
+    :param delay: Upper bound of the first delay in seconds
+    :param backoff: Multiplier of the delay per attempt
+    :param max_delay: Upper bound of any delay in seconds
+    :param retryable: Function telling if an exception is worth a new attempt. Others are raised right away.
+    """
+    def decorator(func):
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            attempt = 1
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    if attempt >= tries or not retryable(e):
+                        raise e
+                    wait = get_backoff_delay(attempt, delay, backoff, max_delay)
+                    logger.warning(
+                        f"{func.__name__} failed on attempt {attempt}/{tries} with {type(e).__name__}: {e}. "
+                        f"Retrying in {wait:.2f}s"
+                    )
+                    await asyncio.sleep(wait)
+                    attempt += 1
+        return wrapper
+    return decorator
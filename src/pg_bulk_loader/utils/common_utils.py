@@ -1,5 +1,13 @@
+import itertools
+import numpy as np
 import pandas as pd
 
+# Estimated encoded width (in bytes) of the values of the columns which don't need a per value estimate
+FLOAT_WIDTH = 18
+DATETIME_WIDTH = 26
+BOOL_WIDTH = 5
+OTHER_WIDTH = 8
+
 
 def is_empty(df: pd.DataFrame):
     if df is None:
@@ -32,3 +40,79 @@ def get_ranges(data_size: int, batch_size: int):
             start = end
             end = min(data_size, batch_size+end)
     return ranges
+
+
+def round_robin(iterables: list):
+    """
+    Yields the first item of every iterable, then the second one of every iterable and so on, skipping the exhausted
+    ones. The iterables are consumed lazily.
+    """
+    iterators = [iter(iterable) for iterable in iterables]
+    while iterators:
+        remaining = []
+        for iterator in iterators:
+            for item in itertools.islice(iterator, 1):
+                yield item
+                remaining.append(iterator)
+        iterators = remaining
+
+
+def estimate_row_sizes(df: pd.DataFrame):
+    """
+    Estimates the encoded (CSV) size of every row of the df with vectorized per column width estimates.
+    Text columns are measured value by value, the other objects (e.g. dates, decimals or dicts of json columns) by
+    the length of their str, integers by their number of digits and the other types are given a fixed width.
+
+    :return: numpy array of the estimated size in bytes per row
+    """
+    # One delimiter (or the new line) per value
+    row_sizes = np.full(df.shape[0], df.shape[1], dtype=np.int64)
+    for col_name in df.columns:
+        series = df[col_name]
+        if pd.api.types.is_bool_dtype(series.dtype):
+            row_sizes += BOOL_WIDTH
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            values = np.abs(series.to_numpy(dtype="float64", na_value=0))
+            row_sizes += (np.floor(np.log10(values + 1)) + 2).astype(np.int64)
+        elif pd.api.types.is_float_dtype(series.dtype):
+            row_sizes += FLOAT_WIDTH
+        elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+            row_sizes += DATETIME_WIDTH
+        elif pd.api.types.is_string_dtype(series.dtype) or pd.api.types.is_object_dtype(series.dtype):
+            if pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+                # The str accessor only measures strings
+                series = series.astype(str).where(series.notna())
+            # Nulls are given a fixed width. Two more bytes for the quotes added around some values.
+            lengths = series.str.len().to_numpy(dtype="float64", na_value=np.nan)
+            row_sizes += np.nan_to_num(lengths, nan=OTHER_WIDTH).astype(np.int64) + 2
+        else:
+            row_sizes += OTHER_WIDTH
+    return row_sizes
+
+
+def get_ranges_by_size(row_sizes, max_batch_bytes: int, max_batch_rows: int = None):
+    """
+    Splits the rows into consecutive ranges whose total size doesn't exceed max_batch_bytes. A range always holds at
+    least one row, even if that row alone is larger than max_batch_bytes.
+
+    :param row_sizes: Size in bytes of every row, see estimate_row_sizes
+    :param max_batch_bytes: Targeted size in bytes per range
+    :param max_batch_rows: Optional upper limit of the number of rows per range
+    :return: list of (start, end) tuples
+    """
+    ranges = []
+    if not isinstance(max_batch_bytes, int) or max_batch_bytes <= 0:
+        return ranges
+
+    cumulative_sizes = np.cumsum(row_sizes)
+    data_size = len(cumulative_sizes)
+    start = 0
+    while start < data_size:
+        consumed = cumulative_sizes[start - 1] if start else 0
+        end = int(np.searchsorted(cumulative_sizes, consumed + max_batch_bytes, side="right"))
+        end = max(end, start + 1)
+        if max_batch_rows:
+            end = min(end, start + max_batch_rows)
+        ranges.append((start, min(end, data_size)))
+        start = ranges[-1][1]
+    return ranges
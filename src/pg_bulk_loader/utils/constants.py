@@ -1,2 +1,59 @@
 
 SSL_MODE = "prefer"
+
+COPY_FORMAT_CSV = "csv"
+COPY_FORMAT_BINARY = "binary"
+COPY_FORMATS = (COPY_FORMAT_CSV, COPY_FORMAT_BINARY)
+
+# Size of the encoded chunks streamed to postgres per COPY write
+DEFAULT_COPY_CHUNK_SIZE = 2 * 1024 * 1024
+
+# Number of DataFrames pulled ahead of the COPY stage from a DataFrame generator. With 0, the generator is
+# advanced on the event loop thread, since generators tied to their thread (e.g. read_sql on sqlite) can't be
+# advanced in another one.
+DEFAULT_PREFETCH_QUEUE_DEPTH = 0
+
+# Load modes of BatchInsert. "truncate" truncates the table and loads all the rows with COPY FREEZE in the same
+# transaction, so they are written already frozen and no vacuum pass is needed after the load. "upsert" COPYs every
+# batch into a staging table of its connection and applies it to the table with INSERT ... ON CONFLICT DO UPDATE.
+LOAD_MODE_APPEND = "append"
+LOAD_MODE_TRUNCATE = "truncate"
+LOAD_MODE_UPSERT = "upsert"
+LOAD_MODES = (LOAD_MODE_APPEND, LOAD_MODE_TRUNCATE, LOAD_MODE_UPSERT)
+# Temporary table every connection of a load in upsert mode stages its batches in
+UPSERT_STAGING_TABLE = "pg_bulk_loader_staging"
+# Load mode of batch_insert_to_postgres which appends the rows to a shadow copy of the table, then swaps it in,
+# see ShadowTable
+LOAD_MODE_REPLACE = "replace"
+
+# Value of batch_size which lets BatchInsert tune the batch size from the observed throughput
+AUTO_BATCH_SIZE = "auto"
+
+# Value of drop_and_create_index which decides per index whether dropping and re-creating it is cheaper than
+# maintaining it during the load, see FastLoadHack.get_indexes_to_rebuild
+AUTO_DROP_AND_CREATE_INDEX = "auto"
+# Cost of maintaining an index per inserted row, relative to the cost per row of building it from scratch (a sort).
+# The random I/O factor is added when the index doesn't fit in shared_buffers, every insert then likely reads a page.
+INDEX_INSERT_COST_FACTOR = 3
+INDEX_RANDOM_IO_COST_FACTOR = 4
+# Rows per page assumed for a table without statistics (never vacuumed or analyzed)
+DEFAULT_ROWS_PER_PAGE = 60
+
+# Number of indexes re-created at a time by FastLoadHack.create_indexes(use_multi_process=True)
+DEFAULT_MAX_PARALLEL_INDEX_BUILDS = 4
+
+# Session settings (GUCs) for the connections of the loads and of the index builds. They can be passed as
+# session_settings and index_session_settings of PgConnectionDetail, or used as a starting point for custom profiles.
+# synchronous_commit=off doesn't risk the consistency of the database, only the last commits before a server crash.
+LOAD_SESSION_SETTINGS = {
+    "synchronous_commit": "off",
+    "work_mem": "64MB",
+    "statement_timeout": "0",
+    "application_name": "pg_bulk_loader",
+}
+INDEX_SESSION_SETTINGS = {
+    "maintenance_work_mem": "1GB",
+    "max_parallel_maintenance_workers": "4",
+    "statement_timeout": "0",
+    "application_name": "pg_bulk_loader_index",
+}
@@ -0,0 +1,128 @@
+import pickle
+import logging
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+# Column buffers are placed at offsets aligned to a cache line
+ALIGNMENT = 64
+
+MASKED_ARRAY_TYPES = {
+    array_type.__name__: array_type
+    for array_type in (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+}
+
+
+def _aligned(size: int):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _column_layout(series: pd.Series):
+    """
+    :return: Tuple of the column spec (without offsets) and the numpy arrays or bytes to be copied into shared memory
+    """
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufmM":
+        return {"kind": "numpy"}, [series.to_numpy()]
+
+    if type(series.array).__name__ in MASKED_ARRAY_TYPES:
+        return {"kind": "masked", "array_type": type(series.array).__name__}, [series.array._data, series.array._mask]
+
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        utc_values = series.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()
+        return {"kind": "datetimetz", "tz": str(series.dt.tz)}, [utc_values]
+
+    # Text and other object columns have no flat buffer, they are pickled into the shared memory block instead
+    return {"kind": "pickle"}, [pickle.dumps(series.array, protocol=pickle.HIGHEST_PROTOCOL)]
+
+
+def to_shared_memory(data_df: pd.DataFrame):
+    """
+    Copies the column buffers of the data_df into a single shared memory block.
+    The caller owns the block and has to call `release_shared_memory` once the consumer is done with it.
+
+    :param data_df: Data to be shared with another process
+    :return: Tuple of the descriptor (small and cheap to pickle) and the SharedMemory instance
+    """
+    columns = []
+    buffers = []
+    size = 0
+    for col_name in data_df.columns:
+        spec, column_buffers = _column_layout(data_df[col_name])
+        spec["name"] = col_name
+        spec["buffers"] = []
+        for buffer in column_buffers:
+            if isinstance(buffer, bytes):
+                spec["buffers"].append({"offset": size, "size": len(buffer)})
+                size += _aligned(len(buffer))
+            else:
+                spec["buffers"].append({"offset": size, "dtype": buffer.dtype.str})
+                size += _aligned(buffer.nbytes)
+            buffers.append(buffer)
+        columns.append(spec)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        buffer_specs = [buffer_spec for spec in columns for buffer_spec in spec["buffers"]]
+        for buffer, buffer_spec in zip(buffers, buffer_specs):
+            offset = buffer_spec["offset"]
+            if isinstance(buffer, bytes):
+                shm.buf[offset: offset + len(buffer)] = buffer
+            else:
+                np.ndarray(buffer.shape, dtype=buffer.dtype, buffer=shm.buf, offset=offset)[:] = buffer
+    except Exception as e:
+        release_shared_memory(shm)
+        raise e
+
+    descriptor = {"shm_name": shm.name, "length": data_df.shape[0], "columns": columns}
+    return descriptor, shm
+
+
+def from_shared_memory(descriptor: dict):
+    """
+    Re-creates the DataFrame described by the descriptor. Numeric, boolean and datetime columns are zero-copy views
+    of the shared memory block.
+    The caller has to drop the DataFrame before calling `close_shared_memory` on the returned SharedMemory instance.
+
+    :param descriptor: Descriptor returned by `to_shared_memory`
+    :return: Tuple of the DataFrame and the attached SharedMemory instance
+    """
+    shm = shared_memory.SharedMemory(name=descriptor["shm_name"])
+    length = descriptor["length"]
+
+    def view(buffer_spec):
+        if "size" in buffer_spec:
+            return shm.buf[buffer_spec["offset"]: buffer_spec["offset"] + buffer_spec["size"]]
+        return np.ndarray((length,), dtype=np.dtype(buffer_spec["dtype"]), buffer=shm.buf, offset=buffer_spec["offset"])
+
+    data = {}
+    for spec in descriptor["columns"]:
+        buffers = [view(buffer_spec) for buffer_spec in spec["buffers"]]
+        if spec["kind"] == "numpy":
+            data[spec["name"]] = buffers[0]
+        elif spec["kind"] == "masked":
+            data[spec["name"]] = MASKED_ARRAY_TYPES[spec["array_type"]](buffers[0], buffers[1])
+        elif spec["kind"] == "datetimetz":
+            data[spec["name"]] = pd.DatetimeIndex(buffers[0]).tz_localize("UTC").tz_convert(spec["tz"])
+        else:
+            data[spec["name"]] = pickle.loads(buffers[0])
+            buffers[0].release()
+
+    return pd.DataFrame(data, copy=False), shm
+
+
+def close_shared_memory(shm: shared_memory.SharedMemory):
+    try:
+        shm.close()
+    except BufferError:
+        # A view of the block is still referenced. The mapping is released along with the process.
+        logger.debug(f"Shared memory block {shm.name} is still in use and can't be closed")
+
+
+def release_shared_memory(shm: shared_memory.SharedMemory):
+    close_shared_memory(shm)
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
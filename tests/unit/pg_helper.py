@@ -61,18 +61,22 @@ def fetch_result(postgresql, query):
     return pd.DataFrame(result, columns=["p_code", "s_code", "_from", "upto", "mean", "ss"])
 
 
-def fetch_rows_count_and_assert(pg_conn_details: PgConnectionDetail, table_name: str, expected):
+def fetch_rows_count(pg_conn_details: PgConnectionDetail, table_name: str):
     pg_conn = pg_conn_details.get_psycopg_connection()
     try:
         curser = pg_conn.cursor()
         result = curser.execute(f"select count(1) from {table_name}").fetchone()
         curser.close()
         pg_conn.commit()
-        assert result[0] == expected
+        return result[0]
     finally:
         pg_conn.close()
 
 
+def fetch_rows_count_and_assert(pg_conn_details: PgConnectionDetail, table_name: str, expected):
+    assert fetch_rows_count(pg_conn_details, table_name) == expected
+
+
 def truncate_table_and_assert(pg_conn_details: PgConnectionDetail, table_name: str):
     pg_conn = pg_conn_details.get_psycopg_connection()
     try:
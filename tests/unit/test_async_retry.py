@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+import pytest
+import psycopg
+from psycopg_pool import PoolTimeout
+from src.pg_bulk_loader.utils.async_retry import async_retry, is_retryable, get_backoff_delay
+
+
+class TestAsyncRetry(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.sleep = mock.AsyncMock()
+        patcher = mock.patch("src.pg_bulk_loader.utils.async_retry.asyncio.sleep", self.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_is_retryable(self):
+        assert is_retryable(psycopg.OperationalError("connection lost"))
+        assert is_retryable(psycopg.errors.SerializationFailure())
+        assert is_retryable(psycopg.errors.DeadlockDetected())
+        assert is_retryable(PoolTimeout())
+        assert is_retryable(ConnectionResetError())
+        assert not is_retryable(psycopg.errors.UniqueViolation())
+        assert not is_retryable(ValueError())
+
+    def test_backoff_delay_is_bounded(self):
+        for attempt in range(1, 10):
+            assert 0 <= get_backoff_delay(attempt, delay=1, backoff=2, max_delay=5) <= min(5, 2 ** (attempt - 1))
+
+    async def test_retry_until_success(self):
+        calls = []
+
+        @async_retry(tries=3)
+        async def load():
+            calls.append(1)
+            if len(calls) < 3:
+                raise psycopg.OperationalError("connection lost")
+            return "done"
+
+        assert await load() == "done"
+        assert len(calls) == 3
+        assert self.sleep.await_count == 2
+
+    async def test_retry_gives_up_after_tries(self):
+        calls = []
+
+        @async_retry(tries=2)
+        async def load():
+            calls.append(1)
+            raise PoolTimeout("no connection available")
+
+        with pytest.raises(PoolTimeout):
+            await load()
+        assert len(calls) == 2
+
+    async def test_retry_raises_non_retryable_errors_right_away(self):
+        calls = []
+
+        @async_retry(tries=3)
+        async def load():
+            calls.append(1)
+            raise psycopg.errors.UniqueViolation("duplicate key")
+
+        with pytest.raises(psycopg.errors.UniqueViolation):
+            await load()
+        assert len(calls) == 1
+        self.sleep.assert_not_awaited()
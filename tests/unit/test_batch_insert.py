@@ -1,9 +1,17 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 import psycopg
 import testing.postgresql
+import numpy as np
 import pandas as pd
 from src.pg_bulk_loader.batch.batch_insert import BatchInsert
+from src.pg_bulk_loader.batch.copy_encoder import BinaryCopyEncoder
+from src.pg_bulk_loader.batch.batch_size_tuner import BatchSizeTuner
+from src.pg_bulk_loader.batch.load_ledger import FileLoadLedger, TableLoadLedger
 from src.pg_bulk_loader.batch.pg_connection_detail import PgConnectionDetail
 
 
@@ -16,6 +24,18 @@ def init_db(postgresql):
         test_name varchar NOT NULL,
         CONSTRAINT test_batch_pk PRIMARY KEY (test_id)
     );
+    CREATE TABLE public.test_batch_binary (
+        test_id int4 NOT NULL,
+        small_value int2,
+        big_value int8,
+        real_value float4,
+        double_value float8,
+        flag bool,
+        test_date date,
+        created_at timestamp,
+        updated_at timestamptz,
+        test_name varchar
+    );
     """
     cursor.execute(create_table_query)
     cursor.close()
@@ -231,3 +251,776 @@ class TestBatchInsert(unittest.IsolatedAsyncioTestCase):
         # Validate from DB
         data = fetch_result(self.postgres_, "select * from test_batch where test_id in (10, 11, 12)")
         assert_data_count(data, 3)
+
+    async def test_batch_insert_when_copy_format_is_invalid(self):
+        with pytest.raises(Exception) as e:
+            BatchInsert(
+                batch_size=2, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+                copy_format="parquet"
+            )
+        assert str(e.value) == "Invalid copy format! Supported formats are ('csv', 'binary')"
+
+    async def test_batch_insert_with_binary_copy_format(self):
+        input_df = pd.DataFrame({
+            'test_id': [1, 2, 3],
+            'small_value': pd.array([7, None, -7], dtype="Int16"),
+            'big_value': [2 ** 40, -1, 0],
+            'real_value': [1.5, None, -2.25],
+            'double_value': [0.1, 2.5, None],
+            'flag': pd.array([True, False, None], dtype="boolean"),
+            'test_date': pd.to_datetime(["2024-02-29", None, "1999-12-31"]),
+            'created_at': pd.to_datetime(["2024-02-29 10:11:12.123456", "1970-01-01 00:00:00.000000", None]),
+            'updated_at': pd.to_datetime(
+                ["2024-02-29 10:11:12", None, "2000-01-01 00:00:00"]
+            ).tz_localize("Europe/Berlin"),
+        })
+
+        batch_ = BatchInsert(
+            batch_size=2, table_name="test_batch_binary", pg_conn_details=self.pg_connection, min_conn=1,
+            max_conn=1, copy_format="binary"
+        )
+        await batch_.open_connection_pool()
+        encoder = await batch_.get_encoder(input_df)
+        await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        assert encoder.copy_options == "FORMAT BINARY"
+
+        conn = self.pg_connection.get_psycopg_connection()
+        result = conn.execute(
+            """select small_value, big_value, real_value, double_value, flag, test_date::text, created_at::text,
+            (updated_at at time zone 'UTC')::text from test_batch_binary order by test_id"""
+        ).fetchall()
+        conn.execute("truncate table test_batch_binary")
+        conn.commit()
+        conn.close()
+
+        assert result == [
+            (7, 2 ** 40, 1.5, 0.1, True, "2024-02-29", "2024-02-29 10:11:12.123456", "2024-02-29 09:11:12"),
+            (None, -1, None, 2.5, False, None, "1970-01-01 00:00:00", None),
+            (-7, 0, -2.25, None, None, "1999-12-31", None, "1999-12-31 23:00:00"),
+        ]
+
+    async def test_batch_insert_with_binary_copy_format_falls_back_to_csv(self):
+        input_df = pd.DataFrame({
+            'test_id': [20, 21],
+            'test_name': ["aditya", "adam"],
+        })
+
+        batch_ = BatchInsert(
+            batch_size=2, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+            copy_format="binary"
+        )
+        await batch_.open_connection_pool()
+        encoder = await batch_.get_encoder(input_df)
+        await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        assert encoder.copy_options == "FORMAT CSV, DELIMITER ','"
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id in (20, 21)")
+        assert_data_count(data, 2)
+
+    async def test_batch_insert_when_copy_chunk_size_is_invalid(self):
+        with pytest.raises(Exception) as e:
+            BatchInsert(
+                batch_size=2, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+                copy_chunk_size=0
+            )
+        assert str(e.value) == "Copy chunk size must be a positive integer!"
+
+    async def test_batch_insert_when_batch_is_streamed_in_multiple_chunks(self):
+        input_df = pd.DataFrame({
+            'test_id': range(100, 600),
+            'test_name': ["aditya"] * 500,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=250, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+            copy_chunk_size=100
+        )
+        await batch_.open_connection_pool()
+        await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 100 and 599")
+        assert_data_count(data, 500)
+
+    async def test_batch_insert_reports_encode_and_io_time(self):
+        input_df = pd.DataFrame({
+            'test_id': range(600, 700),
+            'test_name': ["aditya"] * 100,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=30, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=2, max_conn=2
+        )
+        await batch_.open_connection_pool()
+        await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        assert batch_.encode_time > 0
+        assert batch_.io_time > 0
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 600 and 699")
+        assert_data_count(data, 100)
+
+    async def test_batch_insert_with_custom_encode_executor(self):
+        input_df = pd.DataFrame({
+            'test_id': [700, 701, 702],
+            'test_name': ["aditya", "adam", "lalu"],
+        })
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batch_ = BatchInsert(
+                batch_size=2, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+                encode_executor=executor
+            )
+            await batch_.open_connection_pool()
+            await batch_.execute(input_df)
+            await batch_.close_connection_pool()
+
+            # The executor given by the caller is not shut down by the BatchInsert instance
+            assert executor.submit(sum, [1, 2]).result() == 3
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id in (700, 701, 702)")
+        assert_data_count(data, 3)
+
+    async def test_batch_insert_when_batch_bytes_is_invalid(self):
+        with pytest.raises(Exception) as e:
+            BatchInsert(
+                batch_size=None, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+                batch_bytes=-1
+            )
+        assert str(e.value) == "Batch bytes must be a positive integer!"
+
+    async def test_batch_insert_with_batch_bytes(self):
+        input_df = pd.DataFrame({
+            'test_id': range(800, 900),
+            'test_name': ["a" * 50] * 50 + ["b"] * 50,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=None, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=2, max_conn=2,
+            batch_bytes=1000
+        )
+        partition_ranges = batch_.get_partition_ranges(input_df)
+        await batch_.open_connection_pool()
+        await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        # Wide rows end up in smaller batches
+        assert partition_ranges[0] == (0, 17)
+        assert partition_ranges[-1][1] - partition_ranges[-1][0] > 17
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 800 and 899")
+        assert_data_count(data, 100)
+
+    async def test_batch_insert_with_auto_batch_size(self):
+        input_df = pd.DataFrame({
+            'test_id': range(1000, 3000),
+            'test_name': ["aditya"] * 2000,
+        })
+
+        tuner = BatchSizeTuner(initial_batch_size=100, min_batch_size=100, samples_per_step=1)
+        batch_ = BatchInsert(
+            batch_size="auto", table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+            batch_size_tuner=tuner
+        )
+        await batch_.open_connection_pool()
+        await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        assert batch_.batch_size_tuner is tuner
+        assert sum(entry["rows"] for entry in tuner.history) == 2000
+        assert tuner.best_batch_size >= 100
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 1000 and 2999")
+        assert_data_count(data, 2000)
+
+    async def test_batch_insert_with_adaptive_concurrency(self):
+        input_df = pd.DataFrame({
+            'test_id': range(3000, 4000),
+            'test_name': ["aditya"] * 1000,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=50, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=4,
+            adaptive_concurrency=True
+        )
+        await batch_.open_connection_pool()
+        await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        limiter = batch_.concurrency_limiter
+        assert 1 <= limiter.limit <= 4
+        assert limiter.in_flight == 0
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 3000 and 3999")
+        assert_data_count(data, 1000)
+
+    async def test_batch_insert_retries_only_the_failed_batch(self):
+        input_df = pd.DataFrame({
+            'test_id': range(4000, 4100),
+            'test_name': ["aditya"] * 100,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=25, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=2, max_conn=2
+        )
+        await batch_.open_connection_pool()
+        get_connection = batch_.pool.connection
+        attempts = []
+
+        def connection(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 2:
+                raise psycopg.OperationalError("server closed the connection unexpectedly")
+            return get_connection(*args, **kwargs)
+
+        with mock.patch.object(batch_.pool, "connection", side_effect=connection), \
+                mock.patch("src.pg_bulk_loader.utils.async_retry.get_backoff_delay", return_value=0):
+            await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        # 4 batches and 1 retry. A batch loaded twice would violate the primary key.
+        assert len(attempts) == 5
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 4000 and 4099")
+        assert_data_count(data, 100)
+
+    async def test_batch_insert_when_load_ledger_is_used_with_auto_batch_size(self):
+        with pytest.raises(Exception) as e:
+            BatchInsert(
+                batch_size="auto", table_name="test_batch", pg_conn_details=self.pg_connection,
+                load_ledger=TableLoadLedger(load_id="load-auto")
+            )
+        assert str(e.value) == "A load ledger can't be used with batch_size='auto'!"
+
+    async def resume_failed_load(self, create_ledger, first_id):
+        input_df = pd.DataFrame({
+            'test_id': range(first_id, first_id + 100),
+            'test_name': ["aditya"] * 100,
+        })
+        # Makes the third batch fail on the primary key
+        conflicting_df = pd.DataFrame({'test_id': [first_id + 55], 'test_name': ["conflict"]})
+
+        batch_ = BatchInsert(
+            batch_size=25, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+            load_ledger=create_ledger(resume=False)
+        )
+        await batch_.open_connection_pool()
+        await batch_.execute(conflicting_df)
+        with pytest.raises(psycopg.errors.UniqueViolation):
+            await batch_.execute(input_df)
+
+        async with batch_.pool.connection() as pg_session:
+            await pg_session.execute(f"delete from test_batch where test_id = {first_id + 55}")
+        await batch_.close_connection_pool()
+
+        ledger = create_ledger(resume=True)
+        batch_ = BatchInsert(
+            batch_size=25, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+            load_ledger=ledger
+        )
+        await batch_.open_connection_pool()
+        with mock.patch.object(batch_, "bulk_load", wraps=batch_.bulk_load) as bulk_load:
+            await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        # The first two batches are skipped
+        assert [call.args[0] for call in bulk_load.call_args_list] == [(50, 75), (75, 100)]
+        data = fetch_result(
+            self.postgres_, f"select * from test_batch where test_id between {first_id} and {first_id + 99}"
+        )
+        assert_data_count(data, 100)
+
+    async def test_batch_insert_resumes_with_file_load_ledger(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ledger.jsonl")
+            await self.resume_failed_load(
+                lambda resume: FileLoadLedger(load_id="file-load", path=path, resume=resume), 5000
+            )
+
+    async def test_batch_insert_resumes_with_table_load_ledger(self):
+        await self.resume_failed_load(lambda resume: TableLoadLedger(load_id="table-load", resume=resume), 6000)
+
+        data = fetch_result(
+            self.postgres_, "select range_start, range_end from public.pg_bulk_loader_ledger where load_id = 'table-load'"
+        )
+        # The 4 batches and the conflicting row
+        assert_data_count(data, 5)
+
+    async def test_batch_insert_records_metrics_per_batch(self):
+        input_df = pd.DataFrame({
+            'test_id': range(7000, 7100),
+            'test_name': ["aditya"] * 100,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=40, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=2, max_conn=2
+        )
+        await batch_.open_connection_pool()
+        get_connection = batch_.pool.connection
+        attempts = []
+
+        def connection(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise psycopg.OperationalError("server closed the connection unexpectedly")
+            return get_connection(*args, **kwargs)
+
+        with mock.patch.object(batch_.pool, "connection", side_effect=connection), \
+                mock.patch("src.pg_bulk_loader.utils.async_retry.get_backoff_delay", return_value=0):
+            await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        batches = sorted(batch_.metrics.batches, key=lambda batch: batch.range_start)
+        assert [(batch.range_start, batch.rows) for batch in batches] == [(0, 40), (40, 40), (80, 20)]
+        assert sum(batch.retries for batch in batches) == 1
+        for batch in batches:
+            assert batch.bytes > 0
+            assert batch.copy_time > 0
+            assert batch.total_time >= batch.copy_time
+        assert sum(batch.encode_time for batch in batches) == pytest.approx(batch_.encode_time)
+        assert sum(batch.copy_time for batch in batches) == pytest.approx(batch_.io_time)
+
+    async def test_batch_insert_dry_run(self):
+        input_df = pd.DataFrame({
+            'test_id': range(8000, 9000),
+            'test_name': ["aditya"] * 1000,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=300, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=2, max_conn=2
+        )
+        with mock.patch.object(batch_.pool, "connection") as connection:
+            report = await batch_.execute(input_df, dry_run=True)
+        connection.assert_not_called()
+        await batch_.close_connection_pool()
+
+        assert report["batches"] == 4
+        assert report["rows"] == 1000
+        assert report["bytes"] > 0
+        assert report["concurrency"] == 2
+        assert report["rows_per_second"] > 0
+        assert report["peak_memory_bytes"] > 0
+        assert report["projected_wall_time"] > 0
+        # The dry run is not recorded as a load
+        assert batch_.metrics.batches == []
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 8000 and 8999")
+        assert_data_count(data, 0)
+
+    async def test_batch_insert_dry_run_leaves_the_tuning_untouched(self):
+        input_df = pd.DataFrame({
+            'test_id': range(8000, 18000),
+            'test_name': ["aditya"] * 10000,
+        })
+
+        tuner = BatchSizeTuner(initial_batch_size=100, min_batch_size=100, samples_per_step=1)
+        batch_ = BatchInsert(
+            batch_size="auto", table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=2, max_conn=4,
+            batch_size_tuner=tuner, adaptive_concurrency=True
+        )
+        limiter = batch_.concurrency_limiter
+        report = await batch_.execute(input_df, dry_run=True)
+        await batch_.close_connection_pool()
+
+        assert report["rows"] == 10000
+        # The timings of the null sink are not fed to the tuner and the limiter of the real load
+        assert batch_.batch_size_tuner is tuner and batch_.concurrency_limiter is limiter
+        assert tuner.history == [] and tuner.batch_size == 100
+        assert limiter.history == [] and limiter.limit == 2
+        assert batch_.encode_time == 0 and batch_.io_time == 0
+
+    async def test_batch_insert_dry_run_with_binary_copy_format(self):
+        input_df = pd.DataFrame({
+            'test_id': np.arange(100, dtype=np.int32),
+            'real_value': np.linspace(0, 1, 100),
+            'created_at': pd.date_range("2024-01-01", periods=100, freq="h"),
+        })
+
+        batch_ = BatchInsert(
+            batch_size=50, table_name="test_batch_binary", pg_conn_details=self.pg_connection, min_conn=1,
+            max_conn=1, copy_format="binary"
+        )
+        with mock.patch(
+                "src.pg_bulk_loader.batch.batch_insert.BinaryCopyEncoder", wraps=BinaryCopyEncoder
+        ) as encoder:
+            report = await batch_.execute(input_df, dry_run=True)
+        await batch_.close_connection_pool()
+
+        encoder.assert_called_once_with(["int4", "float8", "timestamp"])
+        assert report["rows"] == 100
+
+    async def test_batch_insert_when_commit_every_batches_is_invalid(self):
+        with pytest.raises(Exception) as e:
+            BatchInsert(
+                batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, commit_every_batches=0
+            )
+        assert str(e.value) == "Commit every batches must be a positive integer!"
+
+    async def test_batch_insert_groups_batches_in_transactions(self):
+        input_df = pd.DataFrame({
+            'test_id': range(9000, 9100),
+            'test_name': ["aditya"] * 100,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+            commit_every_batches=4
+        )
+        await batch_.open_connection_pool()
+        with mock.patch.object(batch_.pool, "connection", wraps=batch_.pool.connection) as connection:
+            await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        # 4 + 4 + 2 batches
+        assert connection.call_count == 3
+        assert len(batch_.metrics.batches) == 10
+        assert sum(batch.rows for batch in batch_.metrics.batches) == 100
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 9000 and 9099")
+        assert_data_count(data, 100)
+
+    async def test_batch_insert_commits_every_bytes(self):
+        input_df = pd.DataFrame({
+            'test_id': range(9100, 9200),
+            'test_name': ["aditya"] * 100,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=2, max_conn=2,
+            commit_every_bytes=300
+        )
+        await batch_.open_connection_pool()
+        with mock.patch.object(batch_.pool, "connection", wraps=batch_.pool.connection) as connection:
+            await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        # A batch of 10 rows is about 120 bytes, 3 batches make a transaction
+        assert connection.call_count == 4
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 9100 and 9199")
+        assert_data_count(data, 100)
+
+    async def test_batch_insert_retries_the_whole_transaction(self):
+        input_df = pd.DataFrame({
+            'test_id': range(9200, 9300),
+            'test_name': ["aditya"] * 100,
+        })
+
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, min_conn=1, max_conn=1,
+            commit_every_batches=5
+        )
+        await batch_.open_connection_pool()
+        copy_range = batch_.copy_range
+        copied_ranges = []
+
+        async def failing_copy_range(pg_session, range_, *args, **kwargs):
+            copied_ranges.append(range_)
+            if len(copied_ranges) == 3:
+                raise psycopg.OperationalError("server closed the connection unexpectedly")
+            return await copy_range(pg_session, range_, *args, **kwargs)
+
+        with mock.patch.object(batch_, "copy_range", side_effect=failing_copy_range), \
+                mock.patch("src.pg_bulk_loader.utils.async_retry.get_backoff_delay", return_value=0):
+            await batch_.execute(input_df)
+        await batch_.close_connection_pool()
+
+        # The first two batches are rolled back along with the failed one and loaded again
+        assert copied_ranges[:5] == [(0, 10), (10, 20), (20, 30), (0, 10), (10, 20)]
+        assert sorted(batch.retries for batch in batch_.metrics.batches) == [0] * 7 + [1] * 3
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 9200 and 9299")
+        assert_data_count(data, 100)
+
+    async def test_batch_insert_with_session_settings(self):
+        input_df = pd.DataFrame({
+            'test_id': range(9300, 9350),
+            'test_name': ["aditya"] * 50,
+        })
+        pg_connection = PgConnectionDetail(
+            user=self.pg_connection.user, password="", database="postgres", schema="public",
+            host=self.pg_connection.host, port=self.pg_connection.port,
+            session_settings={"synchronous_commit": "off", "work_mem": "16MB"}
+        )
+
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch", pg_conn_details=pg_connection, min_conn=1, max_conn=1,
+            session_settings={"work_mem": "32MB", "application_name": "test_load"}
+        )
+        assert batch_.session_settings == {
+            "synchronous_commit": "off", "work_mem": "32MB", "application_name": "test_load"
+        }
+        await batch_.open_connection_pool()
+        try:
+            async with batch_.pool.connection() as pg_session:
+                cursor = await pg_session.execute(
+                    "select current_setting('synchronous_commit'), current_setting('work_mem'), "
+                    "current_setting('application_name')"
+                )
+                assert await cursor.fetchone() == ("off", "32MB", "test_load")
+            await batch_.execute(input_df)
+        finally:
+            await batch_.close_connection_pool()
+
+        # Validate from DB
+        data = fetch_result(self.postgres_, "select * from test_batch where test_id between 9300 and 9349")
+        assert_data_count(data, 50)
+
+    def create_freeze_table(self):
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_conn.execute("""
+                DROP TABLE IF EXISTS public.test_batch_freeze;
+                CREATE TABLE public.test_batch_freeze (test_id int4 PRIMARY KEY, test_name varchar NOT NULL);
+                INSERT INTO public.test_batch_freeze SELECT i, 'old' FROM generate_series(1, 50) i;
+            """)
+            pg_conn.commit()
+        finally:
+            pg_conn.close()
+
+    async def test_batch_insert_with_invalid_mode(self):
+        with pytest.raises(Exception) as e:
+            BatchInsert(batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, mode="merge")
+        assert str(e.value) == "Invalid load mode! Supported modes are ('append', 'truncate', 'upsert')"
+
+        with pytest.raises(Exception) as e:
+            BatchInsert(
+                batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, mode="truncate",
+                load_ledger=FileLoadLedger("load", "ledger.jsonl")
+            )
+        assert str(e.value) == "A load ledger can't be used with mode='truncate'!"
+
+        with pytest.raises(Exception) as e:
+            BatchInsert(
+                batch_size="auto", table_name="test_batch", pg_conn_details=self.pg_connection, mode="truncate"
+            )
+        assert str(e.value) == "Batch size 'auto' can't be used with mode='truncate'!"
+
+        with pytest.raises(Exception) as e:
+            BatchInsert(
+                batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, mode="truncate",
+                adaptive_concurrency=True
+            )
+        assert str(e.value) == "Adaptive concurrency can't be used with mode='truncate'!"
+
+    async def test_batch_insert_in_truncate_mode(self):
+        self.create_freeze_table()
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch_freeze", pg_conn_details=self.pg_connection, min_conn=2,
+            max_conn=2, mode="truncate", copy_format="binary"
+        )
+        await batch_.open_connection_pool()
+        copy_range = batch_.copy_range
+        freeze_flags = []
+
+        async def tracked_copy_range(*args, **kwargs):
+            freeze_flags.append(kwargs.get("freeze"))
+            return await copy_range(*args, **kwargs)
+
+        try:
+            with mock.patch.object(batch_, "copy_range", side_effect=tracked_copy_range):
+                await batch_.execute(pd.DataFrame({'test_id': range(100, 125), 'test_name': ["new"] * 25}))
+                await batch_.execute(pd.DataFrame({'test_id': range(125, 150), 'test_name': ["new"] * 25}))
+            await batch_.finish()
+        finally:
+            await batch_.close_connection_pool()
+
+        # The COPY FREEZE of every batch was accepted since the table was truncated in the same transaction
+        assert freeze_flags == [True] * 6
+        assert batch_.metrics.summary()["batches"] == 6
+        data = fetch_result(self.postgres_, "select * from test_batch_freeze")
+        assert sorted(data["test_id"]) == list(range(100, 150))
+
+    async def test_batch_insert_in_truncate_mode_rolls_back_a_failed_load(self):
+        self.create_freeze_table()
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch_freeze", pg_conn_details=self.pg_connection, min_conn=1,
+            max_conn=1, mode="truncate"
+        )
+        await batch_.open_connection_pool()
+        try:
+            await batch_.execute(pd.DataFrame({'test_id': range(100, 125), 'test_name': ["new"] * 25}))
+            with pytest.raises(psycopg.errors.NotNullViolation):
+                await batch_.execute(pd.DataFrame({'test_id': [200, 201], 'test_name': ["new", None]}))
+        finally:
+            await batch_.close_connection_pool()
+
+        assert batch_.freeze_session is None
+        assert batch_.metrics.summary()["failed_batches"] == 1
+        # The table is left untouched
+        data = fetch_result(self.postgres_, "select * from test_batch_freeze")
+        assert sorted(data["test_id"]) == list(range(1, 51))
+
+    async def test_batch_insert_in_truncate_mode_without_data(self):
+        self.create_freeze_table()
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch_freeze", pg_conn_details=self.pg_connection, mode="truncate"
+        )
+        await batch_.open_connection_pool()
+        try:
+            await batch_.execute(pd.DataFrame({'test_id': [], 'test_name': []}))
+            await batch_.finish()
+        finally:
+            await batch_.close_connection_pool()
+
+        assert_data_count(fetch_result(self.postgres_, "select * from test_batch_freeze"), 0)
+
+    async def test_batch_insert_in_truncate_mode_into_a_partitioned_table(self):
+        self.create_partitioned_table()
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_conn.execute("INSERT INTO public.test_batch_partitioned SELECT i, 'old' FROM generate_series(1, 50) i")
+            pg_conn.commit()
+        finally:
+            pg_conn.close()
+
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch_partitioned", pg_conn_details=self.pg_connection, mode="truncate"
+        )
+        await batch_.open_connection_pool()
+        try:
+            await batch_.execute(pd.DataFrame({'test_id': range(90, 115), 'test_name': ["new"] * 25}))
+            await batch_.finish()
+        finally:
+            await batch_.close_connection_pool()
+
+        # The partitioned table rejects COPY FREEZE, its rows are COPYed without it
+        assert batch_.freeze_partitioned
+        assert batch_.metrics.summary()["batches"] == 3
+        data = fetch_result(self.postgres_, "select * from test_batch_partitioned")
+        assert sorted(data["test_id"]) == list(range(90, 115))
+
+    async def test_batch_insert_in_upsert_mode(self):
+        self.create_freeze_table()
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch_freeze", pg_conn_details=self.pg_connection, min_conn=3,
+            max_conn=3, mode="upsert", conflict_columns=["test_id"], commit_every_batches=2
+        )
+        # Keys 41 to 60 update 41 to 50 and insert 51 to 60, key 45 is given twice and the last row wins
+        data_df = pd.DataFrame({'test_id': [*range(60, 40, -1), 45], 'test_name': ["new"] * 20 + ["last"]})
+        await batch_.open_connection_pool()
+        try:
+            await batch_.execute(data_df)
+        finally:
+            await batch_.close_connection_pool()
+
+        assert batch_.metrics.summary()["rows"] == 20
+        # Every batch is a slice of the sorted keys
+        assert sorted((batch.range_start, batch.range_end) for batch in batch_.metrics.batches) == [(0, 10), (10, 20)]
+        data = fetch_result(self.postgres_, "select * from test_batch_freeze order by test_id")
+        assert list(data["test_id"]) == list(range(1, 61))
+        assert list(data["test_name"]) == ["old"] * 40 + ["new"] * 4 + ["last"] + ["new"] * 15
+
+    async def test_batch_insert_in_upsert_mode_without_update_columns(self):
+        self.create_freeze_table()
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch_freeze", pg_conn_details=self.pg_connection, mode="upsert",
+            conflict_columns=["test_id"], update_columns=[], copy_format="binary"
+        )
+        await batch_.open_connection_pool()
+        try:
+            await batch_.execute(pd.DataFrame({'test_id': range(46, 56), 'test_name': ["new"] * 10}))
+        finally:
+            await batch_.close_connection_pool()
+
+        # The conflicting rows are skipped
+        data = fetch_result(self.postgres_, "select * from test_batch_freeze order by test_id")
+        assert list(data["test_name"]) == ["old"] * 50 + ["new"] * 5
+
+    async def test_batch_insert_in_upsert_mode_with_invalid_conflict_columns(self):
+        with pytest.raises(Exception) as e:
+            BatchInsert(batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, mode="upsert")
+        assert str(e.value) == "Conflict columns are required with mode='upsert'!"
+
+        batch_ = BatchInsert(
+            batch_size=10, table_name="test_batch", pg_conn_details=self.pg_connection, mode="upsert",
+            conflict_columns=["id"]
+        )
+        with pytest.raises(Exception) as e:
+            await batch_.execute(pd.DataFrame({'test_id': [1], 'test_name': ["new"]}))
+        assert str(e.value) == "Conflict columns ['id'] are missing from the data!"
+
+    def create_partitioned_table(self):
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_conn.execute("""
+                DROP TABLE IF EXISTS public.test_batch_partitioned;
+                CREATE TABLE public.test_batch_partitioned (test_id int4 NOT NULL, test_name varchar NOT NULL)
+                PARTITION BY RANGE (test_id);
+                CREATE TABLE public.test_batch_partitioned_1 PARTITION OF public.test_batch_partitioned
+                FOR VALUES FROM (MINVALUE) TO (100);
+                CREATE TABLE public.test_batch_partitioned_2 PARTITION OF public.test_batch_partitioned
+                FOR VALUES FROM (100) TO (200);
+                CREATE TABLE public.test_batch_partitioned_default PARTITION OF public.test_batch_partitioned DEFAULT;
+            """)
+            pg_conn.commit()
+        finally:
+            pg_conn.close()
+
+    async def test_batch_insert_with_partition_routing(self):
+        self.create_partitioned_table()
+        batch_ = BatchInsert(
+            batch_size=20, table_name="test_batch_partitioned", pg_conn_details=self.pg_connection, min_conn=2,
+            max_conn=2, partition_routing=True
+        )
+        data_df = pd.DataFrame({'test_id': range(250), 'test_name': ["new"] * 250}).sample(frac=1, random_state=1)
+        await batch_.open_connection_pool()
+        try:
+            await batch_.execute(data_df)
+        finally:
+            await batch_.close_connection_pool()
+
+        # 5 batches per partition, the rows of the default partition are routed by postgres
+        batches = [(batch.table_name, batch.rows) for batch in batch_.metrics.batches]
+        assert sorted(set(batches)) == [
+            ("public.test_batch_partitioned", 10), ("public.test_batch_partitioned", 20),
+            ("public.test_batch_partitioned_1", 20), ("public.test_batch_partitioned_2", 20)
+        ]
+        assert len(batches) == 13
+        result = fetch_result(self.postgres_, """
+            select tableoid::regclass::text, count(1) from test_batch_partitioned group by 1 order by 1
+        """)
+        assert result.values.tolist() == [
+            ["test_batch_partitioned_1", 100], ["test_batch_partitioned_2", 100],
+            ["test_batch_partitioned_default", 50]
+        ]
+
+    async def test_batch_insert_with_partition_routing_in_truncate_mode(self):
+        self.create_partitioned_table()
+        batch_ = BatchInsert(
+            batch_size=50, table_name="test_batch_partitioned", pg_conn_details=self.pg_connection,
+            partition_routing=True, mode="truncate"
+        )
+        await batch_.open_connection_pool()
+        try:
+            # The row 500 belongs to the default partition, it is COPYed through the partitioned table
+            await batch_.execute(pd.DataFrame({'test_id': [*range(149, 49, -1), 500], 'test_name': ["new"] * 101}))
+            await batch_.finish()
+        finally:
+            await batch_.close_connection_pool()
+
+        # COPY FREEZE is accepted by the partitions truncated with the table, the partitioned table is loaded without
+        assert sorted(batch.table_name for batch in batch_.metrics.batches) == [
+            "public.test_batch_partitioned", "public.test_batch_partitioned_1", "public.test_batch_partitioned_2"
+        ]
+        result = fetch_result(self.postgres_, """
+            select tableoid::regclass::text, count(1) from test_batch_partitioned group by 1 order by 1
+        """)
+        assert result.values.tolist() == [
+            ["test_batch_partitioned_1", 50], ["test_batch_partitioned_2", 50], ["test_batch_partitioned_default", 1]
+        ]
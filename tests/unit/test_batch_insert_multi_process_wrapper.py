@@ -4,7 +4,9 @@ import testing.postgresql
 import pandas as pd
 from src.pg_bulk_loader.batch.batch_insert_wrapper import batch_insert_to_postgres_with_multi_process
 from src.pg_bulk_loader.batch.pg_connection_detail import PgConnectionDetail
-from .pg_helper import init_db, fetch_rows_count_and_assert, truncate_table_and_assert, create_indexes, drop_indexes
+from .pg_helper import (
+    init_db, fetch_rows_count_and_assert, truncate_table_and_assert, create_indexes, drop_indexes, fetch_rows_count
+)
 
 
 class TestBatchInsertMultiProcessWrapper(unittest.IsolatedAsyncioTestCase):
@@ -229,3 +231,176 @@ class TestBatchInsertMultiProcessWrapper(unittest.IsolatedAsyncioTestCase):
 
         # Truncate table and assert
         truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_ms_with_shared_memory(self):
+        df_data_generator = pd.read_csv("tests/unit/aopd-1k.csv", chunksize=300)
+        await batch_insert_to_postgres_with_multi_process(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            data_generator=df_data_generator,
+            batch_size=100,
+            min_conn_pool_size=3,
+            max_conn_pool_size=5,
+            no_of_processes=2,
+            drop_and_create_index=False,
+            use_shared_memory=True
+        )
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_ms_with_persistent_workers(self):
+        df_data_generator = pd.read_csv("tests/unit/aopd-1k.csv", chunksize=100)
+        await batch_insert_to_postgres_with_multi_process(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            data_generator=df_data_generator,
+            batch_size=50,
+            min_conn_pool_size=2,
+            max_conn_pool_size=2,
+            no_of_processes=2,
+            drop_and_create_index=False,
+            persistent_workers=True
+        )
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_ms_with_persistent_workers_and_shared_memory(self):
+        df_data_generator = pd.read_csv("tests/unit/aopd-1k.csv", chunksize=100)
+        await batch_insert_to_postgres_with_multi_process(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            data_generator=df_data_generator,
+            batch_size=50,
+            min_conn_pool_size=2,
+            max_conn_pool_size=2,
+            no_of_processes=2,
+            drop_and_create_index=False,
+            use_shared_memory=True,
+            persistent_workers=True
+        )
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_ms_pulls_next_df_only_when_a_task_completes(self):
+        """
+        With one process and one task per process, the next df is pulled from the generator only once the previous
+        one is completely loaded.
+        """
+        rows_loaded_when_pulled = []
+
+        def df_data_generator():
+            for df in pd.read_csv("tests/unit/aopd-1k.csv", chunksize=250):
+                rows_loaded_when_pulled.append(fetch_rows_count(self.pg_connection, "aop_dummy"))
+                yield df
+
+        await batch_insert_to_postgres_with_multi_process(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            data_generator=df_data_generator(),
+            batch_size=100,
+            min_conn_pool_size=1,
+            max_conn_pool_size=1,
+            no_of_processes=1,
+            drop_and_create_index=False,
+            max_tasks_per_process=1
+        )
+
+        assert rows_loaded_when_pulled == [0, 250, 500, 750]
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_ms_when_max_tasks_per_process_is_invalid(self):
+        df_data_generator = pd.read_csv("tests/unit/aopd-1k.csv", chunksize=300)
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres_with_multi_process(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                data_generator=df_data_generator,
+                batch_size=100,
+                min_conn_pool_size=3,
+                max_conn_pool_size=5,
+                no_of_processes=2,
+                drop_and_create_index=False,
+                max_tasks_per_process=0
+            )
+
+        assert str(e.value) == "Max tasks per process must be a positive integer!"
+
+    async def test_batch_insert_ms_reports_metrics_of_all_processes(self):
+        df_data_generator = pd.read_csv("tests/unit/aopd-1k.csv", chunksize=250)
+        metrics = await batch_insert_to_postgres_with_multi_process(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            data_generator=df_data_generator,
+            batch_size=100,
+            min_conn_pool_size=2,
+            max_conn_pool_size=2,
+            no_of_processes=2,
+            drop_and_create_index=False,
+            persistent_workers=True
+        )
+
+        # 3 batches per generated df
+        summary = metrics.summary()
+        assert summary["batches"] == 12
+        assert summary["rows"] == 1000
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_ms_in_fast_mode_restores_the_table_on_failure(self):
+        create_indexes(self.pg_connection)
+        loaded_unlogged = []
+
+        def df_data_generator():
+            pg_conn = self.pg_connection.get_psycopg_connection()
+            try:
+                query = "select relpersistence from pg_class where oid = 'public.aop_dummy'::regclass"
+                loaded_unlogged.append(pg_conn.execute(query).fetchone()[0] == "u")
+            finally:
+                pg_conn.close()
+            raise Exception("Custom Exception!")
+            yield
+
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres_with_multi_process(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                data_generator=df_data_generator(),
+                batch_size=100,
+                min_conn_pool_size=1,
+                max_conn_pool_size=1,
+                no_of_processes=1,
+                drop_and_create_index=True,
+                fast_mode=True
+            )
+
+        assert str(e.value) == "Custom Exception!"
+        assert loaded_unlogged == [True]
+        # The dropped indexes were re-created and the table switched back to LOGGED
+        drop_indexes(self.pg_connection)
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            query = "select relpersistence from pg_class where oid = 'public.aop_dummy'::regclass"
+            assert pg_conn.execute(query).fetchone()[0] == "p"
+        finally:
+            pg_conn.close()
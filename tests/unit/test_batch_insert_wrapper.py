@@ -1,12 +1,20 @@
+import asyncio
+import sqlite3
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch
 
 import pytest
 import testing.postgresql
 import pandas as pd
 
-from src.pg_bulk_loader.batch.batch_insert_wrapper import batch_insert_to_postgres
+from src.pg_bulk_loader.batch.batch_insert_wrapper import (
+    batch_insert_to_postgres, prefetch_data, run_batch_task, END_OF_DATA
+)
 from src.pg_bulk_loader.batch.pg_connection_detail import PgConnectionDetail
+from src.pg_bulk_loader.batch.batch_size_tuner import BatchSizeTuner
+from src.pg_bulk_loader.batch.load_metrics import LoadMetrics
+from src.pg_bulk_loader.batch.load_ledger import FileLoadLedger
 from .pg_helper import init_db, fetch_rows_count_and_assert, truncate_table_and_assert, create_indexes, drop_indexes
 
 
@@ -128,6 +136,37 @@ class TestBatchInsertWrapper(unittest.IsolatedAsyncioTestCase):
         # Truncate table and assert
         truncate_table_and_assert(self.pg_connection, "aop_dummy")
 
+    async def test_batch_insert_reports_the_index_builds(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        create_indexes(self.pg_connection)
+
+        metrics = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df,
+            batch_size=200,
+            min_conn_pool_size=5,
+            max_conn_pool_size=7,
+            use_multi_process_for_create_index=True,
+            drop_and_create_index=True,
+            max_parallel_index_builds=2,
+            maintenance_work_mem_budget=128 * 1024 ** 2
+        )
+        drop_indexes(self.pg_connection)
+
+        assert sorted(build["index"] for build in metrics.index_builds) == [
+            "public.aop_dummy_batch_scope_index", "public.p_s_aopd_index"
+        ]
+        for build in metrics.index_builds:
+            assert build["error"] is None and build["duration"] >= 0 and build["size"] > 0
+            assert build["maintenance_work_mem"] == "65536kB"
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
     async def test_batch_insert_when_table_have_indexes_and_drop_and_create_index_is_false(self):
         input_df = pd.read_csv("tests/unit/aopd-1k.csv")
         create_indexes(self.pg_connection)
@@ -217,3 +256,580 @@ class TestBatchInsertWrapper(unittest.IsolatedAsyncioTestCase):
 
         # Truncate table and assert
         truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_when_data_generator_raises_exception(self):
+        def input_df_generator():
+            yield from pd.read_csv("tests/unit/aopd-1k.csv", chunksize=500)
+            raise Exception("Generator failed!")
+
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=input_df_generator(),
+                batch_size=200,
+                min_conn_pool_size=2,
+                max_conn_pool_size=3,
+                use_multi_process_for_create_index=False,
+                drop_and_create_index=False,
+                prefetch_queue_depth=1
+            )
+        assert str(e.value) == "Generator failed!"
+
+        # Everything yielded before the failure is loaded
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_when_prefetch_queue_depth_is_invalid(self):
+        input_df_generator = pd.read_csv("tests/unit/aopd-1k.csv", chunksize=500)
+
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=input_df_generator,
+                batch_size=200,
+                min_conn_pool_size=2,
+                max_conn_pool_size=3,
+                use_multi_process_for_create_index=False,
+                drop_and_create_index=False,
+                prefetch_queue_depth=-1
+            )
+        assert str(e.value) == "Prefetch queue depth must be a non-negative integer!"
+
+    async def test_prefetch_data_applies_backpressure(self):
+        pulled = []
+
+        def input_df_generator():
+            for i in range(5):
+                pulled.append(i)
+                yield pd.DataFrame({'test': [i]})
+
+        queue = asyncio.Queue(maxsize=2)
+        executor = ThreadPoolExecutor(max_workers=1)
+        producer = asyncio.create_task(prefetch_data(input_df_generator(), queue, executor))
+        await asyncio.sleep(0.2)
+
+        # Two DataFrames wait in the queue and the producer is blocked on the third one
+        assert pulled == [0, 1, 2]
+
+        results = []
+        while (data_df := await queue.get()) is not END_OF_DATA:
+            results.append(data_df['test'][0])
+        await producer
+        executor.shutdown()
+        assert results == [0, 1, 2, 3, 4]
+
+    async def test_batch_insert_when_data_generator_is_tied_to_its_thread(self):
+        sqlite_conn = sqlite3.connect(":memory:")
+        try:
+            pd.read_csv("tests/unit/aopd-1k.csv").to_sql("aop_dummy", sqlite_conn, index=False)
+            # The sqlite3 connection can only be used in the thread it was created in
+            input_df_generator = pd.read_sql("select * from aop_dummy", sqlite_conn, chunksize=300)
+
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=input_df_generator,
+                batch_size=200,
+                min_conn_pool_size=2,
+                max_conn_pool_size=3,
+                use_multi_process_for_create_index=False,
+                drop_and_create_index=False
+            )
+        finally:
+            sqlite_conn.close()
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    @patch("src.pg_bulk_loader.batch.batch_insert_wrapper._process_batch_size_tuner", None)
+    @patch("src.pg_bulk_loader.batch.batch_insert_wrapper.run")
+    def test_run_batch_task_shares_the_batch_size_tuner_of_the_process(self, mock_run):
+        mock_run.return_value = None
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        for _ in range(2):
+            run_batch_task(input_df, "auto", self.pg_connection, "aop_dummy", 2, 2, {"batch_bytes": 1024 ** 2})
+
+        tuners = [call.kwargs["batch_size_tuner"] for call in mock_run.call_args_list]
+        assert tuners[0] is tuners[1]
+        assert tuners[0].max_batch_bytes == 1024 ** 2
+
+    async def test_batch_insert_with_batch_bytes_and_without_batch_size(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+
+        await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df,
+            batch_size=None,
+            min_conn_pool_size=2,
+            max_conn_pool_size=3,
+            use_multi_process_for_create_index=False,
+            drop_and_create_index=False,
+            batch_bytes=16 * 1024
+        )
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_with_auto_batch_size(self):
+        input_df_generator = pd.read_csv("tests/unit/aopd-1k.csv", chunksize=500)
+        tuner = BatchSizeTuner(initial_batch_size=100, min_batch_size=50, samples_per_step=1)
+
+        await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df_generator,
+            batch_size="auto",
+            min_conn_pool_size=2,
+            max_conn_pool_size=3,
+            use_multi_process_for_create_index=False,
+            drop_and_create_index=False,
+            batch_size_tuner=tuner
+        )
+
+        # The tuner is shared by all the generated DataFrames
+        assert sum(entry["rows"] for entry in tuner.history) == 1000
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_reports_metrics(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        exported = []
+        metrics = LoadMetrics(callbacks=[exported.append])
+
+        result = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df,
+            batch_size=250,
+            min_conn_pool_size=2,
+            max_conn_pool_size=3,
+            use_multi_process_for_create_index=False,
+            drop_and_create_index=False,
+            metrics=metrics
+        )
+
+        assert result is metrics
+        assert sorted((batch.range_start, batch.range_end) for batch in exported) == [
+            (0, 250), (250, 500), (500, 750), (750, 1000)
+        ]
+        summary = metrics.summary()
+        assert summary["batches"] == 4
+        assert summary["rows"] == 1000
+        assert summary["bytes"] > 0
+        assert summary["copy_time"]["total"] > 0
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_dry_run_with_data_generator(self):
+        input_df_generator = pd.read_csv("tests/unit/aopd-1k.csv", chunksize=400)
+
+        with patch("src.pg_bulk_loader.batch.batch_insert_wrapper.FastLoadHack.get_indexes") as get_indexes:
+            report = await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=input_df_generator,
+                batch_size=200,
+                min_conn_pool_size=2,
+                max_conn_pool_size=3,
+                drop_and_create_index=True,
+                dry_run=True
+            )
+        get_indexes.assert_not_called()
+
+        assert report["rows"] == 1000
+        # 2 + 2 + 1 batches
+        assert report["batches"] == 5
+        assert report["bytes"] > 0
+        assert report["projected_wall_time"] > 0
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=0)
+
+    async def test_batch_insert_with_transaction_grouping(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+
+        metrics = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df,
+            batch_size=50,
+            min_conn_pool_size=2,
+            max_conn_pool_size=2,
+            drop_and_create_index=False,
+            commit_every_batches=5
+        )
+
+        assert metrics.summary()["batches"] == 20
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_with_auto_drop_and_create_index(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        create_indexes(self.pg_connection)
+
+        # Into an empty table, re-creating the indexes is cheaper
+        metrics = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df,
+            batch_size=200,
+            min_conn_pool_size=2,
+            max_conn_pool_size=2,
+            drop_and_create_index="auto"
+        )
+        assert len(metrics.index_builds) == 2
+
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_conn.execute("ANALYZE public.aop_dummy")
+            pg_conn.commit()
+        finally:
+            pg_conn.close()
+
+        # A few rows appended to a populated table are cheaper to insert in the indexes
+        with self.assertLogs("src.pg_bulk_loader.batch.fast_load_hack", level="INFO") as logs:
+            metrics = await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=input_df.head(10).assign(p_code="appended"),
+                batch_size=200,
+                min_conn_pool_size=2,
+                max_conn_pool_size=2,
+                drop_and_create_index="auto"
+            )
+        assert metrics.index_builds == []
+        assert len(logs.records) == 2
+        assert all("is kept (10 incoming rows, table of ~1000 rows" in record.message for record in logs.records)
+
+        # The indexes were kept
+        drop_indexes(self.pg_connection)
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1010)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    async def test_batch_insert_with_disabled_constraints_and_triggers(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_conn.execute("""
+                CREATE FUNCTION public.reject_aop() RETURNS trigger AS $$
+                    BEGIN RAISE EXCEPTION 'trigger fired'; END;
+                $$ LANGUAGE plpgsql;
+                CREATE TRIGGER aop_reject BEFORE INSERT ON public.aop_dummy
+                    FOR EACH ROW EXECUTE FUNCTION public.reject_aop();
+            """)
+            pg_conn.commit()
+
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=input_df,
+                batch_size=200,
+                min_conn_pool_size=2,
+                max_conn_pool_size=2,
+                drop_and_create_index=False,
+                disable_constraints_and_triggers=True
+            )
+
+            # The trigger is enabled again
+            result = pg_conn.execute("select tgenabled from pg_trigger where tgname = 'aop_reject'").fetchone()
+            assert result == ("O",)
+        finally:
+            pg_conn.execute("DROP TRIGGER aop_reject ON public.aop_dummy; DROP FUNCTION public.reject_aop")
+            pg_conn.commit()
+            pg_conn.close()
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    @patch("src.pg_bulk_loader.batch.batch_insert_wrapper.FastLoadHack.disable_constraints_and_triggers")
+    async def test_batch_insert_recreates_the_indexes_when_disabling_the_constraints_fails(self, mock_disable):
+        create_indexes(self.pg_connection)
+        mock_disable.side_effect = Exception("Lock timeout!")
+
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=pd.read_csv("tests/unit/aopd-1k.csv"),
+                batch_size=200,
+                use_multi_process_for_create_index=False,
+                drop_and_create_index=True,
+                disable_constraints_and_triggers=True
+            )
+        assert str(e.value) == "Lock timeout!"
+        # The dropped indexes were re-created, dropping them fails otherwise
+        drop_indexes(self.pg_connection)
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=0)
+
+    def is_aop_dummy_logged(self):
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            query = "select relpersistence from pg_class where oid = 'public.aop_dummy'::regclass"
+            return pg_conn.execute(query).fetchone()[0] == "p"
+        finally:
+            pg_conn.close()
+
+    async def test_batch_insert_in_fast_mode(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        create_indexes(self.pg_connection)
+
+        metrics = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df,
+            batch_size=200,
+            min_conn_pool_size=2,
+            max_conn_pool_size=2,
+            drop_and_create_index=True,
+            fast_mode=True
+        )
+        assert metrics.set_logged_time > 0
+        assert len(metrics.index_builds) == 2
+        assert self.is_aop_dummy_logged()
+        drop_indexes(self.pg_connection)
+
+        # Validate from DB
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    @patch("src.pg_bulk_loader.batch.batch_insert_wrapper.run")
+    async def test_batch_insert_in_fast_mode_restores_the_table_on_failure(self, mock_run):
+        loaded_unlogged = []
+
+        async def failing_run(*args, **kwargs):
+            loaded_unlogged.append(not self.is_aop_dummy_logged())
+            raise Exception("Custom Exception!")
+
+        mock_run.side_effect = failing_run
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=pd.read_csv("tests/unit/aopd-1k.csv"),
+                batch_size=200,
+                drop_and_create_index=False,
+                fast_mode=True
+            )
+        assert str(e.value) == "Custom Exception!"
+        assert loaded_unlogged == [True]
+        assert self.is_aop_dummy_logged()
+
+    async def test_batch_insert_in_fast_mode_when_it_is_unsafe(self):
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_conn.execute("CREATE PUBLICATION aop_publication FOR TABLE public.aop_dummy")
+            pg_conn.commit()
+
+            with pytest.raises(Exception) as e:
+                await batch_insert_to_postgres(
+                    pg_conn_details=self.pg_connection,
+                    table_name="aop_dummy",
+                    input_data=pd.read_csv("tests/unit/aopd-1k.csv"),
+                    batch_size=200,
+                    drop_and_create_index=False,
+                    fast_mode=True
+                )
+            assert str(e.value) == "Fast mode is unsafe for aop_dummy: the table is published by ['aop_publication']!"
+        finally:
+            pg_conn.execute("DROP PUBLICATION aop_publication")
+            pg_conn.commit()
+            pg_conn.close()
+
+        # Nothing was loaded
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=0)
+
+    async def test_batch_insert_in_truncate_mode(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df.head(100),
+            batch_size=200,
+            drop_and_create_index=False
+        )
+
+        def data_generator():
+            yield input_df.head(500)
+            yield input_df.tail(500)
+
+        metrics = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=data_generator(),
+            batch_size=200,
+            drop_and_create_index=False,
+            mode="truncate"
+        )
+        assert metrics.summary()["batches"] == 6
+
+        # Validate from DB, the rows loaded before were replaced
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    def fetch_values(self, query):
+        pg_conn = self.pg_connection.get_psycopg_connection()
+        try:
+            return [row[0] for row in pg_conn.execute(query).fetchall()]
+        finally:
+            pg_conn.close()
+
+    async def test_batch_insert_in_truncate_mode_with_an_empty_df(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df.head(100),
+            batch_size=200,
+            drop_and_create_index=False
+        )
+
+        metrics = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df.head(0),
+            batch_size=200,
+            drop_and_create_index=False,
+            mode="truncate"
+        )
+        assert metrics.summary()["batches"] == 0
+
+        # Validate from DB, the table was truncated
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=0)
+
+    async def test_batch_insert_in_replace_mode(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        create_indexes(self.pg_connection)
+        await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df.head(100),
+            batch_size=200,
+            drop_and_create_index=False
+        )
+
+        metrics = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df,
+            batch_size=200,
+            min_conn_pool_size=2,
+            max_conn_pool_size=2,
+            mode="replace"
+        )
+        assert metrics.summary()["batches"] == 5
+        # The primary key and the 2 indexes are built on the shadow table
+        assert len(metrics.index_builds) == 3
+        assert self.fetch_values(
+            "select indexrelid::regclass::text from pg_index where indrelid = 'aop_dummy'::regclass order by 1"
+        ) == [
+            "aggregated_order_projections_dummy_pk", "aop_dummy_batch_scope_index", "p_s_aopd_index"
+        ]
+        drop_indexes(self.pg_connection)
+
+        # Validate from DB, the rows loaded before were replaced
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
+
+    @patch("src.pg_bulk_loader.batch.batch_insert_wrapper.run")
+    async def test_batch_insert_in_replace_mode_drops_the_shadow_table_on_failure(self, mock_run):
+        mock_run.side_effect = Exception("Custom Exception!")
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=pd.read_csv("tests/unit/aopd-1k.csv"),
+                batch_size=200,
+                mode="replace"
+            )
+        assert str(e.value) == "Custom Exception!"
+        assert self.fetch_values("select to_regclass('aop_dummy__pg_bulk_loader_shadow')") == [None]
+
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=pd.read_csv("tests/unit/aopd-1k.csv"),
+                batch_size=200,
+                load_ledger=FileLoadLedger("load", "ledger.jsonl"),
+                mode="replace"
+            )
+        assert str(e.value) == "A load ledger can't be used with mode='replace'!"
+
+    async def test_batch_insert_in_upsert_mode(self):
+        input_df = pd.read_csv("tests/unit/aopd-1k.csv")
+        await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=input_df.head(600),
+            batch_size=200,
+            drop_and_create_index=False
+        )
+
+        upsert_df = input_df.tail(600).copy()
+        upsert_df["mean"] = -1
+        metrics = await batch_insert_to_postgres(
+            pg_conn_details=self.pg_connection,
+            table_name="aop_dummy",
+            input_data=upsert_df,
+            batch_size=200,
+            drop_and_create_index=False,
+            mode="upsert",
+            conflict_columns=["p_code", "s_code", "_from"],
+            update_columns=["mean"]
+        )
+        assert metrics.summary()["rows"] == 600
+
+        # Validate from DB, the 200 rows in both loads were updated
+        fetch_rows_count_and_assert(self.pg_connection, "aop_dummy", expected=1000)
+        assert self.fetch_values("select count(*) from aop_dummy where mean = -1") == [600]
+
+        with pytest.raises(Exception) as e:
+            await batch_insert_to_postgres(
+                pg_conn_details=self.pg_connection,
+                table_name="aop_dummy",
+                input_data=upsert_df,
+                batch_size=200,
+                drop_and_create_index=False,
+                disable_constraints_and_triggers=True,
+                mode="upsert",
+                conflict_columns=["p_code", "s_code", "_from"]
+            )
+        assert str(e.value) == "Constraints and triggers can't be disabled with mode='upsert'!"
+
+        # Truncate table and assert
+        truncate_table_and_assert(self.pg_connection, "aop_dummy")
@@ -0,0 +1,75 @@
+import unittest
+import pytest
+from src.pg_bulk_loader.batch.batch_size_tuner import BatchSizeTuner
+
+
+def simulate(tuner: BatchSizeTuner, throughput, batches: int, row_size: int = 100):
+    """
+    Feeds the tuner with batches loaded at throughput(batch_size) rows/s
+    """
+    for _ in range(batches):
+        rows = tuner.next_batch_size()
+        tuner.record(rows, rows * row_size, rows / throughput(rows))
+
+
+class TestBatchSizeTuner(unittest.TestCase):
+
+    def test_tuner_when_bounds_are_invalid(self):
+        with pytest.raises(Exception) as e:
+            BatchSizeTuner(min_batch_size=10, max_batch_size=5)
+        assert str(e.value) == "Invalid batch size bounds!"
+
+    def test_tuner_converges_to_the_best_batch_size(self):
+        # Throughput peaks at 40000 rows per batch
+        def throughput(batch_size):
+            return 100000 - abs(batch_size - 40000)
+
+        tuner = BatchSizeTuner(initial_batch_size=10000, samples_per_step=1, tolerance=0.01)
+        simulate(tuner, throughput, batches=10)
+
+        assert tuner.phase == "converged"
+        assert tuner.best_batch_size == 40000
+        assert tuner.next_batch_size() == 40000
+        assert [entry["batch_size"] for entry in tuner.history[:5]] == [10000, 20000, 40000, 80000, 60000]
+
+    def test_tuner_shrinks_to_a_best_batch_size_below_the_initial_one(self):
+        # Throughput peaks at 2500 rows per batch
+        def throughput(batch_size):
+            return 100000 - abs(batch_size - 2500) * 5
+
+        tuner = BatchSizeTuner(initial_batch_size=10000, samples_per_step=1, tolerance=0.01)
+        simulate(tuner, throughput, batches=10)
+
+        assert tuner.phase == "converged"
+        assert tuner.best_batch_size == 2500
+        assert tuner.next_batch_size() == 2500
+        assert [entry["batch_size"] for entry in tuner.history[:6]] == [10000, 20000, 5000, 2500, 1250, 1875]
+
+    def test_tuner_stops_shrinking_at_min_batch_size(self):
+        tuner = BatchSizeTuner(initial_batch_size=4000, min_batch_size=1000, samples_per_step=1)
+        simulate(tuner, lambda batch_size: 10 ** 9 / batch_size, batches=10)
+
+        assert tuner.phase == "converged"
+        assert tuner.next_batch_size() == 1000
+
+    def test_tuner_stops_growing_at_max_batch_size(self):
+        tuner = BatchSizeTuner(initial_batch_size=1000, max_batch_size=5000, samples_per_step=1)
+        simulate(tuner, lambda batch_size: batch_size, batches=10)
+
+        assert tuner.phase == "converged"
+        assert tuner.next_batch_size() == 5000
+
+    def test_tuner_respects_the_memory_ceiling(self):
+        tuner = BatchSizeTuner(initial_batch_size=1000, max_batch_bytes=1000000, samples_per_step=1)
+        simulate(tuner, lambda batch_size: batch_size, batches=10, row_size=200)
+
+        # 1000000 bytes / 200 bytes per row
+        assert tuner.next_batch_size() == 5000
+
+    def test_tuner_ignores_partial_batches(self):
+        tuner = BatchSizeTuner(initial_batch_size=1000, samples_per_step=1)
+        tuner.record(10, 1000, 0.001)
+
+        assert tuner.next_batch_size() == 1000
+        assert len(tuner.history) == 1
+        assert tuner.history[0]["rows_per_second"] == 10000
@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+from unittest import mock
+import pytest
+from src.pg_bulk_loader.batch.concurrency_controller import AdaptiveConcurrencyLimiter
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("src.pg_bulk_loader.batch.concurrency_controller.time.perf_counter", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def load_window(self, limiter, rows, window_seconds, batch_seconds):
+        for _ in range(limiter.limit):
+            async with limiter:
+                pass
+        self.clock.now += window_seconds
+        for _ in range(limiter.limit):
+            await limiter.record_batch(rows, batch_seconds)
+
+    def test_limiter_when_limits_are_invalid(self):
+        with pytest.raises(Exception) as e:
+            AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=2, min_limit=3)
+        assert str(e.value) == "Invalid concurrency limits!"
+
+    def test_limiter_bounds_the_initial_limit(self):
+        assert AdaptiveConcurrencyLimiter(initial_limit=20, max_limit=4).limit == 4
+        assert AdaptiveConcurrencyLimiter(initial_limit=0, max_limit=4).limit == 1
+
+    async def test_limiter_increases_while_throughput_improves(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=3)
+        await self.load_window(limiter, rows=100, window_seconds=1, batch_seconds=1)
+        assert limiter.limit == 2
+
+        # Twice as many batches in the same time
+        await self.load_window(limiter, rows=100, window_seconds=1, batch_seconds=1)
+        assert limiter.limit == 3
+
+        # Capped at max_limit
+        await self.load_window(limiter, rows=100, window_seconds=0.5, batch_seconds=1)
+        assert limiter.limit == 3
+        assert [entry["limit"] for entry in limiter.history] == [2, 3]
+
+    async def test_limiter_holds_when_throughput_stalls(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=4)
+        await self.load_window(limiter, rows=100, window_seconds=1, batch_seconds=1)
+        assert limiter.limit == 2
+
+        # Same aggregate throughput with one more stream
+        await self.load_window(limiter, rows=100, window_seconds=2, batch_seconds=1.5)
+        assert limiter.limit == 2
+
+    async def test_limiter_decreases_on_latency_spike(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=8)
+        await self.load_window(limiter, rows=100, window_seconds=1, batch_seconds=1)
+        assert limiter.limit == 5
+
+        await self.load_window(limiter, rows=100, window_seconds=1, batch_seconds=3)
+        assert limiter.limit == 2
+        assert limiter.history[-1]["reason"] == "latency spike"
+
+    async def test_limiter_decreases_on_pool_timeout(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=8, min_limit=3)
+        limiter.record_timeout()
+        assert limiter.limit == 3
+        limiter.record_timeout()
+        assert limiter.limit == 3
+        assert [entry["reason"] for entry in limiter.history] == ["pool timeout"]
+
+    async def test_limiter_blocks_above_the_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+        max_in_flight = 0
+
+        async def task():
+            nonlocal max_in_flight
+            async with limiter:
+                max_in_flight = max(max_in_flight, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[task() for _ in range(6)])
+        assert max_in_flight == 2
+        assert limiter.in_flight == 0
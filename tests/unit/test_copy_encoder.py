@@ -0,0 +1,88 @@
+import struct
+import unittest
+import pytest
+import numpy as np
+import pandas as pd
+from src.pg_bulk_loader.batch.copy_encoder import (
+    BinaryCopyEncoder, CsvCopyEncoder, BINARY_COPY_HEADER, BINARY_COPY_TRAILER
+)
+
+
+class TestCopyEncoder(unittest.TestCase):
+
+    def test_csv_encoder(self):
+        input_df = pd.DataFrame({
+            'test_id': [1, 2],
+            'test_name': ["aditya", None],
+        })
+        assert CsvCopyEncoder().encode(input_df) == "1,aditya\n2,\n"
+
+    def test_binary_encoder_unsupported_columns(self):
+        input_df = pd.DataFrame({
+            'test_id': [1, 2],
+            'test_name': ["aditya", "adam"],
+            'amount': [1.5, 2.5],
+            'created_at': pd.to_datetime(["2024-01-01", "2024-01-02"]),
+            'big_id': np.array([1, 2], dtype=np.uint64),
+        })
+        pg_types = ["int4", "text", "numeric", "timestamptz", "int8"]
+        unsupported = BinaryCopyEncoder.unsupported_columns(input_df, pg_types)
+        assert unsupported == ["test_name", "amount", "created_at", "big_id"]
+
+    def test_binary_encoder_when_column_is_missing_in_table(self):
+        input_df = pd.DataFrame({'test_id': [1, 2]})
+        assert BinaryCopyEncoder.unsupported_columns(input_df, [None]) == ["test_id"]
+
+    def test_binary_encoder_without_nulls(self):
+        input_df = pd.DataFrame({
+            'test_id': [1, 2],
+            'flag': [True, False],
+        })
+        data = BinaryCopyEncoder(["int4", "bool"]).encode(input_df)
+
+        row_1 = struct.pack(">hiii?", 2, 4, 1, 1, True)
+        row_2 = struct.pack(">hiii?", 2, 4, 2, 1, False)
+        assert data == BINARY_COPY_HEADER + row_1 + row_2 + BINARY_COPY_TRAILER
+
+    def test_binary_encoder_with_nulls(self):
+        input_df = pd.DataFrame({
+            'test_id': pd.array([1, None], dtype="Int64"),
+            'value': [np.nan, 2.5],
+            'test_date': pd.to_datetime(["2000-01-02", None]),
+        })
+        data = BinaryCopyEncoder(["int8", "float8", "date"]).encode_rows(input_df)
+
+        row_1 = struct.pack(">hiqiii", 3, 8, 1, -1, 4, 1)
+        row_2 = struct.pack(">hiidi", 3, -1, 8, 2.5, -1)
+        assert data == row_1 + row_2
+
+    def test_binary_encoder_when_value_is_out_of_range(self):
+        input_df = pd.DataFrame({'test_id': [1, 2 ** 40]})
+        with pytest.raises(Exception) as e:
+            BinaryCopyEncoder(["int4"]).encode(input_df)
+        assert str(e.value) == "Value of column test_id is out of range for type int4!"
+
+    def test_csv_encoder_iter_chunks(self):
+        input_df = pd.DataFrame({
+            'test_id': range(1000),
+            'test_name': ["aditya"] * 1000,
+        })
+        encoder = CsvCopyEncoder()
+        chunks = list(encoder.iter_chunks(input_df, chunk_size=1024))
+
+        assert "".join(chunks) == encoder.encode(input_df)
+        # The row size is estimated from the previous chunk, only the probe chunk may exceed the chunk size largely
+        assert all(len(chunk) <= 1.25 * 1024 for chunk in chunks[1:])
+
+    def test_binary_encoder_iter_chunks(self):
+        input_df = pd.DataFrame({
+            'test_id': range(1000),
+            'value': [1.5, np.nan] * 500,
+        })
+        encoder = BinaryCopyEncoder(["int4", "float8"])
+        chunks = list(encoder.iter_chunks(input_df, chunk_size=1024))
+
+        assert chunks[0] == BINARY_COPY_HEADER
+        assert chunks[-1] == BINARY_COPY_TRAILER
+        assert b"".join(chunks) == encoder.encode(input_df)
+        assert all(len(chunk) <= 1024 for chunk in chunks)
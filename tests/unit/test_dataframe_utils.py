@@ -1,7 +1,12 @@
+import datetime
+import decimal
 import unittest
 import pytest
+import numpy as np
 import pandas as pd
-from src.pg_bulk_loader.utils.common_utils import partition_df, get_ranges
+from src.pg_bulk_loader.utils.common_utils import (
+    partition_df, get_ranges, get_ranges_by_size, estimate_row_sizes, round_robin
+)
 
 
 class TestDataFrameUtils(unittest.TestCase):
@@ -126,3 +131,50 @@ class TestDataFrameUtils(unittest.TestCase):
         batch_size = 9
         ranges = get_ranges(data_size, batch_size)
         assert ranges == [(0, 9), (9, 18), (18, 27), (27, 36), (36, 45), (45, 54), (54, 59)]
+
+    def test_estimate_row_sizes(self):
+        input_df = pd.DataFrame({
+            'test_id': [1, 12345, -10],
+            'test_name': ["aditya", None, "a" * 100],
+            'value': [1.5, 2.5, None],
+        })
+        row_sizes = estimate_row_sizes(input_df)
+        assert row_sizes.tolist() == [3 + 2 + 8 + 18, 3 + 6 + 10 + 18, 3 + 3 + 102 + 18]
+
+    def test_estimate_row_sizes_of_object_columns(self):
+        # Object columns of dates and decimals as read by read_sql, and dicts of json columns
+        input_df = pd.DataFrame({
+            'test_date': [datetime.date(2024, 1, 31), None],
+            'test_amount': [decimal.Decimal("12.50"), decimal.Decimal("-1")],
+            'test_json': [{"a": 1}, None],
+        })
+        row_sizes = estimate_row_sizes(input_df)
+        assert row_sizes.tolist() == [3 + 12 + 7 + 10, 3 + 10 + 4 + 10]
+
+    def test_estimate_row_sizes_when_df_is_empty(self):
+        input_df = pd.DataFrame({'test_id': []})
+        assert estimate_row_sizes(input_df).tolist() == []
+
+    def test_get_ranges_by_size(self):
+        row_sizes = np.array([10, 10, 10, 50, 10, 10, 10])
+        ranges = get_ranges_by_size(row_sizes, max_batch_bytes=30)
+        assert ranges == [(0, 3), (3, 4), (4, 7)]
+
+    def test_get_ranges_by_size_with_max_batch_rows(self):
+        row_sizes = np.array([10, 10, 10, 50, 10, 10, 10])
+        ranges = get_ranges_by_size(row_sizes, max_batch_bytes=30, max_batch_rows=2)
+        assert ranges == [(0, 2), (2, 3), (3, 4), (4, 6), (6, 7)]
+
+    def test_get_ranges_by_size_when_max_batch_bytes_is_invalid(self):
+        row_sizes = np.array([10, 10])
+        assert get_ranges_by_size(row_sizes, max_batch_bytes=0) == []
+        assert get_ranges_by_size(row_sizes, max_batch_bytes=None) == []
+
+    def test_get_ranges_by_size_when_data_size_is_zero(self):
+        assert get_ranges_by_size(np.array([]), max_batch_bytes=100) == []
+
+    def test_round_robin(self):
+        assert list(round_robin([[(0, 2), (2, 4), (4, 5)], iter([(5, 7)]), [], [(7, 9), (9, 10)]])) == [
+            (0, 2), (5, 7), (7, 9), (2, 4), (9, 10), (4, 5)
+        ]
+        assert list(round_robin([])) == []
@@ -0,0 +1,89 @@
+import unittest
+import tracemalloc
+import numpy as np
+import pandas as pd
+from src.pg_bulk_loader.batch.dry_run import (
+    infer_pg_types, merge_dry_run_reports, project_wall_time, NullConnectionPool, start_memory_tracing,
+    stop_memory_tracing
+)
+
+
+class TestDryRun(unittest.IsolatedAsyncioTestCase):
+
+    def test_infer_pg_types(self):
+        df = pd.DataFrame({
+            "small": np.array([1], dtype=np.int16),
+            "unsigned_small": np.array([1], dtype=np.uint16),
+            "medium": np.array([1], dtype=np.int32),
+            "big": np.array([1], dtype=np.int64),
+            "nullable": pd.array([1], dtype="Int32"),
+            "real": np.array([1.0], dtype=np.float32),
+            "double": np.array([1.0]),
+            "flag": [True],
+            "created_at": pd.to_datetime(["2024-01-01"]),
+            "updated_at": pd.to_datetime(["2024-01-01"]).tz_localize("UTC"),
+            "name": ["aditya"],
+        })
+        assert infer_pg_types(df) == [
+            "int2", "int4", "int4", "int8", "int4", "float4", "float8", "bool", "timestamp", "timestamptz", None
+        ]
+
+    async def test_null_connection_pool(self):
+        pool = NullConnectionPool({"test_id": "int4"})
+        async with pool.connection(timeout=60) as pg_session:
+            async with pg_session.cursor() as acur:
+                await acur.execute("select 1")
+                assert await acur.fetchall() == [("test_id", "int4")]
+                async with acur.copy("COPY test FROM STDIN") as copy:
+                    await copy.write(b"1\n")
+
+    def test_merge_dry_run_reports(self):
+        reports = [
+            {"batches": 2, "rows": 100, "bytes": 1000, "concurrency": 2, "encode_time": 0.5, "peak_memory_bytes": 10,
+             "projected_wall_time": 0.25},
+            {"batches": 1, "rows": 50, "bytes": 500, "concurrency": 2, "encode_time": 0.25, "peak_memory_bytes": 20,
+             "projected_wall_time": 0.25},
+        ]
+        report = merge_dry_run_reports(reports, wall_time=2)
+        assert report["batches"] == 3
+        assert report["rows"] == 150
+        assert report["encode_time"] == 0.75
+        assert report["rows_per_second"] == 75
+        assert report["bytes_per_second"] == 750
+        assert report["peak_memory_bytes"] == 20
+        assert report["wall_time"] == 2
+        assert report["projected_wall_time"] == 0.5
+
+    def test_project_wall_time(self):
+        # The long first batch keeps one connection busy while the other one loads the next batches
+        assert project_wall_time([3, 1, 1, 1], concurrency=2) == 3
+        assert project_wall_time([1, 1, 1, 1], concurrency=2) == 2
+        assert project_wall_time([1, 1, 1, 1], concurrency=1) == 4
+        assert project_wall_time([], concurrency=2) == 0
+
+    def test_memory_tracing(self):
+        # The memory allocated before the tracing doesn't count
+        data = np.ones(4 * 10 ** 6)
+        del data
+
+        state = start_memory_tracing()
+        data = np.ones(10 ** 6)
+        del data
+        peak_memory = stop_memory_tracing(state)
+        assert 8 * 10 ** 6 <= peak_memory < 16 * 10 ** 6
+        assert not tracemalloc.is_tracing()
+
+    def test_memory_tracing_when_the_caller_traces_the_memory(self):
+        tracemalloc.start()
+        try:
+            data = np.ones(4 * 10 ** 6)
+            del data
+
+            state = start_memory_tracing()
+            data = np.ones(10 ** 6)
+            del data
+            peak_memory = stop_memory_tracing(state)
+            assert 8 * 10 ** 6 <= peak_memory < 16 * 10 ** 6
+            assert tracemalloc.is_tracing()
+        finally:
+            tracemalloc.stop()
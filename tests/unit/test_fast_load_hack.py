@@ -0,0 +1,212 @@
+import unittest
+import pytest
+import testing.postgresql
+from src.pg_bulk_loader.batch.pg_connection_detail import PgConnectionDetail
+from src.pg_bulk_loader.batch.fast_load_hack import FastLoadHack, get_index_costs
+
+
+class TestFastLoadHack(unittest.TestCase):
+
+    postgres_ = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.postgres_ = testing.postgresql.Postgresql()
+        params = cls.postgres_.dsn()
+        params['password'] = ""
+        params['schema'] = "public"
+        params['database'] = "postgres"
+        cls.pg_connection = PgConnectionDetail(**params)
+        pg_session = cls.pg_connection.get_psycopg_connection()
+        try:
+            pg_session.execute("CREATE TABLE public.stats_test (id int4 PRIMARY KEY, name varchar)")
+            pg_session.execute("CREATE INDEX stats_test_name_index ON public.stats_test (name)")
+            pg_session.execute("INSERT INTO public.stats_test SELECT i, md5(i::text) FROM generate_series(1, 10000) i")
+            pg_session.execute("ANALYZE public.stats_test")
+            pg_session.commit()
+        finally:
+            pg_session.close()
+        cls.fast_load_hack = FastLoadHack(pg_conn_details=cls.pg_connection, table_name="stats_test")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.postgres_.stop()
+
+    def test_index_costs(self):
+        # Cached index: 3 per inserted row against a sort of every row
+        assert get_index_costs(1000, 100, index_size=10, cache_size=100) == (300, 1100)
+        # Index larger than the cache: random I/O per inserted row
+        assert get_index_costs(1000, 100, index_size=1000, cache_size=100) == (700, 1100)
+
+    def test_get_table_stats(self):
+        table_stats = self.fast_load_hack.get_table_stats()
+        assert table_stats["rows"] == 10000
+        assert table_stats["pages"] > 0
+        assert table_stats["cache_size"] > 0
+
+        with pytest.raises(Exception) as e:
+            FastLoadHack(pg_conn_details=self.pg_connection, table_name="missing_table").get_table_stats()
+        assert str(e.value) == "Table public.missing_table not found!"
+
+    def test_get_indexes_to_rebuild(self):
+        indexes = self.fast_load_hack.get_indexes()
+        index_sizes = self.fast_load_hack.get_index_sizes()
+        assert list(indexes) == ["public.stats_test_name_index"]
+
+        assert self.fast_load_hack.get_indexes_to_rebuild(indexes, index_sizes, incoming_rows=100) == {}
+        assert self.fast_load_hack.get_indexes_to_rebuild(indexes, index_sizes, incoming_rows=100000) == indexes
+        # Unknown number of incoming rows into a populated table
+        assert self.fast_load_hack.get_indexes_to_rebuild(indexes, index_sizes) == {}
+
+    def test_set_table_unlogged_and_logged(self):
+        assert self.fast_load_hack.get_unlogged_blockers() == []
+        assert self.fast_load_hack.is_table_logged()
+
+        self.fast_load_hack.set_table_unlogged()
+        assert not self.fast_load_hack.is_table_logged()
+        self.fast_load_hack.set_table_logged()
+        assert self.fast_load_hack.is_table_logged()
+
+    def test_unlogged_blockers(self):
+        pg_session = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_session.execute("CREATE PUBLICATION stats_test_publication FOR TABLE public.stats_test")
+            pg_session.execute("CREATE TABLE public.stats_test_child (id int4 REFERENCES public.stats_test (id))")
+            pg_session.commit()
+
+            assert self.fast_load_hack.get_unlogged_blockers() == [
+                "the table is published by ['stats_test_publication']",
+                "the table is referenced by the foreign keys ['stats_test_child.stats_test_child_id_fkey']"
+            ]
+        finally:
+            pg_session.rollback()
+            pg_session.execute("DROP PUBLICATION IF EXISTS stats_test_publication")
+            pg_session.execute("DROP TABLE IF EXISTS public.stats_test_child")
+            pg_session.commit()
+            pg_session.close()
+
+    def test_create_indexes_of_a_partitioned_table(self):
+        pg_session = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_session.execute("""
+                CREATE TABLE public.partitioned_test (id int4, name varchar) PARTITION BY LIST (id);
+                CREATE TABLE public.partitioned_test_1 PARTITION OF public.partitioned_test FOR VALUES IN (1);
+                CREATE TABLE public.partitioned_test_2 PARTITION OF public.partitioned_test FOR VALUES IN (2);
+                CREATE INDEX partitioned_name_index ON public.partitioned_test (name);
+                INSERT INTO public.partitioned_test SELECT 1 + i % 2, md5(i::text) FROM generate_series(1, 1000) i;
+            """)
+            pg_session.commit()
+
+            fast_load_hack = FastLoadHack(pg_conn_details=self.pg_connection, table_name="partitioned_test")
+            indexes = fast_load_hack.get_indexes()
+            assert list(indexes.values()) == [
+                'CREATE INDEX partitioned_name_index ON ONLY public.partitioned_test USING btree (name)'
+            ]
+            fast_load_hack.drop_indexes(list(indexes))
+
+            index_builds = fast_load_hack.create_indexes(indexes, use_multi_process=True)
+            # One build per partition, attached to the index of the table
+            assert sorted(build["index"] for build in index_builds) == [
+                '"public"."partitioned_test_1_partitioned_name_index"',
+                '"public"."partitioned_test_2_partitioned_name_index"'
+            ]
+            query = """
+                select c.relname, i.indisvalid, (select count(1) from pg_inherits where inhparent = c.oid)
+                from pg_index i join pg_class c on c.oid = i.indexrelid
+                where i.indrelid = 'public.partitioned_test'::regclass
+            """
+            assert pg_session.execute(query).fetchall() == [("partitioned_name_index", True, 2)]
+        finally:
+            pg_session.rollback()
+            pg_session.execute("DROP TABLE IF EXISTS public.partitioned_test")
+            pg_session.commit()
+            pg_session.close()
+
+
+class TestFastLoadHackConstraintsAndTriggers(unittest.TestCase):
+
+    postgres_ = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.postgres_ = testing.postgresql.Postgresql()
+        params = cls.postgres_.dsn()
+        params['password'] = ""
+        params['schema'] = "public"
+        params['database'] = "postgres"
+        cls.pg_connection = PgConnectionDetail(**params)
+        cls.fast_load_hack = FastLoadHack(pg_conn_details=cls.pg_connection, table_name="orders")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.postgres_.stop()
+
+    def setUp(self):
+        self.execute("""
+            DROP TABLE IF EXISTS public.shipments, public.orders, public.customers;
+            CREATE TABLE public.customers (id int4 PRIMARY KEY);
+            INSERT INTO public.customers VALUES (1), (2);
+            CREATE TABLE public.orders (
+                id int4 PRIMARY KEY,
+                customer_id int4 CONSTRAINT orders_customer_fk REFERENCES public.customers (id),
+                reference varchar CONSTRAINT orders_reference_key UNIQUE,
+                code varchar CONSTRAINT orders_code_key UNIQUE
+            );
+            -- orders_code_key is referenced and can't be dropped
+            CREATE TABLE public.shipments (code varchar REFERENCES public.orders (code));
+            CREATE FUNCTION public.reject_orders() RETURNS trigger AS $$
+                BEGIN RAISE EXCEPTION 'trigger fired'; END;
+            $$ LANGUAGE plpgsql;
+            CREATE TRIGGER orders_reject BEFORE INSERT ON public.orders
+                FOR EACH ROW EXECUTE FUNCTION public.reject_orders();
+        """)
+
+    def tearDown(self):
+        self.execute("DROP TABLE public.shipments, public.orders, public.customers; DROP FUNCTION public.reject_orders")
+
+    def execute(self, query: str):
+        pg_session = self.pg_connection.get_psycopg_connection()
+        try:
+            result = pg_session.execute(query)
+            rows = result.fetchall() if result.description else None
+            pg_session.commit()
+            return rows
+        finally:
+            pg_session.close()
+
+    def get_constraints(self):
+        return self.execute(
+            "select conname, convalidated from pg_constraint where conrelid = 'public.orders'::regclass order by 1"
+        )
+
+    def test_disable_and_restore_constraints_and_triggers(self):
+        state = self.fast_load_hack.disable_constraints_and_triggers()
+        assert list(state["foreign_keys"]) == ["orders_customer_fk"]
+        assert list(state["unique_constraints"]) == ["orders_reference_key"]
+        assert state["triggers"] == {"orders_reject": "O"}
+        assert self.get_constraints() == [("orders_code_key", True), ("orders_pkey", True)]
+
+        # Neither the trigger nor the constraints are checked during the load
+        self.execute("INSERT INTO public.orders VALUES (1, 1, 'a', 'x'), (2, 2, 'b', 'y')")
+
+        self.fast_load_hack.restore_constraints_and_triggers(state)
+        assert self.get_constraints() == [
+            ("orders_code_key", True), ("orders_customer_fk", True), ("orders_pkey", True),
+            ("orders_reference_key", True)
+        ]
+        assert self.fast_load_hack.get_constraints_and_triggers()["triggers"] == {"orders_reject": "O"}
+
+    def test_restore_reports_the_constraints_violated_by_the_load(self):
+        state = self.fast_load_hack.disable_constraints_and_triggers()
+        self.execute("INSERT INTO public.orders VALUES (1, 3, 'a', 'x')")
+
+        with pytest.raises(Exception) as e:
+            self.fast_load_hack.restore_constraints_and_triggers(state)
+        assert str(e.value) == "Failed to restore the constraints and triggers ['orders_customer_fk']!"
+
+        # The foreign key is back as NOT VALID, enforced for new rows only, the rest is restored
+        assert self.get_constraints() == [
+            ("orders_code_key", True), ("orders_customer_fk", False), ("orders_pkey", True),
+            ("orders_reference_key", True)
+        ]
+        assert self.fast_load_hack.get_constraints_and_triggers()["triggers"] == {"orders_reject": "O"}
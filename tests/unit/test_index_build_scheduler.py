@@ -0,0 +1,122 @@
+import unittest
+import pytest
+import testing.postgresql
+from src.pg_bulk_loader.batch.pg_connection_detail import PgConnectionDetail
+from src.pg_bulk_loader.batch.fast_load_hack import FastLoadHack
+from src.pg_bulk_loader.batch.index_build_scheduler import IndexBuildScheduler
+
+
+def fetch_all(pg_connection: PgConnectionDetail, query: str):
+    pg_session = pg_connection.get_psycopg_connection()
+    try:
+        return pg_session.execute(query).fetchall()
+    finally:
+        pg_session.close()
+
+
+class TestIndexBuildScheduler(unittest.TestCase):
+
+    postgres_ = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.postgres_ = testing.postgresql.Postgresql()
+        params = cls.postgres_.dsn()
+        params['password'] = ""
+        params['schema'] = "public"
+        params['database'] = "postgres"
+        cls.pg_connection = PgConnectionDetail(**params)
+        pg_session = cls.pg_connection.get_psycopg_connection()
+        try:
+            pg_session.execute("CREATE TABLE public.index_test (id int4 PRIMARY KEY, name varchar, value float8)")
+            pg_session.execute(
+                "INSERT INTO public.index_test SELECT i, md5(i::text), random() FROM generate_series(1, 20000) i"
+            )
+            pg_session.execute("CREATE TABLE public.build_log (name varchar, maintenance_work_mem varchar)")
+            pg_session.commit()
+        finally:
+            pg_session.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.postgres_.stop()
+
+    def setUp(self):
+        pg_session = self.pg_connection.get_psycopg_connection()
+        try:
+            pg_session.execute("TRUNCATE public.build_log")
+            pg_session.commit()
+        finally:
+            pg_session.close()
+
+    @staticmethod
+    def log_query(name: str):
+        # Stands in for a CREATE INDEX, recording the order and the settings of the builds
+        return f"INSERT INTO public.build_log VALUES ('{name}', current_setting('maintenance_work_mem'))"
+
+    def test_invalid_scheduler_options(self):
+        with pytest.raises(Exception) as e:
+            IndexBuildScheduler(self.pg_connection, max_parallel_builds=0)
+        assert str(e.value) == "Max parallel builds must be a positive integer!"
+
+        with pytest.raises(Exception) as e:
+            IndexBuildScheduler(self.pg_connection, maintenance_work_mem_budget=-1)
+        assert str(e.value) == "Maintenance work mem budget must be a positive integer!"
+
+    def test_maintenance_work_mem_share(self):
+        scheduler = IndexBuildScheduler(self.pg_connection, maintenance_work_mem_budget=1024 ** 3)
+        assert scheduler.get_maintenance_work_mem(1) == "1048576kB"
+        assert scheduler.get_maintenance_work_mem(4) == "262144kB"
+        # Never below the minimum of postgres
+        assert IndexBuildScheduler(self.pg_connection, maintenance_work_mem_budget=1024).get_maintenance_work_mem(
+            2
+        ) == "1024kB"
+        assert IndexBuildScheduler(self.pg_connection).get_maintenance_work_mem(2) is None
+
+    def test_largest_indexes_are_built_first(self):
+        scheduler = IndexBuildScheduler(self.pg_connection, max_parallel_builds=1)
+        indexes = {name: self.log_query(name) for name in ("small", "unknown", "large", "medium")}
+        builds = scheduler.run(indexes, {"small": 10, "large": 1000, "medium": 100})
+
+        assert [build["index"] for build in builds] == ["large", "medium", "small", "unknown"]
+        assert [build["size"] for build in builds] == [1000, 100, 10, None]
+        assert all(build["error"] is None and build["duration"] >= 0 for build in builds)
+        assert fetch_all(self.pg_connection, "select name from public.build_log") == [
+            ("large",), ("medium",), ("small",), ("unknown",)
+        ]
+
+    def test_maintenance_work_mem_budget_is_shared(self):
+        scheduler = IndexBuildScheduler(
+            self.pg_connection, max_parallel_builds=2, maintenance_work_mem_budget=64 * 1024 ** 2
+        )
+        indexes = {f"index_{i}": self.log_query(f"index_{i}") for i in range(3)}
+        builds = scheduler.run(indexes)
+
+        assert [build["maintenance_work_mem"] for build in builds] == ["32768kB"] * 3
+        settings = fetch_all(self.pg_connection, "select distinct maintenance_work_mem from public.build_log")
+        assert settings == [("32MB",)]
+
+        # A single build gets the whole budget
+        builds = scheduler.run({"index_3": self.log_query("index_3")})
+        assert builds[0]["maintenance_work_mem"] == "65536kB"
+
+    def test_failed_builds_are_reported(self):
+        fast_load_hack = FastLoadHack(pg_conn_details=self.pg_connection, table_name="index_test")
+        indexes = {
+            "public.index_test_name_index": "CREATE INDEX index_test_name_index ON public.index_test (name)",
+            "public.invalid_index": "CREATE INDEX invalid_index ON public.index_test (missing_column)",
+        }
+        with pytest.raises(Exception) as e:
+            fast_load_hack.create_indexes(indexes, use_multi_process=True)
+        assert str(e.value) == "Failed to create the indexes ['public.invalid_index']!"
+
+        builds = {build["index"]: build for build in fast_load_hack.index_builds}
+        assert builds["public.index_test_name_index"]["error"] is None
+        assert "missing_column" in builds["public.invalid_index"]["error"]
+        # The failure didn't prevent the other index from being created
+        assert "public.index_test_name_index" in fast_load_hack.get_indexes()
+
+        index_sizes = fast_load_hack.get_index_sizes()
+        assert index_sizes["public.index_test_name_index"] > 0
+        assert index_sizes["public.index_test_pkey"] > 0
+        fast_load_hack.drop_indexes(["public.index_test_name_index"])
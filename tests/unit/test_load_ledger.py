@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+import pytest
+import pandas as pd
+from src.pg_bulk_loader.batch.load_ledger import FileLoadLedger, LoadLedger, get_row_hashes, get_fingerprint
+
+
+class TestLoadLedger(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "ledger.jsonl")
+
+    def test_ledger_when_load_id_is_empty(self):
+        with pytest.raises(Exception) as e:
+            LoadLedger(load_id="")
+        assert str(e.value) == "Load id cannot be empty!"
+
+    def test_fingerprint_depends_on_the_content(self):
+        df = pd.DataFrame({"id": [1, 2, 3, 4], "name": ["a", "b", "c", "d"]})
+        row_hashes = get_row_hashes(df)
+        assert len(row_hashes) == 4
+        assert get_fingerprint(row_hashes[0:2]) == get_fingerprint(get_row_hashes(df[0:2]))
+        assert get_fingerprint(row_hashes[0:2]) != get_fingerprint(row_hashes[2:4])
+
+        changed_df = df.copy()
+        changed_df.loc[1, "name"] = "x"
+        assert get_fingerprint(row_hashes[0:2]) != get_fingerprint(get_row_hashes(changed_df)[0:2])
+
+    async def test_file_ledger_resume(self):
+        ledger = FileLoadLedger(load_id="load-1", path=self.path)
+        await ledger.prepare(None)
+        entry = ledger.get_entry("public.test", (0, 10), "abc")
+        await ledger.record_committed(entry)
+        await FileLoadLedger(load_id="load-2", path=self.path).record_committed(entry | {"load_id": "load-2"})
+        assert not ledger.is_completed(entry)
+
+        resumed_ledger = FileLoadLedger(load_id="load-1", path=self.path, resume=True)
+        await resumed_ledger.prepare(None)
+        assert resumed_ledger.is_completed(entry)
+        assert not resumed_ledger.is_completed(resumed_ledger.get_entry("public.test", (10, 20), "abc"))
+        assert not resumed_ledger.is_completed(resumed_ledger.get_entry("public.test", (0, 10), "def"))
+
+        new_entry = resumed_ledger.get_entry("public.test", (10, 20), "abc")
+        await resumed_ledger.record_committed(new_entry)
+        assert resumed_ledger.is_completed(new_entry)
+
+    async def test_file_ledger_skips_corrupted_lines(self):
+        ledger = FileLoadLedger(load_id="load-1", path=self.path, resume=True)
+        await ledger.record_committed(ledger.get_entry("public.test", (0, 10), "abc"))
+        with open(self.path, "a") as ledger_file:
+            ledger_file.write('{"load_id": "load-1", "tab')
+
+        entries = await ledger.read_entries(None)
+        assert [(entry["range_start"], entry["range_end"]) for entry in entries] == [(0, 10)]
@@ -0,0 +1,73 @@
+import unittest
+from src.pg_bulk_loader.batch.load_metrics import LoadMetrics, BatchMetrics, FAILED
+
+
+def create_batch_metrics(range_start, range_end, copy_time, pool_wait_time=0.0, encode_wait_time=0.0):
+    batch_metrics = BatchMetrics("public.test", range_start, range_end)
+    batch_metrics.bytes = (range_end - range_start) * 10
+    batch_metrics.copy_time = copy_time
+    batch_metrics.pool_wait_time = pool_wait_time
+    batch_metrics.encode_wait_time = encode_wait_time
+    batch_metrics.total_time = copy_time + pool_wait_time + encode_wait_time
+    batch_metrics.started_at = 100.0
+    batch_metrics.finished_at = 102.0
+    return batch_metrics
+
+
+class TestLoadMetrics(unittest.TestCase):
+
+    def test_summary_when_no_batch_is_recorded(self):
+        assert LoadMetrics().summary() == {"batches": 0, "failed_batches": 0, "rows": 0, "bytes": 0, "retries": 0}
+
+    def test_summary(self):
+        metrics = LoadMetrics()
+        for index in range(10):
+            metrics.record(create_batch_metrics(index * 100, (index + 1) * 100, copy_time=index + 1))
+        failed_batch = create_batch_metrics(1000, 1100, copy_time=0.5)
+        failed_batch.status, failed_batch.retries = FAILED, 2
+        metrics.record(failed_batch)
+
+        summary = metrics.summary()
+        assert summary["batches"] == 10
+        assert summary["failed_batches"] == 1
+        assert summary["rows"] == 1000
+        assert summary["bytes"] == 10000
+        assert summary["retries"] == 2
+        assert summary["wall_time"] == 2.0
+        assert summary["rows_per_second"] == 500
+        assert summary["copy_time"]["total"] == 55.5
+        assert summary["copy_time"]["max"] == 10
+        assert summary["copy_time"]["p50"] == 5
+        assert summary["bottleneck"] == "copy"
+
+    def test_summary_tells_the_bottleneck(self):
+        metrics = LoadMetrics()
+        metrics.record(create_batch_metrics(0, 100, copy_time=1, pool_wait_time=3))
+        assert metrics.summary()["bottleneck"] == "pool"
+
+        metrics.record(create_batch_metrics(100, 200, copy_time=1, encode_wait_time=5))
+        assert metrics.summary()["bottleneck"] == "encode"
+
+    def test_callbacks(self):
+        recorded = []
+
+        def failing_callback(batch_metrics):
+            raise ValueError("monitoring is down")
+
+        metrics = LoadMetrics(callbacks=[failing_callback, recorded.append])
+        batch_metrics = create_batch_metrics(0, 100, copy_time=1)
+        metrics.record(batch_metrics)
+        assert recorded == [batch_metrics]
+        assert batch_metrics.to_dict()["rows"] == 100
+
+    def test_extend(self):
+        process_metrics = LoadMetrics()
+        process_metrics.record(create_batch_metrics(0, 100, copy_time=1))
+        process_metrics.record(create_batch_metrics(100, 200, copy_time=1))
+
+        recorded = []
+        metrics = LoadMetrics()
+        metrics.add_callback(recorded.append)
+        metrics.extend(process_metrics)
+        assert len(recorded) == 2
+        assert metrics.summary()["rows"] == 200
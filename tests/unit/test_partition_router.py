@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.pg_bulk_loader.batch.partition_router import PartitionRouter, parse_bound_literals
+
+
+class TestPartitionRouter(unittest.TestCase):
+
+    def test_parse_bound_literals(self):
+        assert parse_bound_literals("(MINVALUE)") == ["MINVALUE"]
+        assert parse_bound_literals("'a', 'it''s', '', NULL, -5, 1.5") == ["a", "it's", "", None, "-5", "1.5"]
+
+    def test_route_by_integer_range(self):
+        router = PartitionRouter("public.events", "id", "r", [
+            ("public.events_high", "FOR VALUES FROM (100) TO (MAXVALUE)"),
+            ("public.events_low", "FOR VALUES FROM (MINVALUE) TO (10)"),
+            ("public.events_mid", "FOR VALUES FROM (10) TO (50)"),
+            ("public.events_default", "DEFAULT"),
+        ])
+        data_df = pd.DataFrame({"ID": pd.array([5, 150, 10, 60, None, 49, 100], dtype="Int64"), "seq": range(7)})
+        data_df, groups = router.route(data_df)
+
+        # The rows without partition, 60 is in the default partition, are loaded through the table
+        assert groups == [
+            (0, 2, "public.events"), (2, 4, "public.events_high"), (4, 5, "public.events_low"),
+            (5, 7, "public.events_mid")
+        ]
+        assert list(data_df["seq"]) == [3, 4, 1, 6, 0, 2, 5]
+
+    def test_route_by_timestamp_range(self):
+        router = PartitionRouter("public.events", "created_at", "r", [
+            ("public.events_2024_01", "FOR VALUES FROM ('2023-12-31 23:00:00+00') TO ('2024-01-31 23:00:00+00')"),
+            ("public.events_2024_02", "FOR VALUES FROM ('2024-01-31 23:00:00+00') TO ('2024-02-29 23:00:00+00')"),
+        ])
+        created_at = pd.to_datetime(["2024-02-01 00:00", "2024-01-01 00:00", "2024-01-31 23:59"])
+        data_df = pd.DataFrame({"created_at": created_at.tz_localize("Europe/Berlin")})
+        data_df, groups = router.route(data_df)
+        # Compared in UTC, 2024-01-31 23:59 in Berlin is 22:59 UTC
+        assert groups == [(0, 2, "public.events_2024_01"), (2, 3, "public.events_2024_02")]
+        assert list(data_df["created_at"].dt.day) == [1, 31, 1]
+
+        # The bounds of a timestamptz key can't be compared with naive timestamps
+        _, groups = router.route(pd.DataFrame({"created_at": created_at}))
+        assert groups == [(0, 3, "public.events")]
+
+    def test_route_by_list(self):
+        router = PartitionRouter("public.events", "region", "l", [
+            ("public.events_eu", "FOR VALUES IN ('eu', 'it''s', NULL)"),
+            ("public.events_us", "FOR VALUES IN ('us')"),
+            ("public.events_default", "DEFAULT"),
+        ])
+        data_df = pd.DataFrame({"region": ["us", "eu", "apac", None, "it's", "us"]})
+        data_df, groups = router.route(data_df)
+        assert groups == [(0, 1, "public.events"), (1, 4, "public.events_eu"), (4, 6, "public.events_us")]
+        assert list(data_df["region"].fillna("null")) == ["apac", "eu", "null", "it's", "us", "us"]
+
+    def test_route_without_routable_key(self):
+        router = PartitionRouter("public.events", "name", "r", [
+            ("public.events_a", "FOR VALUES FROM ('a') TO ('b')"),
+        ])
+        data_df = pd.DataFrame({"name": ["a", "b"]})
+        # Text ranges depend on the collation of the key
+        routed_df, groups = router.route(data_df)
+        assert groups == [(0, 2, "public.events")]
+        assert routed_df is data_df
+
+        # No key column in the data
+        _, groups = router.route(pd.DataFrame({"id": np.arange(3)}))
+        assert groups == [(0, 3, "public.events")]
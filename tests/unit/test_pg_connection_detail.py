@@ -0,0 +1,83 @@
+import unittest
+import pytest
+import testing.postgresql
+from src.pg_bulk_loader.batch.pg_connection_detail import PgConnectionDetail
+from src.pg_bulk_loader.batch.fast_load_hack import FastLoadHack
+from src.pg_bulk_loader.utils.constants import LOAD_SESSION_SETTINGS, INDEX_SESSION_SETTINGS
+
+
+class TestPgConnectionDetail(unittest.IsolatedAsyncioTestCase):
+
+    postgres_ = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.postgres_ = testing.postgresql.Postgresql()
+        cls.params = cls.postgres_.dsn()
+        cls.params['password'] = ""
+        cls.params['schema'] = "public"
+        cls.params['database'] = "postgres"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.postgres_.stop()
+
+    def test_invalid_session_settings(self):
+        with pytest.raises(Exception) as e:
+            PgConnectionDetail(**self.params, session_settings=["synchronous_commit=off"])
+        assert str(e.value) == "Session settings must be a dict of setting names and values!"
+
+        with pytest.raises(Exception) as e:
+            PgConnectionDetail(**self.params, index_session_settings={1: "on"})
+        assert str(e.value) == "Session settings must be a dict of setting names and values!"
+
+    async def test_pool_connections_get_session_settings(self):
+        pg_connection = PgConnectionDetail(**self.params, session_settings=LOAD_SESSION_SETTINGS)
+        pool = pg_connection.create_connection_pool(min_size=2, max_size=2)
+        await pool.open(wait=True)
+        try:
+            for _ in range(3):
+                async with pool.connection() as pg_session:
+                    cursor = await pg_session.execute(
+                        "select current_setting('synchronous_commit'), current_setting('work_mem'), "
+                        "current_setting('application_name')"
+                    )
+                    assert await cursor.fetchone() == ("off", "64MB", "pg_bulk_loader")
+        finally:
+            await pool.close()
+
+    async def test_pool_session_settings_override(self):
+        pg_connection = PgConnectionDetail(**self.params, session_settings=LOAD_SESSION_SETTINGS)
+        pool = pg_connection.create_connection_pool(min_size=1, max_size=1, session_settings={"work_mem": 8192})
+        await pool.open(wait=True)
+        try:
+            async with pool.connection() as pg_session:
+                cursor = await pg_session.execute(
+                    "select current_setting('work_mem'), current_setting('synchronous_commit')"
+                )
+                assert await cursor.fetchone() == ("8MB", "on")
+        finally:
+            await pool.close()
+
+    def test_index_sessions_get_index_session_settings(self):
+        pg_connection = PgConnectionDetail(**self.params, index_session_settings=INDEX_SESSION_SETTINGS)
+        pg_session = pg_connection.get_psycopg_connection(pg_connection.index_session_settings)
+        try:
+            result = pg_session.execute(
+                "select current_setting('maintenance_work_mem'), current_setting('max_parallel_maintenance_workers')"
+            ).fetchone()
+            assert result == ("1GB", "4")
+        finally:
+            pg_session.close()
+
+        # The index builds of FastLoadHack run with them
+        fast_load_hack = FastLoadHack(pg_conn_details=pg_connection, table_name="session_settings_test")
+        fast_load_hack.create_index(
+            "CREATE TABLE public.session_settings_test AS SELECT current_setting('maintenance_work_mem') AS value"
+        )
+        pg_session = pg_connection.get_psycopg_connection()
+        try:
+            assert pg_session.execute("select value from public.session_settings_test").fetchone() == ("1GB",)
+            assert pg_session.execute("select current_setting('maintenance_work_mem')").fetchone() != ("1GB",)
+        finally:
+            pg_session.close()
@@ -0,0 +1,174 @@
+import unittest
+import pytest
+import psycopg
+import testing.postgresql
+from src.pg_bulk_loader.batch.pg_connection_detail import PgConnectionDetail
+from src.pg_bulk_loader.batch.shadow_table import ShadowTable
+
+
+class TestShadowTable(unittest.TestCase):
+
+    postgres_ = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.postgres_ = testing.postgresql.Postgresql()
+        params = cls.postgres_.dsn()
+        params['password'] = ""
+        params['schema'] = "public"
+        params['database'] = "postgres"
+        cls.pg_connection = PgConnectionDetail(**params)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.postgres_.stop()
+
+    def setUp(self):
+        self.execute(
+            "DROP TABLE IF EXISTS public.swap_test CASCADE",
+            "DROP TABLE IF EXISTS public.swap_test_parent CASCADE",
+            "CREATE TABLE public.swap_test_parent (code varchar PRIMARY KEY)",
+            "INSERT INTO public.swap_test_parent VALUES ('a'), ('b')",
+            """CREATE TABLE public.swap_test (
+                id serial PRIMARY KEY,
+                seq int8 GENERATED BY DEFAULT AS IDENTITY,
+                code varchar NOT NULL REFERENCES public.swap_test_parent (code),
+                parent_id int4 REFERENCES public.swap_test (id),
+                "Name" varchar CHECK ("Name" != ''),
+                CONSTRAINT swap_test_seq_unique UNIQUE (seq) DEFERRABLE INITIALLY DEFERRED
+            )""",
+            'CREATE INDEX swap_test_name_index ON public.swap_test ("Name")',
+            "CREATE FUNCTION public.swap_test_upper() RETURNS trigger AS "
+            "$$ BEGIN NEW.\"Name\" = upper(NEW.\"Name\"); RETURN NEW; END $$ LANGUAGE plpgsql",
+            "CREATE TRIGGER swap_test_upper_trigger BEFORE INSERT ON public.swap_test "
+            "FOR EACH ROW EXECUTE FUNCTION public.swap_test_upper()",
+            "CREATE TRIGGER swap_test_disabled_trigger BEFORE INSERT ON public.swap_test "
+            "FOR EACH ROW EXECUTE FUNCTION public.swap_test_upper()",
+            "ALTER TABLE public.swap_test DISABLE TRIGGER swap_test_disabled_trigger",
+            "DROP ROLE IF EXISTS swap_test_reader",
+            "CREATE ROLE swap_test_reader",
+            "GRANT SELECT ON public.swap_test TO swap_test_reader",
+            "INSERT INTO public.swap_test (code, \"Name\") SELECT 'a', 'old' FROM generate_series(1, 10)",
+        )
+        self.shadow_table = ShadowTable(pg_conn_details=self.pg_connection, table_name="swap_test")
+
+    def tearDown(self):
+        self.execute(
+            "DROP TABLE IF EXISTS public.swap_test CASCADE",
+            "DROP TABLE IF EXISTS public.swap_test__pg_bulk_loader_shadow CASCADE",
+            "DROP TABLE IF EXISTS public.swap_test_child",
+            "DROP FUNCTION IF EXISTS public.swap_test_upper",
+        )
+
+    def execute(self, *queries):
+        pg_session = self.pg_connection.get_psycopg_connection()
+        try:
+            for query in queries:
+                pg_session.execute(query)
+            pg_session.commit()
+        finally:
+            pg_session.close()
+
+    def fetch_all(self, query):
+        pg_session = self.pg_connection.get_psycopg_connection()
+        try:
+            return pg_session.execute(query).fetchall()
+        finally:
+            pg_session.close()
+
+    def get_definitions(self, table_name):
+        return {
+            "indexes": self.fetch_all(
+                f"select indexrelid::regclass::text, pg_get_indexdef(indexrelid) from pg_index "
+                f"where indrelid = 'public.{table_name}'::regclass order by 1"
+            ),
+            "constraints": self.fetch_all(
+                f"select conname, pg_get_constraintdef(oid) from pg_constraint "
+                f"where conrelid = 'public.{table_name}'::regclass order by 1"
+            ),
+            "triggers": self.fetch_all(
+                f"select tgname, pg_get_triggerdef(oid), tgenabled from pg_trigger "
+                f"where tgrelid = 'public.{table_name}'::regclass and not tgisinternal order by 1"
+            ),
+            "grants": self.fetch_all(
+                f"select grantee, privilege_type from information_schema.role_table_grants "
+                f"where table_name = '{table_name}' order by 1, 2"
+            ),
+        }
+
+    def test_replace_table(self):
+        definitions = self.get_definitions("swap_test")
+        assert self.shadow_table.get_blockers() == []
+
+        self.shadow_table.create()
+        self.execute(
+            "INSERT INTO public.swap_test__pg_bulk_loader_shadow (id, seq, code, \"Name\") "
+            "SELECT i, i, 'b', 'new' FROM generate_series(1, 100) i"
+        )
+        index_builds = self.shadow_table.build(use_multi_process=False)
+        assert sorted(build["size"] > 0 for build in index_builds) == [True, True, True]
+        # The live table is untouched until the swap
+        assert self.fetch_all("select count(*) from public.swap_test") == [(10,)]
+
+        self.shadow_table.swap()
+        assert self.fetch_all("select count(*), min(\"Name\") from public.swap_test") == [(100, "new")]
+        assert self.get_definitions("swap_test") == definitions
+        assert self.fetch_all("select to_regclass('public.swap_test__pg_bulk_loader_shadow')") == [(None,)]
+        # The table is swapped in with the statistics of the loaded rows
+        assert self.fetch_all(
+            "select n_distinct from pg_stats where schemaname = 'public' and tablename = 'swap_test' "
+            "and attname = 'code'"
+        ) == [(1,)]
+
+        # The serial and identity columns continue after the loaded values
+        self.execute("INSERT INTO public.swap_test (code, \"Name\") VALUES ('a', 'next')")
+        assert self.fetch_all("select id > 100, seq > 100, \"Name\" from public.swap_test where code = 'a'") == [
+            (True, True, "NEXT")
+        ]
+        # The foreign keys are enforced
+        with pytest.raises(psycopg.errors.ForeignKeyViolation):
+            self.execute("INSERT INTO public.swap_test (code) VALUES ('c')")
+        with pytest.raises(psycopg.errors.ForeignKeyViolation):
+            self.execute("INSERT INTO public.swap_test (code, parent_id) VALUES ('a', 1000)")
+
+    def test_drop_shadow_table(self):
+        self.shadow_table.create()
+        self.shadow_table.drop()
+        assert self.fetch_all("select to_regclass('public.swap_test__pg_bulk_loader_shadow')") == [(None,)]
+        assert self.fetch_all("select count(*) from public.swap_test") == [(10,)]
+
+    def test_blockers(self):
+        self.execute(
+            "CREATE VIEW public.swap_test_view AS SELECT id FROM public.swap_test",
+            "CREATE TABLE public.swap_test_child (id int4 REFERENCES public.swap_test (id))",
+            "ALTER TABLE public.swap_test ENABLE ROW LEVEL SECURITY",
+        )
+        assert self.shadow_table.get_blockers() == [
+            "the table has row level security",
+            "the table is referenced by the foreign keys ['swap_test_child.swap_test_child_id_fkey']",
+            "the table is used by the views ['swap_test_view']",
+        ]
+
+        with pytest.raises(Exception) as e:
+            ShadowTable(pg_conn_details=self.pg_connection, table_name="missing_table").get_blockers()
+        assert str(e.value) == "Table public.missing_table not found!"
+
+    def test_swap_when_the_table_is_locked(self):
+        shadow_table = ShadowTable(
+            pg_conn_details=self.pg_connection, table_name="swap_test", lock_timeout="100ms", swap_tries=2
+        )
+        shadow_table.create()
+        shadow_table.build(use_multi_process=False)
+
+        pg_session = self.pg_connection.get_psycopg_connection()
+        try:
+            # A long running reader of the table
+            pg_session.execute("select count(*) from public.swap_test")
+            with pytest.raises(psycopg.errors.LockNotAvailable):
+                shadow_table.swap()
+        finally:
+            pg_session.rollback()
+            pg_session.close()
+
+        shadow_table.swap()
+        assert self.fetch_all("select count(*) from public.swap_test") == [(0,)]
@@ -0,0 +1,54 @@
+import pickle
+import unittest
+import numpy as np
+import pandas as pd
+from src.pg_bulk_loader.utils.shared_memory_utils import (
+    to_shared_memory, from_shared_memory, close_shared_memory, release_shared_memory
+)
+
+
+class TestSharedMemoryUtils(unittest.TestCase):
+
+    def test_shared_memory_round_trip(self):
+        input_df = pd.DataFrame({
+            'test_id': [1, 2, 3],
+            'value': [1.5, np.nan, 3.5],
+            'flag': [True, False, True],
+            'nullable_id': pd.array([1, None, 3], dtype="Int64"),
+            'test_name': ["aditya", None, "lalu"],
+            'created_at': pd.to_datetime(["2024-01-01", None, "2024-01-03"]),
+            'updated_at': pd.to_datetime(["2024-01-01", "2024-06-01", None]).tz_localize("Europe/Berlin"),
+        })
+
+        descriptor, shm = to_shared_memory(input_df)
+        try:
+            data_df, attached_shm = from_shared_memory(descriptor)
+            pd.testing.assert_frame_equal(data_df, input_df)
+            del data_df
+            close_shared_memory(attached_shm)
+        finally:
+            release_shared_memory(shm)
+
+    def test_shared_memory_columns_are_zero_copy_views(self):
+        input_df = pd.DataFrame({
+            'test_id': np.arange(1000),
+            'nullable_id': pd.array(np.arange(1000), dtype="Int64"),
+        })
+
+        descriptor, shm = to_shared_memory(input_df)
+        try:
+            data_df, attached_shm = from_shared_memory(descriptor)
+            shared_buffer = np.frombuffer(attached_shm.buf, dtype=np.uint8)
+            assert np.shares_memory(data_df['test_id'].to_numpy(), shared_buffer)
+            assert np.shares_memory(data_df['nullable_id'].array._data, shared_buffer)
+            del data_df, shared_buffer
+            close_shared_memory(attached_shm)
+        finally:
+            release_shared_memory(shm)
+
+    def test_shared_memory_descriptor_is_small(self):
+        input_df = pd.DataFrame({'test_id': np.arange(100000), 'value': np.random.rand(100000)})
+
+        descriptor, shm = to_shared_memory(input_df)
+        release_shared_memory(shm)
+        assert len(pickle.dumps(descriptor)) < 1024